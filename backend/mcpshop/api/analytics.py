@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+from typing import List, Literal
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.db.session import get_db, get_read_db
+from mcpshop.crud.analytics import (
+    SKU_RANKINGS, get_customer_value, get_daily_sales, get_sales_summary, get_top_customers,
+    get_top_skus, rebuild_sales_analytics, today,
+)
+from mcpshop.schemas.analytics import CustomerValueOut, DailySalesOut, SalesSummaryOut, SkuSalesOut
+from mcpshop.api.deps import get_current_admin_user
+
+# 销售统计（只读预聚合的读模型），全部为管理员接口
+router = APIRouter(
+    prefix="/api/admin/analytics",
+    tags=["analytics"],
+    dependencies=[Depends(get_current_admin_user)],
+)
+
+MAX_RANGE_DAYS = 366
+
+
+def _date_range(start: date | None, end: date | None, default_days: int) -> tuple[date, date]:
+    end = end or today()
+    start = start or end - timedelta(days=default_days - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start 不能晚于 end")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"时间范围不能超过 {MAX_RANGE_DAYS} 天")
+    return start, end
+
+# 汇总：最近 N 天的订单数、件数、金额、每日走势和热销商品
+@router.get("/summary", response_model=SalesSummaryOut)
+async def summary(
+    days: int = Query(7, ge=1, le=MAX_RANGE_DAYS),
+    top: int = Query(5, ge=1, le=50),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await get_sales_summary(db, days, top)
+
+# 每日成交（默认最近 30 天，无成交的日子补 0）
+@router.get("/daily", response_model=List[DailySalesOut])
+async def daily(
+    start: date | None = Query(None),
+    end: date | None = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await get_daily_sales(db, *_date_range(start, end, 30))
+
+# 热销商品（默认最近 7 天，按金额或件数排序）
+@router.get("/top-skus", response_model=List[SkuSalesOut])
+async def top_skus(
+    start: date | None = Query(None),
+    end: date | None = Query(None),
+    by: Literal[SKU_RANKINGS] = Query("revenue"),
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await get_top_skus(db, *_date_range(start, end, 7), limit, by)
+
+# 累计消费最高的用户
+@router.get("/customers", response_model=List[CustomerValueOut])
+async def top_customers(
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    return await get_top_customers(db, limit)
+
+# 单个用户的累计消费
+@router.get("/customers/{user_id}", response_model=CustomerValueOut)
+async def customer(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    value = await get_customer_value(db, user_id)
+    if not value:
+        raise HTTPException(status_code=404, detail="该用户没有成交订单")
+    return value
+
+# 按订单全量重算读模型（首次上线回填 / 修正数据）
+@router.post("/rebuild")
+async def rebuild(db: AsyncSession = Depends(get_db)):
+    return await rebuild_sales_analytics(db)
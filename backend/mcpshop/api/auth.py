@@ -9,11 +9,18 @@ from fastapi.security import OAuth2PasswordRequestForm
 from mcpshop.db.session import get_db
 from mcpshop.crud.user import authenticate_user, create_user, get_user_by_username
 from mcpshop.core.security import create_access_token
+from mcpshop.core.passwords import PasswordHasherBusy, password_hasher
+from mcpshop.api.deps import get_current_admin_user
 from mcpshop.schemas.auth import Token
 from mcpshop.schemas.user import UserCreate, UserOut
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
+
+def _busy(e: PasswordHasherBusy) -> HTTPException:
+    # 密码哈希线程池排队已满：让客户端稍后重试，而不是把请求挂着
+    return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": "1"})
+
 @router.post("/register", response_model=UserOut)
 async def register(
     user_in: UserCreate,
@@ -25,7 +32,10 @@ async def register(
     # 如有邮箱唯一约束，也可并行检查:
     # if await get_user_by_email(db, user_in.email): ...
 
-    return await create_user(db, user_in)
+    try:
+        return await create_user(db, user_in)
+    except PasswordHasherBusy as e:
+        raise _busy(e)
 
 
 @router.post("/token", response_model=Token)
@@ -33,7 +43,10 @@ async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db)
 ):
-    user = await authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except PasswordHasherBusy as e:
+        raise _busy(e)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -41,4 +54,10 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token = create_access_token(subject=user.username)
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+# ★ 管理员查看密码哈希线程池统计（排队等待 / 计算耗时、拒绝次数、重算次数）
+@router.get("/hash-stats", dependencies=[Depends(get_current_admin_user)])
+async def hash_stats():
+    return password_hasher.stats.as_dict()
@@ -1,14 +1,19 @@
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from mcpshop.db.session import get_db
-from mcpshop.crud.cart import add_to_cart, remove_cart_item, get_cart_items, clear_cart
-from mcpshop.schemas.cart import CartItemCreate, CartItemOut
+from mcpshop.crud.cart import add_to_cart, remove_cart_item, get_cart_items, clear_cart, update_cart
+from mcpshop.schemas.cart import CartBatchUpdate, CartItemCreate, CartItemOut
 from mcpshop.api.deps import get_current_user
+from mcpshop.core.serialization import dump_response
 
 router = APIRouter(prefix="/api/cart", tags=["cart"])
 
+# 列表接口的快速序列化路径（见 core.serialization）；商品快照来自商品缓存，本身不回表
+_CART_LIST = TypeAdapter(List[CartItemOut])
+
 @router.post("/", response_model=CartItemOut)
 async def add_item(
     item: CartItemCreate,
@@ -22,7 +27,16 @@ async def list_cart(
     user=Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    return await get_cart_items(db, user.user_id)
+    return dump_response(_CART_LIST, await get_cart_items(db, user.user_id))
+
+@router.patch("/", response_model=List[CartItemOut])
+async def batch_update(
+    body: CartBatchUpdate,
+    user=Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # 一次提交多条加购 / 改数量 / 移除，返回更新后的购物车
+    return await update_cart(db, user.user_id, body.operations)
 
 @router.delete("/clear", status_code=204)
 async def clear_user_cart(
@@ -31,12 +45,12 @@ async def clear_user_cart(
 ):
     await clear_cart(db, user.user_id)
 
-@router.delete("/{cart_item_id}", status_code=204)
+@router.delete("/{sku}", status_code=204)
 async def delete_item(
-    cart_item_id: int,
+    sku: str,
     user=Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # 可验证归属
-    await remove_cart_item(db, cart_item_id)
+    # 只删当前用户购物车里的该商品
+    await remove_cart_item(db, user.user_id, sku)
 
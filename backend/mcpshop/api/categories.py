@@ -0,0 +1,49 @@
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.db.session import get_db, get_read_db
+from mcpshop.crud.category import (
+    create_category, empty_facet, get_category, get_category_facets, list_categories,
+    refresh_category_facets,
+)
+from mcpshop.models.category_facet import UNCATEGORIZED
+from mcpshop.schemas.category import CategoryCreate, CategoryFacetOut, CategoryOut
+from mcpshop.api.deps import get_current_admin_user
+from mcpshop.core.http_cache import catalog_cache
+
+router = APIRouter(prefix="/api/categories", tags=["categories"])
+
+# 所有人都能查分类列表
+@router.get("/", response_model=List[CategoryOut], dependencies=[Depends(catalog_cache)])
+async def list_all(db: AsyncSession = Depends(get_read_db)):
+    return await list_categories(db)
+
+# ★ 管理员才能新建分类
+@router.post("/", response_model=CategoryOut, dependencies=[Depends(get_current_admin_user)])
+async def create(c: CategoryCreate, db: AsyncSession = Depends(get_db)):
+    return await create_category(db, c)
+
+# 侧边栏：全部分类的商品数 / 有货数 / 价格直方图（读预计算聚合）
+@router.get("/facets", response_model=List[CategoryFacetOut], dependencies=[Depends(catalog_cache)])
+async def all_facets(db: AsyncSession = Depends(get_read_db)):
+    return await get_category_facets(db)
+
+# ★ 管理员手动全量重算聚合
+@router.post("/facets/refresh", dependencies=[Depends(get_current_admin_user)])
+async def refresh_facets(db: AsyncSession = Depends(get_db)):
+    return {"rows": await refresh_category_facets(db)}
+
+# 单个分类的聚合；category_id = 0 为未分类商品
+@router.get("/{category_id}/facets", response_model=CategoryFacetOut, dependencies=[Depends(catalog_cache)])
+async def category_facets(category_id: int, db: AsyncSession = Depends(get_read_db)):
+    facets = await get_category_facets(db, category_id)
+    if facets:
+        return facets[0]
+    # 没有聚合行：分类存在（或是未分类）就返回全 0，不存在才 404
+    category = None
+    if category_id != UNCATEGORIZED:
+        category = await get_category(db, category_id)
+        if category is None:
+            raise HTTPException(status_code=404, detail="未找到分类")
+    return empty_facet(category, category_id)
@@ -7,6 +7,7 @@ WebSocket端: WS    /api/chat         （多轮对话）
 """
 import os
 import json
+import math
 from pathlib import Path
 
 from fastapi import (
@@ -24,6 +25,8 @@ from mcpshop.db.session import get_db
 from mcpshop.schemas.chat import ChatRequest
 from mcpshop.services.mcp_client import MCPClient
 from mcpshop.crud.cart import get_cart_items
+from mcpshop.schemas.cart import CartItemOut
+from mcpshop.core.rate_limit import rate_limiter, user_key
 
 # -------------------------------------------------------------------- #
 # 环境变量和常量
@@ -76,6 +79,11 @@ async def websocket_chat(
         try:
             while True:
                 text = await ws.receive_text()
+                # 握手只计一次费，之后每条消息都要过 chat 限额（每条消息都会调用 LLM）
+                wait = await rate_limiter.hit("chat", user_key(user.username))
+                if wait > 0:
+                    await ws.send_json({"error": "发送太频繁，请稍后再试", "retry_after": math.ceil(wait)})
+                    continue
                 answer = await _ai.process_query(text, user_token=token)
 
                 # answer 可能是纯字符串，也可能已是 JSON 字符串/字典
@@ -91,7 +99,7 @@ async def websocket_chat(
                     {
                         "reply":   answer.get("reply", ""),
                         "actions": answer.get("actions", []),
-                        "cart":    cart,
+                        "cart":    [CartItemOut.model_validate(i, from_attributes=True).model_dump(mode="json") for i in cart],
                     }
                 )
         except WebSocketDisconnect:
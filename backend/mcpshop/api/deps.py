@@ -1,30 +1,37 @@
 # 文件：backend/mcpshop/api/deps.py
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, WebSocket, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from mcpshop.core.security import decode_access_token
+from mcpshop.core.security import token_cache
 from mcpshop.db.session        import get_db
-from mcpshop.crud.user         import get_user_by_username
+from mcpshop.crud.user         import get_user_cached
 from mcpshop.models.user       import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+# WebSocket 鉴权的子协议名：浏览器用 new WebSocket(url, ["bearer", token]) 传 token
+WS_TOKEN_PROTOCOL = "bearer"
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db:    AsyncSession = Depends(get_db)
 ) -> User:
+    """
+    已验签 token 和用户记录都走缓存，稳定状态下鉴权不查库（会话不会真正取连接）。
+    返回游离态 User（不含 password_hash）。
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="认证失败",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        username = decode_access_token(token)
+        username = token_cache.subject(token)
     except JWTError:
         raise credentials_exception
-    user = await get_user_by_username(db, username)
+    user = await get_user_cached(db, username)
     if not user:
         raise credentials_exception
     return user
@@ -41,3 +48,27 @@ async def get_current_admin_user(
             detail="管理员权限不足"
         )
     return current
+
+def websocket_token(ws: WebSocket) -> str | None:
+    """
+    浏览器的 WebSocket 不能设置 Authorization 头：token 取自查询参数 ?token=，
+    或子协议列表 ["bearer", <token>]；都没有时返回 None。
+    """
+    token = ws.query_params.get("token")
+    if token:
+        return token
+    protocols = ws.scope.get("subprotocols") or []
+    if len(protocols) >= 2 and protocols[0] == WS_TOKEN_PROTOCOL:
+        return protocols[1]
+    return None
+
+async def get_websocket_user(ws: WebSocket, db: AsyncSession) -> User | None:
+    """WebSocket 版 get_current_user：token 无效或用户不存在时返回 None，由调用方关闭连接"""
+    token = websocket_token(ws)
+    if not token:
+        return None
+    try:
+        username = token_cache.subject(token)
+    except JWTError:
+        return None
+    return await get_user_cached(db, username)
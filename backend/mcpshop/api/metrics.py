@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+
+from mcpshop.api.deps import get_current_admin_user
+from mcpshop.core.sql_metrics import sql_metrics
+from mcpshop.db.session import engine, replica_router
+
+# 运行指标（进程内统计，每个 worker 各自一份），全部为管理员接口
+router = APIRouter(
+    prefix="/api/admin/metrics",
+    tags=["metrics"],
+    dependencies=[Depends(get_current_admin_user)],
+)
+
+# 按路由汇总的 SQL 统计：平均 / 最多语句数、数据库耗时分位数、疑似 N+1 次数、最慢语句
+@router.get("/sql")
+async def sql_stats():
+    return sql_metrics.as_dict()
+
+# 清空 SQL 统计（调整代码后重新观察）
+@router.delete("/sql", status_code=204)
+async def reset_sql_stats():
+    sql_metrics.reset()
+
+# 主库连接池和只读副本状态
+@router.get("/db")
+async def db_stats():
+    return {"primary": engine.pool.status(), "replicas": replica_router.status()}
@@ -1,20 +1,33 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
-from mcpshop.db.session import get_db
-from mcpshop.crud.cart import get_cart_items, clear_cart
-from mcpshop.crud.order import create_order, get_orders_by_user
-from mcpshop.api.deps import get_current_user, get_current_admin_user
+from mcpshop.db.session import get_db, get_read_db, AsyncSessionLocal
+from mcpshop.crud.cart import get_cart_items
+from mcpshop.crud.order import get_order, list_order_rows_page, submit_order
+from mcpshop.api.deps import (
+    WS_TOKEN_PROTOCOL, get_current_admin_user, get_current_user, get_websocket_user,
+)
+from mcpshop.core.serialization import dump_response
 from mcpshop.schemas.order import OrderOut
-from mcpshop.models.order import Order
+from mcpshop.schemas.pagination import Page
+from mcpshop.services.inventory import InventoryUnavailable
+from mcpshop.services.order_pipeline import watch_order
+from mcpshop.services.outbox import notify
+from mcpshop.services.export import (
+    EXPORT_FORMATS, MEDIA_TYPES, export_filename, iter_export, order_export_query,
+)
 
 router = APIRouter(prefix="/api/orders", tags=["orders"])
 
+# 列表接口的快速序列化路径（见 core.serialization）
+_ORDER_PAGE = TypeAdapter(Page[OrderOut])
+
 # 普通用户下单
-@router.post("/", response_model=OrderOut)
+@router.post("/", response_model=OrderOut, status_code=202)
 async def place_order(
     user = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
@@ -22,26 +35,93 @@ async def place_order(
     items = await get_cart_items(db, user.user_id)
     if not items:
         raise HTTPException(status_code=400, detail="购物车为空")
-    details = [{"sku": i.sku, "quantity": i.quantity} for i in items]
-    order = await create_order(db, user.user_id, details)
-    await clear_cart(db, user.user_id)
+    details = [{"sku": i["sku"], "quantity": i["quantity"]} for i in items]
+    try:
+        # 只受理：订单（PENDING）和下单事件在同一个事务里写入，扣库存由后台 worker 完成；
+        # 提交后按这份快照从购物车扣掉已下单的数量，期间新加购的商品不受影响
+        order = await submit_order(db, user.user_id, details, clear_cart=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InventoryUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    notify()
     return order
 
 # 普通用户查自己订单
-@router.get("/", response_model=List[OrderOut])
+@router.get("/", response_model=Page[OrderOut])
 async def list_orders(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
     user = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    return await get_orders_by_user(db, user.user_id)
+    try:
+        items, next_cursor = await list_order_rows_page(db, limit, cursor, user_id=user.user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dump_response(_ORDER_PAGE, {"items": items, "next_cursor": next_cursor})
 
 # ★ 管理员查所有订单（管理员专属接口）
-@router.get("/all", response_model=List[OrderOut], dependencies=[Depends(get_current_admin_user)])
+@router.get("/all", response_model=Page[OrderOut], dependencies=[Depends(get_current_admin_user)])
 async def list_all_orders(
-    db: AsyncSession = Depends(get_db)
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+    since: datetime | None = Query(None, description="下单时间下限（含）"),
+    until: datetime | None = Query(None, description="下单时间上限（不含）"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # 游标分页，只为本页订单加载关联 items；按时间过滤时只扫描相关月份分区
+    try:
+        items, next_cursor = await list_order_rows_page(db, limit, cursor, since=since, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dump_response(_ORDER_PAGE, {"items": items, "next_cursor": next_cursor})
+
+# ★ 管理员全量导出订单明细（每个 order_item 一行，服务端游标流式输出）
+@router.get("/export", dependencies=[Depends(get_current_admin_user)])
+async def export_orders(
+    format: Literal[EXPORT_FORMATS] = Query("ndjson"),
+    gzip: bool = Query(False, description="是否 gzip 压缩"),
 ):
-    # 使用 ORM 查询一次性加载关联 items
-    result = await db.execute(
-        select(Order).options(selectinload(Order.items))
+    filename = export_filename("orders", format, gzip)
+    return StreamingResponse(
+        iter_export(order_export_query(), format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
     )
-    return result.scalars().all()
+
+# 查单个订单（轮询下单进度）：本人或管理员
+@router.get("/{order_id}", response_model=OrderOut)
+async def get_one_order(
+    order_id: int,
+    user = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    order = await get_order(db, order_id)
+    if not order or (order.user_id != user.user_id and not user.is_admin):
+        raise HTTPException(status_code=404, detail="未找到订单")
+    return order
+
+# 订阅下单进度：推送 {"order_id", "status", "reason"}，到达终态后服务端关闭连接
+@router.websocket("/{order_id}/ws")
+async def watch_order_status(ws: WebSocket, order_id: int):
+    # token 走查询参数 ?token= 或子协议 ["bearer", token]（见 api.deps.websocket_token）；
+    # 先 accept 再关闭，浏览器才能拿到 4401（未登录）/ 4404（订单不存在或不是自己的）
+    subprotocol = WS_TOKEN_PROTOCOL if WS_TOKEN_PROTOCOL in ws.scope.get("subprotocols", ()) else None
+    await ws.accept(subprotocol=subprotocol)
+    # 鉴权和查订单用完即还连接，不在整个推送期间占着会话
+    async with AsyncSessionLocal() as db:
+        user = await get_websocket_user(ws, db)
+        order = await get_order(db, order_id) if user else None
+    if user is None:
+        await ws.close(code=4401)
+        return
+    if not order or (order.user_id != user.user_id and not user.is_admin):
+        await ws.close(code=4404)
+        return
+    try:
+        async for update in watch_order(AsyncSessionLocal, order_id):
+            await ws.send_json(update)
+        await ws.close()
+    except WebSocketDisconnect:
+        pass
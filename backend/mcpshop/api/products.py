@@ -1,46 +1,145 @@
-from typing import List
-from fastapi import APIRouter, Depends, Query, HTTPException
+from typing import List, Literal
+from fastapi import APIRouter, Depends, File, Query, HTTPException, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from mcpshop.db.session import get_db
-from mcpshop.schemas.product import ProductCreate, ProductOut, ProductUpdate
+from mcpshop.db.session import get_db, get_read_db
+from mcpshop.schemas.product import HotStockOut, ProductCreate, ProductOut, ProductSuggestion, ProductUpdate
+from mcpshop.schemas.pagination import Page
 from mcpshop.crud.product import (
-    create_product, get_product_by_sku, search_products,
+    create_product, delete_product, get_product_by_sku, get_product_cached, product_cache,
+    search_products_page, semantic_search_products, update_product,
 )
+from mcpshop.core.embedding import get_embedding_function
+from mcpshop.core.redis import REDIS_ERRORS
+from mcpshop.core.http_cache import catalog_cache, set_last_modified
+from mcpshop.core.serialization import dump_response
+from mcpshop.services.catalog_import import FORMATS, detect_format, import_products, open_text
+from mcpshop.services.export import (
+    EXPORT_FORMATS, MEDIA_TYPES, export_filename, iter_export, product_export_query,
+)
+from mcpshop.services.inventory import hot_inventory
+from mcpshop.services.product_index import SemanticIndexError
+from mcpshop.services.suggest import suggest_index
 
 # ★ 新增管理员依赖
 from mcpshop.api.deps import get_current_admin_user
 
 router = APIRouter(prefix="/api/products", tags=["products"])
 
+# 列表接口的快速序列化路径（见 core.serialization）
+_PRODUCT_PAGE = TypeAdapter(Page[ProductOut])
+_PRODUCT_LIST = TypeAdapter(List[ProductOut])
+
 # ★ 管理员才能添加商品
 @router.post("/", response_model=ProductOut, dependencies=[Depends(get_current_admin_user)])
 async def create(
     p: ProductCreate,
     db: AsyncSession = Depends(get_db)
 ):
-    exists = await get_product_by_sku(db, p.sku)
+    exists = await get_product_cached(db, p.sku)
     if exists:
         raise HTTPException(status_code=400, detail="SKU 已存在")
     return await create_product(db, p)
 
 # 所有人都能查看商品列表
-@router.get("/", response_model=List[ProductOut])
+@router.get("/", response_model=Page[ProductOut], dependencies=[Depends(catalog_cache)])
 async def list_products(
+    response: Response,
     q: str = Query("", description="搜索关键词"),
     limit: int = Query(20, ge=1, le=100),
+    sort: Literal["relevance", "price_asc", "price_desc", "newest"] = Query(
+        "relevance", description="排序方式"
+    ),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        items, next_cursor = await search_products_page(db, q, limit, sort, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dump_response(_PRODUCT_PAGE, {"items": items, "next_cursor": next_cursor}, response)
+
+# 所有人都能用自然语言做语义检索（如「便宜的防水鞋」）
+@router.get("/semantic", response_model=List[ProductOut], dependencies=[Depends(catalog_cache)])
+async def semantic_search(
+    response: Response,
+    q: str = Query(..., min_length=1, description="自然语言描述"),
+    top_k: int = Query(10, ge=1, le=50),
+    max_price_cents: int | None = Query(None, ge=0, description="价格上限（分）"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    try:
+        items = await semantic_search_products(db, q, top_k, max_price_cents)
+    except SemanticIndexError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return dump_response(_PRODUCT_LIST, items, response)
+
+# 搜索框联想：商品名 / 拼音前缀，按销量排序（纯内存，不查库）
+@router.get("/suggest", response_model=List[ProductSuggestion], dependencies=[Depends(catalog_cache)])
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(10, ge=1, le=10),
+):
+    return suggest_index.query(q, limit)
+
+# ★ 管理员查看商品缓存 / 嵌入缓存命中统计
+@router.get("/cache/stats", dependencies=[Depends(get_current_admin_user)])
+async def cache_stats():
+    embedding_cache = get_embedding_function().cache
+    return {
+        "product": product_cache.stats.as_dict(),
+        "embedding": embedding_cache.stats.as_dict() if embedding_cache else None,
+    }
+
+# ★ 管理员批量导入商品（CSV / JSONL，可 gzip），按 sku 新增或覆盖
+@router.post("/import", dependencies=[Depends(get_current_admin_user)])
+async def import_catalog(
+    file: UploadFile = File(..., description="商品文件：.csv / .jsonl，可带 .gz"),
+    format: Literal[FORMATS] | None = Query(None, description="文件格式，缺省按扩展名判断"),
+    batch_size: int = Query(1000, ge=1, le=10000),
+    sync_index: bool = Query(False, description="是否在后台同步语义索引"),
     db: AsyncSession = Depends(get_db)
 ):
-    return await search_products(db, q, limit)
+    try:
+        fmt = format or detect_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    stream = open_text(file.file, file.filename)
+    report = await import_products(db, stream, fmt, batch_size=batch_size, sync_index=sync_index)
+    return report.as_dict()
 
-# 所有人都能查商品详情
-@router.get("/{sku}", response_model=ProductOut)
+# ★ 管理员全量导出商品（服务端游标流式输出）
+@router.get("/export", dependencies=[Depends(get_current_admin_user)])
+async def export_catalog(
+    format: Literal[EXPORT_FORMATS] = Query("ndjson"),
+    gzip: bool = Query(False, description="是否 gzip 压缩"),
+):
+    filename = export_filename("products", format, gzip)
+    return StreamingResponse(
+        iter_export(product_export_query(), format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+# ★ 管理员查看热点商品（秒杀）库存：可售 / 预扣中 / 待写回
+@router.get("/hot", response_model=List[HotStockOut], dependencies=[Depends(get_current_admin_user)])
+async def list_hot_stock():
+    try:
+        return await hot_inventory.status()
+    except REDIS_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Redis 不可用：{e}")
+
+# 所有人都能查商品详情（走两级缓存；未命中时从主库回源，免得把副本上的旧数据写进共享缓存）
+@router.get("/{sku}", response_model=ProductOut, dependencies=[Depends(catalog_cache)])
 async def get_sku(
-    sku: str, db: AsyncSession = Depends(get_db)
+    sku: str, response: Response, db: AsyncSession = Depends(get_db)
 ):
-    prod = await get_product_by_sku(db, sku)
+    prod = await get_product_cached(db, sku)
     if not prod:
         raise HTTPException(status_code=404, detail="未找到商品")
+    set_last_modified(response, prod.created_at, prod.updated_at)
     return prod
 
 # ★ 管理员才能修改商品
@@ -50,15 +149,36 @@ async def update_sku(
     p: ProductUpdate,
     db: AsyncSession = Depends(get_db)
 ):
+    # 从主库读出会话中的实例再改（update_product 会加锁重读）：缓存快照可能已过时
     prod = await get_product_by_sku(db, sku)
     if not prod:
         raise HTTPException(status_code=404, detail="未找到商品")
-    for k, v in p.dict(exclude_unset=True).items():
-        setattr(prod, k, v)
-    await db.commit()
-    await db.refresh(prod)
+    fields = p.dict(exclude_unset=True)
+    prod = await update_product(db, prod, fields)
+    if not prod:
+        raise HTTPException(status_code=404, detail="未找到商品")
+    if "stock" in fields:
+        await hot_inventory.resync(db, sku)      # 热点商品按新库存重新校准可售数
     return prod
 
+# ★ 管理员把商品设为热点（秒杀）：库存改由 Redis 预扣，批量写回数据库
+@router.put("/{sku}/hot", response_model=HotStockOut, dependencies=[Depends(get_current_admin_user)])
+async def enable_hot(sku: str, db: AsyncSession = Depends(get_db)):
+    try:
+        if await hot_inventory.enable(db, sku) is None:
+            raise HTTPException(status_code=404, detail="未找到商品")
+        return next(s for s in await hot_inventory.status() if s["sku"] == sku)
+    except REDIS_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Redis 不可用：{e}")
+
+# ★ 管理员取消热点：待写回的库存先落库
+@router.delete("/{sku}/hot", status_code=204, dependencies=[Depends(get_current_admin_user)])
+async def disable_hot(sku: str, db: AsyncSession = Depends(get_db)):
+    try:
+        await hot_inventory.disable(db, sku)
+    except REDIS_ERRORS as e:
+        raise HTTPException(status_code=503, detail=f"Redis 不可用：{e}")
+
 # ★ 管理员才能删除商品
 @router.delete("/{sku}", status_code=204, dependencies=[Depends(get_current_admin_user)])
 async def delete_sku(
@@ -67,5 +187,4 @@ async def delete_sku(
     prod = await get_product_by_sku(db, sku)
     if not prod:
         raise HTTPException(status_code=404, detail="未找到商品")
-    await db.delete(prod)
-    await db.commit()
+    await delete_product(db, prod)
@@ -1,22 +1,27 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from mcpshop.db.session import get_db
-from mcpshop.crud.user import get_user_by_username
-from mcpshop.models.user import User
+from mcpshop.crud.user import delete_user as delete_user_record, get_user_by_username, list_users_page, set_user_admin
 from mcpshop.api.deps import get_current_admin_user
-from mcpshop.schemas.user import UserOut
+from mcpshop.schemas.user import UserAdminUpdate, UserOut
+from mcpshop.schemas.pagination import Page
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
 # 管理员获取所有用户列表
-@router.get("/", response_model=List[UserOut], dependencies=[Depends(get_current_admin_user)])
-async def list_users(db: AsyncSession = Depends(get_db)):
-    # 使用 ORM 查询所有 User 对象
-    result = await db.execute(select(User))
-    return result.scalars().all()
+@router.get("/", response_model=Page[UserOut], dependencies=[Depends(get_current_admin_user)])
+async def list_users(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+    db: AsyncSession = Depends(get_db)
+):
+    # 按 user_id 游标分页
+    try:
+        items, next_cursor = await list_users_page(db, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
 
 # 管理员删除指定用户
 @router.delete("/{username}", status_code=204, dependencies=[Depends(get_current_admin_user)])
@@ -24,5 +29,19 @@ async def delete_user(username: str, db: AsyncSession = Depends(get_db)):
     user = await get_user_by_username(db, username)
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
-    await db.delete(user)
-    await db.commit()
+    await delete_user_record(db, user)        # 同时失效鉴权缓存
+
+# 管理员授予 / 取消管理员权限
+@router.put("/{username}/admin", response_model=UserOut)
+async def update_user_admin(
+    username: str,
+    body: UserAdminUpdate,
+    admin = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if username == admin.username and not body.is_admin:
+        raise HTTPException(status_code=400, detail="不能取消自己的管理员权限")
+    user = await get_user_by_username(db, username)
+    if not user:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return await set_user_admin(db, user, body.is_admin)
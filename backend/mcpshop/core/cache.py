@@ -0,0 +1,346 @@
+# mcpshop/core/cache.py
+"""
+两级缓存：进程内 LRU → Redis → 回源（通常是数据库）。
+
+- 进程内 LRU 有条目上限和较短 TTL，命中时零网络开销；
+- Redis 层在所有 worker 间共享，TTL 带少量随机抖动，避免同一时刻集中过期；
+- 防击穿：同一 worker 内同 key 的并发回源合并为一次（single-flight），
+  跨 worker 用 Redis SET NX 短锁，抢不到锁的一方短暂等待对方写回；
+- 失效：先递增该 key 的版本号、再删除 Redis key，并通过 pub/sub 广播，各 worker 的监听任务清掉本地副本；
+- 防旧值回填：回源前读出版本号，回源后用 Lua 脚本比较版本再写 Redis（CAS）。
+  回源期间任何 worker 做过失效，版本已变，读到的旧值只返回、不写缓存；
+  本 worker 的失效（含收到的广播）还会让进程内层跳过回填；
+- get_many_or_load 批量读：本地层逐个查，其余一次 MGET，仍未命中的交给 loader 一次回源
+  （如一条 WHERE ... IN），再用一个 pipeline 批量 CAS 回填；批量回源不做 single-flight 和跨 worker 锁；
+- 缓存值须可 JSON 序列化（datetime 会转成 ISO 字符串），None 也会被缓存（负缓存）。
+
+Redis 不可用时自动降级为「仅进程内 LRU + 回源」，只记 redis_errors，不影响请求。
+"""
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Awaitable, Callable
+
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+
+_MISS = object()
+REDIS_RETRY_INTERVAL = 5        # Redis 出错后暂停访问的秒数
+
+# KEYS[1] 值，KEYS[2] 版本号；ARGV：值、TTL、回源前读到的版本号（不存在为空串）。版本未变才写入
+_FILL_LUA = """
+local v = redis.call('GET', KEYS[2])
+if (v == false and ARGV[3] == '') or v == ARGV[3] then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+  return 1
+end
+return 0
+"""
+
+
+def _json_default(o: Any) -> Any:
+    if isinstance(o, datetime):
+        return o.isoformat()
+    raise TypeError(f"无法序列化的缓存值类型：{type(o).__name__}")
+
+
+@dataclass
+class CacheStats:
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0             # 两级都未命中、实际回源的次数
+    coalesced: int = 0          # 被 single-flight 合并掉的并发回源
+    invalidations: int = 0
+    stale_fills: int = 0        # 回源期间被失效、没有写回的次数
+    redis_errors: int = 0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        lookups = self.local_hits + self.redis_hits + self.misses + self.coalesced
+        data["hit_rate"] = round((lookups - self.misses) / lookups, 4) if lookups else 0.0
+        return data
+
+
+class TwoTierCache:
+    def __init__(
+        self,
+        namespace: str,
+        ttl: int,
+        local_ttl: int,
+        maxsize: int,
+        negative_ttl: int = 30,
+        lock_ttl_ms: int = 2000,
+        lock_wait_ms: int = 200,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait_ms = lock_wait_ms
+        self.channel = f"{namespace}:invalidate"
+        self.stats = CacheStats()
+        self._local: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._redis_retry_at = 0.0
+        self._invalidation_seq = 0
+
+    # ------------------------------------------------------------ #
+    # 读
+    # ------------------------------------------------------------ #
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self._local_get(key)
+        if value is not _MISS:
+            self.stats.local_hits += 1
+            return value
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, loader)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()          # 没有等待者时也不要告警 "never retrieved"
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        seq = self._invalidation_seq
+        value, version = await self._redis_get_versioned(key)
+        if value is not _MISS:
+            self.stats.redis_hits += 1
+            self._local_set(key, value)
+            return value
+
+        locked = await self._acquire_fill_lock(key)
+        if not locked:
+            # 其它 worker 正在回源：短暂等待它写回 Redis
+            deadline = time.monotonic() + self.lock_wait_ms / 1000
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+                value = await self._redis_get(key)
+                if value is not _MISS:
+                    self.stats.redis_hits += 1
+                    self._local_set(key, value)
+                    return value
+
+        self.stats.misses += 1
+        try:
+            value = await loader()
+            # 回源期间发生过失效（本 worker 或其它 worker），读到的可能是旧值：只返回、不写缓存
+            if seq == self._invalidation_seq and await self._redis_fill(key, value, version):
+                self._local_set(key, value)
+            else:
+                self.stats.stale_fills += 1
+            return value
+        finally:
+            if locked:
+                await self._redis_call(lambda r: r.delete(self._lock_key(key)))
+
+    async def get_many_or_load(
+        self, keys: list[str], loader: Callable[[list[str]], Awaitable[dict[str, Any]]]
+    ) -> dict[str, Any]:
+        """
+        批量读，返回 {key: 值}。loader 接收未命中的 key 列表，返回 {key: 值}；
+        其中没有的 key 按 None（不存在）处理，同样会被负缓存。
+        """
+        out: dict[str, Any] = {}
+        rest = []
+        for key in dict.fromkeys(keys):
+            value = self._local_get(key)
+            if value is _MISS:
+                rest.append(key)
+            else:
+                self.stats.local_hits += 1
+                out[key] = value
+        if not rest:
+            return out
+
+        seq = self._invalidation_seq
+        versions: dict[str, bytes | None] = {}
+        for key, (value, version) in zip(rest, await self._redis_get_many_versioned(rest)):
+            if value is _MISS:
+                versions[key] = version
+            else:
+                self.stats.redis_hits += 1
+                self._local_set(key, value)
+                out[key] = value
+        if not versions:
+            return out
+
+        self.stats.misses += len(versions)
+        loaded = await loader(list(versions))
+        values = {key: loaded.get(key) for key in versions}
+        out.update(values)
+        if seq != self._invalidation_seq:
+            self.stats.stale_fills += len(values)
+            return out
+        for (key, value), filled in zip(values.items(), await self._redis_fill_many(values, versions)):
+            if filled:
+                self._local_set(key, value)
+            else:
+                self.stats.stale_fills += 1
+        return out
+
+    # ------------------------------------------------------------ #
+    # 失效
+    # ------------------------------------------------------------ #
+    async def invalidate(self, *keys: str) -> None:
+        """写操作提交后调用：清本地、删 Redis，并通知其它 worker 清本地副本"""
+        if not keys:
+            return
+        for key in keys:
+            self._local.pop(key, None)
+        self.stats.invalidations += len(keys)
+        self._invalidation_seq += 1
+
+        async def _do(r):
+            # 先递增版本再删值：之后的 CAS 回填都会失败，之前已写入的旧值也被删掉
+            pipe = r.pipeline(transaction=True)
+            for key in keys:
+                pipe.incr(self._version_key(key))
+                pipe.expire(self._version_key(key), self._version_ttl)
+            pipe.delete(*(self._redis_key(k) for k in keys))
+            for key in keys:
+                pipe.publish(self.channel, key)
+            await pipe.execute()
+        await self._redis_call(_do)
+
+    async def run_invalidation_listener(self) -> None:
+        """常驻任务：订阅失效广播，清掉本 worker 的本地副本；断线后自动重连"""
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        data = message["data"]
+                        self._local.pop(data.decode() if isinstance(data, bytes) else data, None)
+                        # 本 worker 进行中的回源也不再写进程内层
+                        self._invalidation_seq += 1
+            except asyncio.CancelledError:
+                raise
+            except REDIS_ERRORS as e:
+                # 断线期间收不到广播，先清空本地层以免读到其它 worker 已失效的旧值
+                self._local.clear()
+                logger.warning(
+                    f"[cache:{self.namespace}] 失效监听断开，{REDIS_RETRY_INTERVAL} 秒后重连：{e}"
+                )
+                await asyncio.sleep(REDIS_RETRY_INTERVAL)
+            finally:
+                await pubsub.aclose()
+
+    # ------------------------------------------------------------ #
+    # 进程内 LRU
+    # ------------------------------------------------------------ #
+    def _local_get(self, key: str) -> Any:
+        entry = self._local.get(key)
+        if entry is None:
+            return _MISS
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return _MISS
+        self._local.move_to_end(key)
+        return value
+
+    def _local_set(self, key: str, value: Any) -> None:
+        ttl = self.local_ttl if value is not None else min(self.local_ttl, self.negative_ttl)
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    # ------------------------------------------------------------ #
+    # Redis 层
+    # ------------------------------------------------------------ #
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.namespace}:lock:{key}"
+
+    def _version_key(self, key: str) -> str:
+        return f"{self.namespace}:ver:{key}"
+
+    @property
+    def _version_ttl(self) -> int:
+        # 比任何一次回源都长得多即可；过期后版本视为「不存在」，回源前读到旧版本号的 CAS 同样失败
+        return max(self.ttl, self.negative_ttl) * 2
+
+    async def _redis_call(self, fn: Callable[[Any], Awaitable[Any]], default: Any = None) -> Any:
+        # 熔断：出错后一段时间内直接跳过 Redis，避免每个请求都等连接超时
+        if time.monotonic() < self._redis_retry_at:
+            return default
+        try:
+            return await fn(get_redis())
+        except REDIS_ERRORS as e:
+            self.stats.redis_errors += 1
+            self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+            logger.warning(
+                f"[cache:{self.namespace}] Redis 不可用，{REDIS_RETRY_INTERVAL} 秒内降级为仅本地缓存：{e}"
+            )
+            return default
+
+    async def _redis_get(self, key: str) -> Any:
+        raw = await self._redis_call(lambda r: r.get(self._redis_key(key)))
+        return _MISS if raw is None else json.loads(raw)
+
+    async def _redis_get_versioned(self, key: str) -> tuple[Any, bytes | None]:
+        """返回 (值或 _MISS, 当前版本号)；Redis 不可用时为 (_MISS, None)"""
+        raw, version = await self._redis_call(
+            lambda r: r.mget(self._redis_key(key), self._version_key(key)), default=(None, None)
+        )
+        return (_MISS if raw is None else json.loads(raw)), version
+
+    async def _redis_get_many_versioned(self, keys: list[str]) -> list[tuple[Any, bytes | None]]:
+        """批量版 _redis_get_versioned：一次 MGET 取回全部值和版本号"""
+        names = [name for key in keys for name in (self._redis_key(key), self._version_key(key))]
+        raw = await self._redis_call(lambda r: r.mget(names), default=[None] * len(names))
+        return [
+            (_MISS if raw[i] is None else json.loads(raw[i]), raw[i + 1])
+            for i in range(0, len(raw), 2)
+        ]
+
+    def _fill_args(self, key: str, value: Any, version: bytes | None) -> tuple:
+        ttl = self.ttl if value is not None else self.negative_ttl
+        ttl = int(ttl * random.uniform(1.0, 1.1))      # 抖动，避免集中过期
+        raw = json.dumps(value, default=_json_default, ensure_ascii=False)
+        return _FILL_LUA, 2, self._redis_key(key), self._version_key(key), raw, ttl, version or b""
+
+    async def _redis_fill(self, key: str, value: Any, version: bytes | None) -> bool:
+        """版本号仍为 version 时写入 Redis，返回是否可以回填；Redis 不可用时返回 True（只剩进程内层）"""
+        written = await self._redis_call(lambda r: r.eval(*self._fill_args(key, value, version)), default=1)
+        return bool(written)
+
+    async def _redis_fill_many(self, values: dict[str, Any], versions: dict[str, bytes | None]) -> list[bool]:
+        """批量版 _redis_fill：一个 pipeline 里逐个 CAS，返回与 values 顺序一致的结果"""
+        async def _do(r):
+            pipe = r.pipeline(transaction=False)
+            for key, value in values.items():
+                pipe.eval(*self._fill_args(key, value, versions[key]))
+            return await pipe.execute()
+
+        written = await self._redis_call(_do, default=[1] * len(values))
+        return [bool(w) for w in written]
+
+    async def _acquire_fill_lock(self, key: str) -> bool:
+        # Redis 不可用时视为拿到锁，直接回源
+        return bool(await self._redis_call(
+            lambda r: r.set(self._lock_key(key), b"1", nx=True, px=self.lock_ttl_ms),
+            default=True,
+        ))
@@ -1,6 +1,6 @@
 # mcpshop/core/config.py
 from pydantic_settings import BaseSettings
-from pydantic import Field, AnyUrl
+from pydantic import Field, AnyUrl, model_validator
 
 
 class Settings(BaseSettings):
@@ -11,6 +11,107 @@ class Settings(BaseSettings):
     # —— 数据库 & 缓存 ——  
     DATABASE_URL: str = Field(..., env="DATABASE_URL")
     REDIS_URL: str = Field(..., env="REDIS_URL")
+    REDIS_SOCKET_TIMEOUT: float = 0.5          # 秒；Redis 不可用时尽快降级，不拖慢请求
+
+    # —— 连接池与只读副本 ——
+    DATABASE_REPLICA_URLS: list[str] = []      # 只读副本，JSON 数组；为空时读写都走主库
+    DB_POOL_SIZE: int = 10                     # 每个引擎（主库 / 每个副本）常驻连接数
+    DB_MAX_OVERFLOW: int = 20                  # 高峰时可额外打开的连接数
+    DB_POOL_RECYCLE: int = 1800                # 连接使用超过该秒数后重建（防止被中间件 / 服务端掐断）
+    DB_POOL_TIMEOUT: int = 30                  # 等待空闲连接的秒数
+    DB_POOL_PRE_PING: bool = True              # 取连接时先探活
+    DB_ECHO: bool = False                      # 打印每条 SQL（仅调试用）
+    DB_READ_STICKY_SECONDS: float | None = None   # 用户写入后这段时间内的读走主库（读己之写）；
+                                               # 不得小于 DB_REPLICA_MAX_LAG，缺省为 MAX_LAG + CHECK_INTERVAL
+    DB_REPLICA_CHECK_INTERVAL: int = 5         # 副本健康检查间隔（秒）
+    DB_REPLICA_MAX_LAG: float = 10             # 复制延迟超过该秒数的副本暂时摘除
+
+    # —— 商品缓存（进程内 LRU + Redis） ——
+    PRODUCT_CACHE_TTL: int = 300               # Redis 层 TTL（秒）
+    PRODUCT_CACHE_LOCAL_TTL: int = 30          # 进程内 LRU TTL（秒），跨 worker 失效的兜底
+    PRODUCT_CACHE_MAXSIZE: int = 10000         # 每个 worker 的 LRU 条目上限
+
+    # —— 登录态缓存（已验签 token + 用户记录） ——
+    USER_CACHE_TTL: int = 300                  # 用户记录 Redis 层 TTL（秒）
+    USER_CACHE_LOCAL_TTL: int = 30             # 进程内 TTL（秒），跨 worker 失效的兜底
+    USER_CACHE_MAXSIZE: int = 10000            # 每个 worker 的用户记录条目上限
+    TOKEN_CACHE_MAXSIZE: int = 10000           # 每个 worker 缓存的已验签 token 数
+
+    # —— SQL 观测（Server-Timing、N+1、慢查询日志） ——
+    SQL_METRICS_ENABLED: bool = True
+    SQL_SLOW_QUERY_MS: float = 200             # 单条语句超过该毫秒数记为慢查询
+    SQL_SLOW_QUERY_SAMPLE_RATE: float = 1.0    # 慢查询写日志的抽样比例
+    SQL_N_PLUS_ONE_THRESHOLD: int = 5          # 同一请求里同一语句执行到该次数记为疑似 N+1
+
+    # —— 语义检索（本地嵌入模型 + ChromaDB） ——
+    EMBEDDING_MODEL_DIR: str = Field("backend/gme-Qwen2-VL-7B-Instruct", env="EMBEDDING_MODEL_DIR")
+    VECTOR_INDEX_DIR: str = Field("data/chroma", env="VECTOR_INDEX_DIR")
+    # Chroma 服务地址（如 http://chroma:8000）：多进程部署时配置，所有进程经 HttpClient 读写同一个服务；
+    # 留空则用 VECTOR_INDEX_DIR 下的本地库，写入只由抢到写锁的一个进程执行（见 services.product_index）
+    VECTOR_INDEX_URL: str | None = Field(None, env="VECTOR_INDEX_URL")
+    EMBEDDING_BATCH_SIZE: int = 32             # 微批：凑满多少条文本立即推理
+    EMBEDDING_MAX_WAIT_MS: float = 5.0         # 微批：最多等待多少毫秒凑批
+    EMBEDDING_TIMEOUT: float = 60.0            # 单批推理超时（秒）
+    EMBEDDING_STARTUP_TIMEOUT: float = 600.0   # 常驻进程加载模型超时（秒）
+    EMBEDDING_CACHE_DIR: str | None = Field("data/embedding_cache", env="EMBEDDING_CACHE_DIR")  # 置空关闭磁盘嵌入缓存
+    EMBEDDING_CACHE_DTYPE: str = "float16"     # 缓存向量精度：float16 省一半磁盘，float32 无损
+    EMBEDDING_CACHE_MAX_MB: int = 2048         # 缓存文件超过该大小时压缩到一半
+
+    # —— HTTP 缓存 / 压缩 ——
+    CATALOG_CACHE_MAX_AGE: int = 60            # 商品 / 分类等公开目录接口的 Cache-Control max-age（秒）
+    COMPRESSION_MIN_SIZE: int = 1024           # 响应体超过该字节数才压缩
+
+    # —— 购物车（Redis + 异步写回 cart_items） ——
+    CART_TTL: int = 7 * 24 * 3600              # Redis 中购物车的过期时间（秒），过期后从数据库重新装载
+    CART_FLUSH_INTERVAL: float = 1.0           # 写回间隔（秒）
+    CART_FLUSH_BATCH: int = 500                # 每次写回的最大用户数
+
+    # —— 热点商品库存（Redis 预扣 + 批量写回） ——
+    INVENTORY_RESERVATION_TTL: int = 120       # 预扣有效期（秒），下单未完成则归还库存
+    INVENTORY_RECONCILE_INTERVAL: float = 1.0  # 写回数据库 / 回收过期预扣的间隔（秒）
+
+    # —— 异步下单流水线（事务性 outbox + worker 池） ——
+    OUTBOX_WORKERS: int = 4                    # 每个进程的 worker 数
+    OUTBOX_BATCH: int = 20                     # 每次认领的事件数
+    OUTBOX_POLL_INTERVAL: float = 0.5          # 没有事件时的轮询间隔（秒），本进程受理的订单会立即唤醒
+    OUTBOX_LEASE: int = 30                     # 认领租约（秒），worker 崩溃后事件在租约到期后重新投递
+    OUTBOX_MAX_ATTEMPTS: int = 8               # 超过后记为 dead
+    OUTBOX_RETENTION_HOURS: int = 24           # 已完成事件保留时长
+
+    # —— 销售统计 ——
+    ANALYTICS_TIMEZONE: str = "Asia/Shanghai"  # 按哪个时区的自然日统计
+
+    # —— 订单分区与冷数据归档（PostgreSQL） ——
+    ORDER_PARTITION_PREMAKE: int = 3           # 提前建好的未来月份分区数
+    ORDER_PARTITION_MAINTENANCE_INTERVAL: int = 21600  # 补建分区 / 自动归档的检查间隔（秒）
+    ORDER_ARCHIVE_AFTER_MONTHS: int = 0        # 早于 N 个整月的分区自动归档为 Parquet 后从库里删除；0 关闭
+    ORDER_ARCHIVE_DIR: str = Field("data/archive", env="ORDER_ARCHIVE_DIR")
+
+    # —— 混合检索（全文 + 向量，RRF 融合） ——
+    SEARCH_LEXICAL_TIMEOUT: float = 0.5        # 全文检索召回超时（秒），超时则只用向量结果
+    SEARCH_VECTOR_TIMEOUT: float = 0.8         # 向量召回超时（秒），超时则只用全文结果
+    SEARCH_RRF_K: int = 60
+
+    # —— 商品名联想 ——
+    SUGGEST_REFRESH_INTERVAL: int = 600        # 全量重建（刷新销量热度）间隔（秒）
+
+    # —— 限流（Redis 令牌桶；Redis 不可用时退化为进程内限流） ——
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_TRUST_FORWARDED: bool = False   # 部署在反向代理后面时开启，按 X-Forwarded-For 第一个地址限流
+    # 每条规则：路径前缀 + 可选方法；per 为 ip / user（未登录按 IP）；rate 为每秒令牌数，burst 为桶容量。
+    # 一个请求会同时受所有匹配规则的限制；环境变量里用 JSON 覆盖整张表
+    RATE_LIMIT_RULES: list[dict] = [
+        {"name": "ip", "path": "/", "per": "ip", "rate": 20, "burst": 60},
+        {"name": "user", "path": "/api", "per": "user", "rate": 10, "burst": 30},
+        {"name": "search", "path": "/api/products", "methods": ["GET"], "per": "ip", "rate": 5, "burst": 20},
+        {"name": "login", "path": "/api/auth", "methods": ["POST"], "per": "ip", "rate": 0.2, "burst": 10},
+        {"name": "chat", "path": "/api/chat", "per": "user", "rate": 0.1, "burst": 5},   # 每次对话两次 LLM 调用
+    ]
+
+    # —— 密码哈希（独立线程池） ——
+    PASSWORD_BCRYPT_ROUNDS: int = 12           # bcrypt 成本；调整后老哈希在用户下次登录时按新成本重算
+    PASSWORD_HASH_WORKERS: int = 4             # 哈希线程数（bcrypt 计算时释放 GIL，线程即可并行）
+    PASSWORD_HASH_QUEUE: int = 32              # 线程占满后允许排队的请求数，再多直接返回 429
 
     # —— JWT ——  
     JWT_SECRET_KEY: str = Field(..., env="JWT_SECRET_KEY")
@@ -26,6 +127,19 @@ class Settings(BaseSettings):
     BASE_URL: str | None = Field(None, env="BASE_URL")
     MODEL: str = Field("deepseek-reasoner", env="MODEL")
 
+    @model_validator(mode="after")
+    def _check_read_sticky(self) -> "Settings":
+        # 副本最多落后 DB_REPLICA_MAX_LAG 秒（两次健康检查之间还可能再多 DB_REPLICA_CHECK_INTERVAL 秒），
+        # 读己之写的窗口比它短时，用户刚写完仍可能从副本读到旧数据
+        if self.DB_READ_STICKY_SECONDS is None:
+            self.DB_READ_STICKY_SECONDS = self.DB_REPLICA_MAX_LAG + self.DB_REPLICA_CHECK_INTERVAL
+        elif self.DB_READ_STICKY_SECONDS < self.DB_REPLICA_MAX_LAG:
+            raise ValueError(
+                f"DB_READ_STICKY_SECONDS（{self.DB_READ_STICKY_SECONDS}）不能小于 "
+                f"DB_REPLICA_MAX_LAG（{self.DB_REPLICA_MAX_LAG}）"
+            )
+        return self
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -1,38 +1,247 @@
 # mcpshop/core/embedding.py
+"""
+本地嵌入模型客户端。
 
-import subprocess
+模型常驻在一个子进程里（见 core/embedding_worker.py），只在首次使用时加载一次；
+客户端在独立的 "embedding-io" 线程事件循环中管理该子进程，并做微批处理：
+并发的请求在 EMBEDDING_MAX_WAIT_MS 内、或凑满 EMBEDDING_BATCH_SIZE 条文本后合并成一次推理。
+
+- aembed()：给 FastAPI 事件循环用，await 期间不阻塞其它请求；
+- embed() / __call__()：同步接口，兼容 chromadb EmbeddingFunction 协议。
+子进程崩溃或超时会被杀掉，下一批请求自动重启。
+
+配置了 EMBEDDING_CACHE_DIR 时，先查磁盘嵌入缓存（core/embedding_cache.py），只有未命中的文本才送去推理。
+"""
+import asyncio
 import json
+import sys
+import threading
+from functools import lru_cache
+from pathlib import Path
 from chromadb.utils import embedding_functions
+from mcpshop.core.config import settings
+from mcpshop.core.embedding_cache import EmbeddingCache
+from mcpshop.core.logger import logger
+
+_WORKER_SCRIPT = Path(__file__).with_name("embedding_worker.py")
+_STREAM_LIMIT = 256 * 1024 * 1024     # 单行响应上限：一批向量序列化后可达数 MB
+
 
 class LocalQwenEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    def __init__(self, model_dir: str):
+    def __init__(
+        self,
+        model_dir: str,
+        batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        timeout: float = 60.0,
+        startup_timeout: float = 600.0,
+        cache: EmbeddingCache | None = None,
+    ):
         # model_dir 指向 backend/gme-Qwen2-VL-7B-Instruct 的根目录
         self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.cache = cache
+        self._start_lock = threading.Lock()
+        self._io_loop: asyncio.AbstractEventLoop | None = None
+        self._queue: asyncio.Queue | None = None
+        self._proc: asyncio.subprocess.Process | None = None
+        self._seq = 0
+
+    # ------------------------------------------------------------ #
+    # 对外接口
+    # ------------------------------------------------------------ #
+    async def aembed(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        if self.cache is None:
+            return await self._aembed_uncached(list(texts))
+        # get_many 可能增量加载其它进程追加的记录（读文件），放到线程里执行
+        cached = await asyncio.to_thread(self.cache.get_many, texts)
+        misses = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        fresh = await self._aembed_uncached(misses) if misses else []
+        if fresh:
+            await asyncio.to_thread(self.cache.put_many, misses, fresh)
+        return self._merge(texts, cached, misses, fresh)
 
     def embed(self, texts: list[str]) -> list[list[float]]:
-        """
-        调用本地模型脚本进行推理，假设你在 model_dir 下有一个 inference.py
-        接受 JSON 输入并返回 JSON 输出。
-        """
-        payload = json.dumps({"texts": texts})
-        # 以子进程方式调用，或换成你实际的推理接口
-        proc = subprocess.Popen(
-            ["python", f"{self.model_dir}/inference.py"],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(list(texts))
+        cached = self.cache.get_many(texts)
+        misses = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+        fresh = self._embed_uncached(misses) if misses else []
+        if fresh:
+            self.cache.put_many(misses, fresh)
+        return self._merge(texts, cached, misses, fresh)
+
+    def __call__(self, input: list[str]) -> list[list[float]]:
+        # chromadb EmbeddingFunction 协议
+        return self.embed(input)
+
+    def close(self) -> None:
+        """结束常驻子进程和 embedding-io 线程（应用关闭时调用）"""
+        with self._start_lock:
+            loop, self._io_loop = self._io_loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+
+    async def _aembed_uncached(self, texts: list[str]) -> list[list[float]]:
+        future = asyncio.run_coroutine_threadsafe(self._submit(texts), self._ensure_io_loop())
+        return await asyncio.wrap_future(future)
+
+    def _embed_uncached(self, texts: list[str]) -> list[list[float]]:
+        future = asyncio.run_coroutine_threadsafe(self._submit(texts), self._ensure_io_loop())
+        return future.result()
+
+    @staticmethod
+    def _merge(texts, cached, misses, fresh) -> list[list[float]]:
+        # 命中的向量是 memmap 视图，这里才转成 float 列表交给调用方
+        computed = dict(zip(misses, fresh))
+        return [
+            v.astype("float32").tolist() if v is not None else computed[t]
+            for t, v in zip(texts, cached)
+        ]
+
+    # ------------------------------------------------------------ #
+    # 微批处理（以下均运行在 embedding-io 线程的事件循环里）
+    # ------------------------------------------------------------ #
+    def _ensure_io_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._io_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="embedding-io", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._start_batcher(), loop).result()
+                self._io_loop = loop
+        return self._io_loop
+
+    async def _start_batcher(self) -> None:
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def _shutdown(self) -> None:
+        self._batcher.cancel()
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.stdin.close()        # 子进程读到 EOF 后自行退出
+            try:
+                await asyncio.wait_for(self._proc.wait(), 5)
+            except asyncio.TimeoutError:
+                self._proc.kill()
+        self._proc = None
+
+    async def _submit(self, texts: list[str]) -> list[list[float]]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _batch_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            count = len(batch[0][0])
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while count < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                count += len(item[0])
+            await self._run_batch(batch)
+
+    async def _run_batch(self, batch: list[tuple[list[str], asyncio.Future]]) -> None:
+        live = [(texts, fut) for texts, fut in batch if not fut.done()]
+        if not live:
+            return
+        try:
+            vectors = await self._request([t for texts, _ in live for t in texts])
+        except Exception as e:
+            for _, fut in live:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        offset = 0
+        for texts, fut in live:
+            if not fut.done():
+                fut.set_result(vectors[offset:offset + len(texts)])
+            offset += len(texts)
+
+    # ------------------------------------------------------------ #
+    # 常驻子进程
+    # ------------------------------------------------------------ #
+    async def _ensure_worker(self) -> asyncio.subprocess.Process:
+        if self._proc is not None and self._proc.returncode is None:
+            return self._proc
+        logger.info(f"[embedding] 启动常驻嵌入进程，加载模型：{self.model_dir}")
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, str(_WORKER_SCRIPT), "--model-dir", str(self.model_dir),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=_STREAM_LIMIT,
         )
-        out, err = proc.communicate(payload)
-        if proc.returncode != 0:
-            raise RuntimeError(f"嵌入模型调用失败：{err}")
-        result = json.loads(out)
+        try:
+            ready = await asyncio.wait_for(proc.stdout.readline(), self.startup_timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            raise RuntimeError("嵌入模型加载超时")
+        if not ready or not json.loads(ready).get("ready"):
+            proc.kill()
+            raise RuntimeError("嵌入进程启动失败，详见 stderr 日志")
+        self._proc = proc
+        return proc
+
+    async def _request(self, texts: list[str]) -> list[list[float]]:
+        proc = await self._ensure_worker()
+        self._seq += 1
+        line = json.dumps({"id": self._seq, "texts": texts}, ensure_ascii=False) + "\n"
+        try:
+            proc.stdin.write(line.encode("utf-8"))
+            await proc.stdin.drain()
+            raw = await asyncio.wait_for(proc.stdout.readline(), self.timeout)
+        except (asyncio.TimeoutError, OSError) as e:
+            # 超时或管道断开：杀掉子进程，下一批重新拉起
+            if proc.returncode is None:
+                proc.kill()
+            self._proc = None
+            raise RuntimeError(f"嵌入模型调用失败：{e!r}") from e
+        if not raw:
+            self._proc = None
+            raise RuntimeError("嵌入模型调用失败：嵌入进程意外退出")
+        result = json.loads(raw)
+        if "error" in result:
+            raise RuntimeError(f"嵌入模型调用失败：{result['error']}")
         return result["embeddings"]
 
-# 在你的 AIClient 初始化中：
-from mcpshop.core.embedding import LocalQwenEmbeddingFunction
-from mcpshop.core.config import settings
 
-self.embedding_fn = LocalQwenEmbeddingFunction(
-    model_dir=settings.BASE_DIR / "backend" / "gme-Qwen2-VL-7B-Instruct"
-)
+@lru_cache(maxsize=None)
+def get_embedding_function() -> LocalQwenEmbeddingFunction:
+    """
+    进程内共享的嵌入函数，模型目录取自 settings.EMBEDDING_MODEL_DIR
+    （默认指向 backend/gme-Qwen2-VL-7B-Instruct）。
+    EMBEDDING_CACHE_DIR 为空时不启用磁盘嵌入缓存。
+    构建缓存要扫描 vectors.bin 重建索引，应用启动时已在线程里调用过一次（见 main.on_startup）。
+    """
+    cache = None
+    if settings.EMBEDDING_CACHE_DIR:
+        cache = EmbeddingCache(
+            settings.EMBEDDING_CACHE_DIR,
+            model_id=Path(settings.EMBEDDING_MODEL_DIR).name,
+            dtype=settings.EMBEDDING_CACHE_DTYPE,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+        )
+    return LocalQwenEmbeddingFunction(
+        model_dir=settings.EMBEDDING_MODEL_DIR,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        max_wait_ms=settings.EMBEDDING_MAX_WAIT_MS,
+        timeout=settings.EMBEDDING_TIMEOUT,
+        startup_timeout=settings.EMBEDDING_STARTUP_TIMEOUT,
+        cache=cache,
+    )
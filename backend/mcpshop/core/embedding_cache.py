@@ -0,0 +1,210 @@
+# mcpshop/core/embedding_cache.py
+"""
+内容寻址的磁盘嵌入缓存。
+
+- key = blake2b(模型 id + 文本) 的 16 字节摘要，同一模型下相同文本只嵌入一次；
+- 所有向量存放在一个只追加的定长记录文件 vectors.bin 里，
+  每条记录 = 16 字节 key + dim 维 float16/float32 向量，一次 write 写完整条记录；
+- 文件以 numpy.memmap 映射，查询直接返回映射区上的视图（零拷贝），
+  内存里只常驻 key → 行号 的字典（每条约百字节）；
+- 重启后扫描记录头即可重建索引；其它进程追加的记录在未命中时按文件大小增量加载；
+- 文件超过 max_bytes 时做压缩：按最近访问保留一部分行，写新文件后原子替换。
+
+并发追加是安全的（单次 O_APPEND 写入）。压缩由 compact.lock 上的 flock 串行化：
+拿不到锁说明别的进程正在压缩，本次跳过；拿到锁后先按最新文件重新判断是否还需要压缩。
+临时文件名带进程号，多个进程不会写同一个临时文件。
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:         # Windows：没有 flock，压缩不加跨进程锁
+    fcntl = None
+
+_KEY_BYTES = 16
+
+
+@dataclass
+class EmbeddingCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0        # 命中时直接从缓存读出的向量字节数（免去的推理输出）
+    compactions: int = 0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        lookups = self.hits + self.misses
+        data["hit_rate"] = round(self.hits / lookups, 4) if lookups else 0.0
+        return data
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_id: str, dtype: str = "float16", max_bytes: int = 2 << 30):
+        self.dir = Path(directory)
+        self.model_id = model_id
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = max_bytes
+        self.stats = EmbeddingCacheStats()
+        self._lock = threading.Lock()
+        self._dim: int | None = None
+        self._record: np.dtype | None = None
+        self._mm: np.memmap | None = None
+        self._rows = 0                      # 已映射 / 已建索引的行数
+        self._inode: int | None = None
+        self._index: dict[bytes, int] = {}
+        self._last_access: dict[int, int] = {}
+        self._tick = 0
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._load_meta()
+
+    @property
+    def _data_path(self) -> Path:
+        return self.dir / "vectors.bin"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    @property
+    def _compact_lock_path(self) -> Path:
+        return self.dir / "compact.lock"
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.blake2b(digest_size=_KEY_BYTES)
+        h.update(self.model_id.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.digest()
+
+    # ------------------------------------------------------------ #
+    # 查询 / 写入
+    # ------------------------------------------------------------ #
+    def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """返回与 texts 对齐的向量视图列表，未命中为 None"""
+        keys = [self.key(t) for t in texts]
+        with self._lock:
+            if self._dim is None:
+                self.stats.misses += len(texts)
+                return [None] * len(texts)
+            if any(k not in self._index for k in keys):
+                self._refresh()             # 其它进程可能刚追加过
+            out: list[np.ndarray | None] = []
+            for k in keys:
+                row = self._index.get(k)
+                if row is not None and self._mm[row]["key"].tobytes() == k:
+                    self._tick += 1
+                    self._last_access[row] = self._tick
+                    self.stats.hits += 1
+                    self.stats.bytes_saved += self._dim * self.dtype.itemsize
+                    out.append(self._mm[row]["vec"])
+                else:
+                    self.stats.misses += 1
+                    out.append(None)
+            return out
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]) -> None:
+        if not texts:
+            return
+        with self._lock:
+            if self._dim is None:
+                self._init_layout(len(vectors[0]))
+            keys = [self.key(t) for t in texts]
+            fresh = [(k, v) for k, v in dict(zip(keys, vectors)).items() if k not in self._index]
+            if not fresh:
+                return
+            records = np.empty(len(fresh), dtype=self._record)
+            records["key"] = np.frombuffer(b"".join(k for k, _ in fresh), dtype=np.uint8).reshape(-1, _KEY_BYTES)
+            records["vec"] = np.asarray([v for _, v in fresh], dtype=self.dtype)
+            fd = os.open(self._data_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0))
+            try:
+                os.write(fd, records.tobytes())
+            finally:
+                os.close(fd)
+            self._refresh()
+            if self._data_path.stat().st_size > self.max_bytes:
+                self._compact_exclusive(keep_bytes=self.max_bytes // 2)
+
+    # ------------------------------------------------------------ #
+    # 文件布局 / 索引
+    # ------------------------------------------------------------ #
+    def _load_meta(self) -> None:
+        if not self._meta_path.exists():
+            return
+        meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        if meta.get("model_id") != self.model_id or meta.get("dtype") != self.dtype.name:
+            # 模型或精度变了，旧向量全部作废
+            self._data_path.unlink(missing_ok=True)
+            self._meta_path.unlink()
+            return
+        self._set_dim(meta["dim"])
+        self._refresh()
+
+    def _init_layout(self, dim: int) -> None:
+        self._set_dim(dim)
+        self._meta_path.write_text(
+            json.dumps({"model_id": self.model_id, "dtype": self.dtype.name, "dim": dim}),
+            encoding="utf-8",
+        )
+
+    def _set_dim(self, dim: int) -> None:
+        self._dim = dim
+        self._record = np.dtype([("key", np.uint8, (_KEY_BYTES,)), ("vec", self.dtype, (dim,))])
+
+    def _refresh(self) -> None:
+        """按文件当前大小重新映射，并为新增的行建立索引；文件被压缩替换过则整体重建"""
+        try:
+            st = self._data_path.stat()
+        except FileNotFoundError:
+            return
+        if self._inode is not None and st.st_ino != self._inode:
+            self._index.clear()
+            self._last_access.clear()
+            self._rows = 0
+        rows = st.st_size // self._record.itemsize
+        if rows == self._rows and self._inode == st.st_ino:
+            return
+        self._mm = np.memmap(self._data_path, dtype=self._record, mode="r", shape=(rows,)) if rows else None
+        for row in range(self._rows, rows):
+            self._index[self._mm[row]["key"].tobytes()] = row
+        self._rows = rows
+        self._inode = st.st_ino
+
+    def _compact_exclusive(self, keep_bytes: int) -> None:
+        """跨进程只允许一个压缩者；锁被占用时跳过（对方压缩完文件自然变小）"""
+        if fcntl is None:
+            self._compact(keep_bytes)
+            return
+        fd = os.open(self._compact_lock_path, os.O_WRONLY | os.O_CREAT)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            self._refresh()                 # 别的进程可能刚压缩完并替换了文件
+            if self._data_path.stat().st_size > self.max_bytes:
+                self._compact(keep_bytes)
+        finally:
+            os.close(fd)                    # 关闭即释放 flock
+
+    def _compact(self, keep_bytes: int) -> None:
+        """保留最近访问过的行（未访问过的按新旧），写临时文件后原子替换"""
+        keep = max(1, keep_bytes // self._record.itemsize)
+        order = sorted(range(self._rows), key=lambda r: (self._last_access.get(r, 0), r), reverse=True)
+        survivors = np.sort(np.asarray(order[:keep], dtype=np.int64))
+        tmp = self._data_path.with_suffix(f".{os.getpid()}.tmp")
+        self._mm[survivors].tofile(tmp)
+        self._mm = None
+        os.replace(tmp, self._data_path)
+        self._inode = None
+        self._index.clear()
+        self._last_access.clear()
+        self._rows = 0
+        self._refresh()
+        self.stats.compactions += 1
@@ -0,0 +1,60 @@
+# mcpshop/core/embedding_worker.py
+"""
+常驻嵌入进程，由 core.embedding.LocalQwenEmbeddingFunction 自动拉起，无需手动运行。
+
+模型只在启动时加载一次，之后通过 stdin / stdout 逐行 JSON 通信：
+    启动完成        → {"ready": true}
+    {"id": 1, "texts": [...]}  →  {"id": 1, "embeddings": [[...], ...]}
+                               或 {"id": 1, "error": "..."}
+stdin 关闭（父进程退出）时自动结束。
+
+本文件不依赖 mcpshop 包，父进程直接按文件路径启动它。
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def load_embedder(model_dir: str):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_dir, trust_remote_code=True)
+
+    def embed(texts: list[str]) -> list[list[float]]:
+        return model.encode(texts, normalize_embeddings=True, convert_to_numpy=True).tolist()
+
+    return embed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="常驻嵌入进程")
+    parser.add_argument("--model-dir", required=True)
+    args = parser.parse_args()
+
+    # 协议独占原 stdout；模型库里的 print 一律转到 stderr，避免污染协议
+    proto = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+
+    def send(msg: dict) -> None:
+        proto.write(json.dumps(msg, ensure_ascii=False) + "\n")
+        proto.flush()
+
+    embed = load_embedder(args.model_dir)
+    send({"ready": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        req_id = None
+        try:
+            req = json.loads(line)
+            req_id = req.get("id")
+            send({"id": req_id, "embeddings": embed(req["texts"])})
+        except Exception as e:
+            send({"id": req_id, "error": repr(e)})
+
+
+if __name__ == "__main__":
+    main()
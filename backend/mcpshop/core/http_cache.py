@@ -0,0 +1,181 @@
+# mcpshop/core/http_cache.py
+"""
+HTTP 缓存与压缩。
+
+HTTPCacheMiddleware（纯 ASGI，在 create_app 里注册）：
+- GET 的 200 响应按响应体计算强 ETag（路由已自带 ETag 时沿用）；
+- 请求带 If-None-Match（优先）或 If-Modified-Since 且未变化时直接回 304，不发响应体；
+- 带 Authorization 的请求若路由未声明 Cache-Control，默认 "private, no-cache"：
+  浏览器每次都回源验证，但配合 ETag 只需一个 304；
+- 超过 minimum_size 的文本类响应按 Accept-Encoding 协商 br（装了 brotli 时）或 gzip 压缩，
+  压缩后的 ETag 加编码后缀，保证不同表示的强 ETag 不同。
+流式响应（StreamingResponse，如导出接口）原样透传。
+
+路由侧：
+- cache_control(policy)：依赖项，为该路由声明 Cache-Control；
+- set_last_modified(response, *datetimes)：按数据的更新时间设置 Last-Modified。
+"""
+import asyncio
+import gzip
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from mcpshop.core.config import settings
+
+try:  # 可选依赖：brotli 压缩
+    import brotli
+except ImportError:  # pragma: no cover - 未安装时只用 gzip
+    brotli = None
+
+_COMPRESSIBLE = ("application/json", "text/", "application/javascript", "application/xml")
+_ENCODING_SUFFIX = {"br": "-br", "gzip": "-gz"}
+_OFFLOAD_SIZE = 256 * 1024      # 超过该大小的响应体放到线程里压缩，避免阻塞事件循环
+
+
+def cache_control(policy: str):
+    """路由依赖：声明 Cache-Control，如 Depends(cache_control("public, max-age=60"))"""
+    def _set(response: Response) -> None:
+        response.headers["Cache-Control"] = policy
+    return _set
+
+
+# 公开目录接口（商品 / 分类）的缓存策略：CDN 和浏览器可缓存，过期后凭 ETag 回源验证
+catalog_cache = cache_control(f"public, max-age={settings.CATALOG_CACHE_MAX_AGE}")
+
+
+def set_last_modified(response: Response, *moments: datetime | None) -> None:
+    """取各时间中最晚的一个作为 Last-Modified；SQLite 返回的无时区时间按 UTC 处理"""
+    moments = [m if m.tzinfo else m.replace(tzinfo=timezone.utc) for m in moments if m]
+    if moments:
+        response.headers["Last-Modified"] = format_datetime(max(moments).astimezone(timezone.utc), usegmt=True)
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _bare(etag: str) -> str:
+    """去掉弱校验前缀和压缩编码后缀，用于比较"""
+    etag = etag.strip().removeprefix("W/")
+    for suffix in _ENCODING_SUFFIX.values():
+        if etag.endswith(suffix + '"'):
+            return etag[: -len(suffix) - 1] + '"'
+    return etag
+
+
+def _not_modified(request: Headers, etag: str, last_modified: str | None) -> bool:
+    if_none_match = request.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        return _bare(etag) in {_bare(t) for t in if_none_match.split(",")}
+    if_modified_since = request.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _choose_encoding(accept_encoding: str) -> str | None:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        try:
+            q = float(params.strip().removeprefix("q=")) if params.strip().startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class HTTPCacheMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Headers(scope=scope)
+        start: Message | None = None
+        chunks: list[bytes] = []
+        streaming = False
+
+        async def buffered_send(message: Message) -> None:
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                # 流式响应：把已缓冲的部分发出去，之后原样透传
+                streaming = True
+                await send(start)
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+                return
+            await self._finish(scope, request, start, b"".join(chunks), send)
+
+        await self.app(scope, receive, buffered_send)
+
+    async def _finish(self, scope: Scope, request: Headers, start: Message, body: bytes, send: Send) -> None:
+        status = start["status"]
+        headers = MutableHeaders(raw=list(start["headers"]))
+        if "content-type" in headers:
+            headers.add_vary_header("Accept-Encoding")
+
+        if scope["method"] == "GET" and status == 200:
+            etag = headers.get("etag") or strong_etag(body)
+            headers["ETag"] = etag
+            if "cache-control" not in headers and "authorization" in request:
+                headers["Cache-Control"] = "private, no-cache"
+            if _not_modified(request, etag, headers.get("last-modified")):
+                for name in ("content-length", "content-type"):
+                    if name in headers:
+                        del headers[name]
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        encoding = None
+        if (
+            len(body) >= self.minimum_size
+            and "content-encoding" not in headers
+            and headers.get("content-type", "").startswith(_COMPRESSIBLE)
+        ):
+            encoding = _choose_encoding(request.get("accept-encoding", ""))
+        if encoding is not None:
+            body = (
+                await asyncio.to_thread(self._compress, body, encoding) if len(body) > _OFFLOAD_SIZE
+                else self._compress(body, encoding)
+            )
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and etag.endswith('"'):
+                headers["ETag"] = etag[:-1] + _ENCODING_SUFFIX[encoding] + '"'
+
+        await send({"type": "http.response.start", "status": status, "headers": headers.raw})
+        await send({"type": "http.response.body", "body": body})
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
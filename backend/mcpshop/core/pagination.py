@@ -0,0 +1,96 @@
+# mcpshop/core/pagination.py
+"""
+Keyset（游标）分页工具。
+
+游标是「排序方式 + 上一页最后一行的排序键值」JSON 序列化后 base64url 编码的不透明字符串，
+例如订单列表的 ("orders", [created_at, order_id])。解析时核对排序方式和各键值的类型，
+换了排序方式或被篡改的游标一律视为无效（接口返回 400），不会把错误类型的值绑定进 SQL。翻页条件为 (k1, k2, ...) < (v1, v2, ...)，
+配合同序的复合索引，每页开销与翻到第几页无关，也不会因为中途插入数据而重复/漏行。
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Sequence
+
+from sqlalchemy import DateTime, Integer, Numeric, String, literal, tuple_
+from sqlalchemy.sql import Select
+
+
+def encode_cursor(values: Sequence[Any], scope: str = "") -> str:
+    """scope 为排序方式（如 "products:price_asc"），解析时必须一致"""
+    raw = json.dumps(
+        {"s": scope, "v": [v.isoformat() if isinstance(v, datetime) else v for v in values]},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _typed(key, value: Any) -> Any:
+    """按排序键的列类型校验 / 还原游标里的值；类型不符时抛出 ValueError"""
+    t = key.type
+    if isinstance(t, DateTime):
+        if not isinstance(value, str):
+            raise ValueError
+        return datetime.fromisoformat(value)
+    if isinstance(value, bool) or value is None:
+        raise ValueError
+    if isinstance(t, Integer):
+        ok = isinstance(value, int)
+    elif isinstance(t, Numeric):
+        ok = isinstance(value, (int, float))
+    elif isinstance(t, String):
+        ok = isinstance(value, str)
+    else:
+        ok = isinstance(value, (int, float, str))
+    if not ok:
+        raise ValueError
+    return value
+
+
+def decode_cursor(cursor: str, keys: Sequence, scope: str = "") -> list[Any]:
+    """解析游标；格式不对、排序方式不同、个数或类型与排序键不符时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except ValueError as e:     # binascii.Error / JSONDecodeError / UnicodeDecodeError
+        raise ValueError("无效的分页游标") from e
+    if not isinstance(payload, dict) or payload.get("s") != scope:
+        raise ValueError("无效的分页游标")
+    values = payload.get("v")
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError("无效的分页游标")
+    try:
+        return [_typed(k, v) for k, v in zip(keys, values)]
+    except ValueError as e:
+        raise ValueError("无效的分页游标") from e
+
+
+def apply_keyset(stmt: Select, keys: Sequence, cursor: str | None, descending: bool = True,
+                 scope: str = "") -> Select:
+    """
+    给查询加上游标条件和排序。keys 为排序键（最后一个必须唯一，通常是主键），
+    所有键同向排序，才能用行值比较一次性表达「排在游标之后」。
+    scope 标识排序方式，须与生成游标时传给 paginate 的一致。
+    """
+    if cursor:
+        values = decode_cursor(cursor, keys, scope)
+        row = tuple_(*keys)
+        bound = tuple_(*(literal(v, type_=k.type) for k, v in zip(keys, values)))
+        stmt = stmt.where(row < bound if descending else row > bound)
+        # 行值比较用不上分区裁剪，再对第一个键单独加一个等价的范围条件
+        first = literal(values[0], type_=keys[0].type)
+        stmt = stmt.where(keys[0] <= first if descending else keys[0] >= first)
+    return stmt.order_by(*(k.desc() if descending else k.asc() for k in keys))
+
+
+def paginate(rows: Sequence, limit: int, key_of: Callable[[Any], Sequence[Any]],
+             scope: str = "") -> tuple[list, str | None]:
+    """
+    rows 为按 limit + 1 条取回的结果：多出来的一行说明还有下一页，
+    此时用本页最后一行的键值生成 next_cursor。
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key_of(rows[-1]), scope)
@@ -0,0 +1,138 @@
+# mcpshop/core/passwords.py
+"""
+密码哈希 / 校验放到独立的有界线程池里执行，不阻塞事件循环。
+
+- bcrypt 每次 100~300ms，计算期间释放 GIL，线程池即可并行，不必用进程池；
+- 执行中 + 排队中的任务达到 PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE 时直接抛出
+  PasswordHasherBusy（接口返回 429），登录洪峰时不会把所有请求越堆越久；
+- verify_and_update：哈希成本与 PASSWORD_BCRYPT_ROUNDS 不一致时，顺带返回按新成本重算的哈希，
+  由调用方写回（登录时透明升级 / 降级成本）；
+- stats 记录排队等待和计算耗时（最近一段时间的分位数）、拒绝次数、重算次数。
+"""
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from mcpshop.core.config import settings
+from mcpshop.core.security import pwd_context
+
+
+class PasswordHasherBusy(RuntimeError):
+    """哈希线程池排队已满"""
+
+
+class LatencyWindow:
+    """最近 size 次耗时（毫秒）的滑动窗口"""
+
+    def __init__(self, size: int = 1024):
+        self._samples: deque[float] = deque(maxlen=size)
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        self._samples.append(ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def as_dict(self) -> dict:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": round(self.max_ms, 2)}
+
+        def pct(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+        return {
+            "avg": round(sum(samples) / len(samples), 2),
+            "p50": pct(0.5),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": round(self.max_ms, 2),
+        }
+
+
+@dataclass
+class PasswordHashStats:
+    hashes: int = 0
+    verifies: int = 0
+    rehashed: int = 0           # 登录时按新成本重算的次数
+    rejected: int = 0           # 排队已满被拒（429）
+    in_flight: int = 0          # 当前执行中 + 排队中
+    peak_in_flight: int = 0
+    wait_ms: LatencyWindow = field(default_factory=LatencyWindow)      # 提交到开始计算
+    compute_ms: LatencyWindow = field(default_factory=LatencyWindow)   # bcrypt 本身
+
+    def as_dict(self) -> dict:
+        return {
+            "hashes": self.hashes,
+            "verifies": self.verifies,
+            "rehashed": self.rehashed,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "rounds": settings.PASSWORD_BCRYPT_ROUNDS,
+            "wait_ms": self.wait_ms.as_dict(),
+            "compute_ms": self.compute_ms.as_dict(),
+        }
+
+
+class PasswordHasher:
+    def __init__(self, workers: int, queue: int):
+        self.workers = workers
+        self.limit = workers + queue
+        self.stats = PasswordHashStats()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    def _release(self) -> None:
+        self.stats.in_flight -= 1
+
+    async def _run(self, fn, *args):
+        if self.stats.in_flight >= self.limit:
+            self.stats.rejected += 1
+            raise PasswordHasherBusy("登录 / 注册请求过多，请稍后重试")
+        self.stats.in_flight += 1
+        self.stats.peak_in_flight = max(self.stats.peak_in_flight, self.stats.in_flight)
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            return fn(*args), started, time.perf_counter()
+
+        loop = asyncio.get_running_loop()
+        future = self._pool().submit(timed)
+        # 任务真正结束（或排队中被取消）才释放名额：请求断开时线程可能还在算
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        result, started, finished = await asyncio.wrap_future(future)
+        self.stats.wait_ms.add((started - submitted) * 1000)
+        self.stats.compute_ms.add((finished - started) * 1000)
+        return result
+
+    async def hash(self, password: str) -> str:
+        self.stats.hashes += 1
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        """哈希格式无法识别时抛出 ValueError"""
+        self.stats.verifies += 1
+        return await self._run(pwd_context.verify, password, hashed)
+
+    async def verify_and_update(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """校验密码；成本需要更新时第二项为新哈希。哈希格式无法识别时抛出 ValueError"""
+        self.stats.verifies += 1
+        ok, new_hash = await self._run(pwd_context.verify_and_update, password, hashed)
+        if new_hash:
+            self.stats.rehashed += 1
+        return ok, new_hash
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE)
@@ -0,0 +1,219 @@
+# mcpshop/core/rate_limit.py
+"""
+限流 / 准入控制：Redis 令牌桶，所有 worker 共享额度。
+
+- 规则见 settings.RATE_LIMIT_RULES：按路径前缀 + 方法匹配，每条规则一个桶，
+  per="ip" 按客户端 IP，per="user" 按登录用户（未登录退化为 IP）；
+  rate 为每秒补充的令牌数，burst 为桶容量（允许的突发量）；
+- 一个请求命中的所有规则在一次 Lua 调用里检查：任何一个桶不够就都不扣，返回最长的等待时间；
+  时间取 Redis 的 TIME，多台机器时钟不一致也不影响；
+- 超限返回 429 + Retry-After（WebSocket 握手直接拒绝）；
+- Redis 不可用时退化为进程内令牌桶（每个 worker 各自计数，实际额度 × worker 数），
+  出错后 REDIS_RETRY_INTERVAL 秒内不再访问 Redis。
+
+RateLimitMiddleware 为纯 ASGI 中间件，在 create_app 里注册；
+WebSocket 里逐条消息计费的接口（如 chat）直接调用 rate_limiter.hit。
+"""
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from jose import JWTError
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from mcpshop.core.cache import REDIS_RETRY_INTERVAL
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.core.security import token_cache
+
+# KEYS：各个桶；ARGV：每个桶两个参数（每毫秒补充的令牌数、容量）。返回 0 放行，否则为需要等待的毫秒数
+_ACQUIRE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tokens = {}
+local wait = 0
+for i = 1, #KEYS do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local burst = tonumber(ARGV[2 * i])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local level = tonumber(b[1])
+  local ts = tonumber(b[2])
+  if level == nil then
+    level = burst
+    ts = now
+  end
+  level = math.min(burst, level + math.max(0, now - ts) * rate)
+  tokens[i] = level
+  if level < 1 then
+    wait = math.max(wait, math.ceil((1 - level) / rate))
+  end
+end
+if wait > 0 then
+  return wait
+end
+for i = 1, #KEYS do
+  local rate = tonumber(ARGV[2 * i - 1])
+  local burst = tonumber(ARGV[2 * i])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i] - 1), 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil(burst / rate) + 1000)
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    path: str                       # 路径前缀，"/" 匹配全部
+    rate: float                     # 每秒补充的令牌数
+    burst: int                      # 桶容量
+    per: str = "ip"                 # "ip" / "user"
+    methods: frozenset[str] | None = None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        prefix = self.path.rstrip("/")
+        return not prefix or path == prefix or path.startswith(prefix + "/")
+
+
+def parse_rules(raw: list[dict]) -> list[RateLimitRule]:
+    rules = []
+    for r in raw:
+        if r.get("per", "ip") not in ("ip", "user"):
+            raise ValueError(f"限流规则 {r.get('name')} 的 per 只能是 ip 或 user")
+        rules.append(RateLimitRule(
+            name=r["name"],
+            path=r["path"],
+            rate=float(r["rate"]),
+            burst=int(r["burst"]),
+            per=r.get("per", "ip"),
+            methods=frozenset(m.upper() for m in r["methods"]) if r.get("methods") else None,
+        ))
+    return rules
+
+
+def user_key(username: str) -> str:
+    return f"u:{username}"
+
+
+def client_ip(scope: Scope, headers: Headers) -> str:
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def _principal(headers: Headers) -> str | None:
+    """Authorization: Bearer 里的用户名（走已验签 token 缓存，不查库）；没有或无效时返回 None"""
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return token_cache.subject(token)
+    except JWTError:
+        return None
+
+
+class RateLimiter:
+    def __init__(self, rules: list[RateLimitRule], local_maxsize: int = 100_000):
+        self.rules = rules
+        self._by_name = {r.name: r for r in rules}
+        self.local_maxsize = local_maxsize
+        self._local: OrderedDict[str, tuple[float, float]] = OrderedDict()    # key -> (令牌数, 时间)
+        self._script = None
+        self._redis_retry_at = 0.0
+
+    def match(self, method: str, path: str) -> list[RateLimitRule]:
+        return [r for r in self.rules if r.matches(method, path)]
+
+    async def acquire(self, buckets: list[tuple[RateLimitRule, str]]) -> float:
+        """
+        buckets 为 [(规则, 身份)]，全部有令牌时各扣一个并返回 0，
+        否则什么都不扣，返回需要等待的秒数。
+        """
+        if not buckets:
+            return 0.0
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                return await self._acquire_redis(buckets)
+            except REDIS_ERRORS as e:
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_INTERVAL
+                self._script = None
+                logger.warning(f"[rate_limit] Redis 不可用，{REDIS_RETRY_INTERVAL} 秒内改用进程内限流：{e}")
+        return self._acquire_local(buckets)
+
+    async def hit(self, rule_name: str, identity: str) -> float:
+        """按名称对单条规则计费（未配置该规则时直接放行）"""
+        rule = self._by_name.get(rule_name)
+        return await self.acquire([(rule, identity)]) if rule else 0.0
+
+    async def _acquire_redis(self, buckets: list[tuple[RateLimitRule, str]]) -> float:
+        if self._script is None:
+            self._script = get_redis().register_script(_ACQUIRE_LUA)
+        args = []
+        for rule, _ in buckets:
+            args += [rule.rate / 1000, rule.burst]
+        wait_ms = await self._script(keys=[f"rl:{rule.name}:{identity}" for rule, identity in buckets], args=args)
+        return int(wait_ms) / 1000
+
+    def _acquire_local(self, buckets: list[tuple[RateLimitRule, str]]) -> float:
+        now = time.monotonic()
+        levels = []
+        wait = 0.0
+        for rule, identity in buckets:
+            level, ts = self._local.get(f"{rule.name}:{identity}", (rule.burst, now))
+            level = min(rule.burst, level + (now - ts) * rule.rate)
+            levels.append(level)
+            if level < 1:
+                wait = max(wait, (1 - level) / rule.rate)
+        if wait > 0:
+            return wait
+        for (rule, identity), level in zip(buckets, levels):
+            key = f"{rule.name}:{identity}"
+            self._local[key] = (level - 1, now)
+            self._local.move_to_end(key)
+        while len(self._local) > self.local_maxsize:
+            self._local.popitem(last=False)
+        return 0.0
+
+
+rate_limiter = RateLimiter(parse_rules(settings.RATE_LIMIT_RULES))
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket") or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        rules = self.limiter.match(scope.get("method", "GET"), scope["path"])
+        if rules:
+            headers = Headers(scope=scope)
+            ip = client_ip(scope, headers)
+            username = _principal(headers) if any(r.per == "user" for r in rules) else None
+            identities = [
+                (r, user_key(username) if r.per == "user" and username else f"ip:{ip}") for r in rules
+            ]
+            wait = await self.limiter.acquire(identities)
+            if wait > 0:
+                if scope["type"] == "websocket":
+                    await send({"type": "websocket.close", "code": 1008, "reason": "rate limited"})
+                    return
+                response = JSONResponse(
+                    {"detail": "请求过于频繁，请稍后重试"},
+                    status_code=429,
+                    headers={"Retry-After": str(max(1, math.ceil(wait)))},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,34 @@
+# mcpshop/core/redis.py
+"""
+进程级共享的异步 Redis 客户端。
+
+redis.asyncio 自带连接池，整个进程复用一个客户端即可；首次使用时才建立连接。
+超时设置得较短：缓存、限流等调用方都会在 Redis 不可用时降级，而不是卡住请求。
+"""
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from mcpshop.core.config import settings
+
+# 调用方捕获这些异常后降级处理
+REDIS_ERRORS = (RedisError, OSError)
+
+_client: Redis | None = None
+
+
+def get_redis() -> Redis:
+    global _client
+    if _client is None:
+        _client = Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
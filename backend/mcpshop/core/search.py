@@ -0,0 +1,93 @@
+# mcpshop/core/search.py
+"""
+商品全文检索用的分词工具。
+
+Postgres 的 to_tsvector('simple', ...) 只会按空白/标点切词，中文整句会被当成一个词。
+因此在应用层先把 name + description 切好词，用空格拼接后写进 Product.search_text，
+数据库只需在这一列上建 GIN(tsvector) 索引即可。
+
+装了 jieba 时使用 jieba 搜索引擎模式分词；否则退化为「CJK 单字 + 二元组」切分，
+召回率稍低但无需额外依赖。
+"""
+import re
+
+try:  # 可选依赖：中文分词
+    import jieba
+except ImportError:  # pragma: no cover - 未安装时走二元组切分
+    jieba = None
+
+_CJK = "\u3400-\u9fff\uf900-\ufaff"
+_CJK_RE = re.compile(f"[{_CJK}]+")
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[0-9a-z]+")
+
+# 允许的排序方式（api / mcp 工具共用）
+SORT_OPTIONS = ("relevance", "price_asc", "price_desc", "newest")
+# 检索模式：lexical 只走全文检索；hybrid 全文 + 向量并发召回，RRF 融合排序
+SEARCH_MODES = ("lexical", "hybrid")
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[str]:
+    """RRF：score(d) = Σ 1 / (k + rank)，rank 从 1 开始；返回按融合分降序的 id"""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+def _cut_cjk(chunk: str, for_query: bool) -> list[str]:
+    if jieba is not None:
+        return [w for w in jieba.cut_for_search(chunk) if w.strip()]
+    if len(chunk) == 1:
+        return [chunk]
+    bigrams = [chunk[i:i + 2] for i in range(len(chunk) - 1)]
+    # 建索引时额外写入单字，保证单字查询也能命中；查询时只用二元组，结果更精确
+    return bigrams if for_query else list(chunk) + bigrams
+
+
+def tokenize(text: str | None, for_query: bool = False) -> list[str]:
+    """
+    将文本切成小写词列表（去重、保持顺序）。
+    英文/数字按连续字母数字切分，中文按上面的策略切分。
+    """
+    if not text:
+        return []
+    tokens: list[str] = []
+    for chunk in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.fullmatch(chunk):
+            tokens.extend(_cut_cjk(chunk, for_query))
+        else:
+            tokens.append(chunk)
+    return list(dict.fromkeys(tokens))
+
+
+def token_starts(text: str) -> list[int]:
+    """
+    text（已小写）里每个词的起始下标，供前缀联想从词首开始匹配。
+    中文优先用 jieba 的词边界，没有 jieba 时每个汉字都算词首。
+    """
+    starts: list[int] = []
+    for m in _TOKEN_RE.finditer(text):
+        chunk = m.group()
+        if not _CJK_RE.fullmatch(chunk):
+            starts.append(m.start())
+        elif jieba is not None:
+            starts.extend(m.start() + begin for _, begin, _ in jieba.tokenize(chunk))
+        else:
+            starts.extend(range(m.start(), m.end()))
+    return list(dict.fromkeys(starts))
+
+
+def build_search_text(name: str | None, description: str | None) -> str:
+    """生成写入 Product.search_text 的分词结果（空格分隔）"""
+    return " ".join(tokenize(f"{name or ''} {description or ''}"))
+
+
+def build_tsquery(tokens: list[str]) -> str:
+    """
+    把查询词拼成 to_tsquery 表达式：各词 AND，最后一个词做前缀匹配，
+    方便边输边搜。tokens 只包含字母数字 / CJK，无需额外转义。
+    """
+    if not tokens:
+        return ""
+    return " & ".join(tokens[:-1] + [f"{tokens[-1]}:*"])
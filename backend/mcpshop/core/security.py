@@ -1,23 +1,32 @@
 # mcpshop/core/security.py
 
 from mcpshop.core.config import settings
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
-# 密码哈希上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 密码哈希上下文：成本不等于 PASSWORD_BCRYPT_ROUNDS 的哈希视为需要更新（verify_and_update 会重算）
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__min_desired_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+    bcrypt__max_desired_rounds=settings.PASSWORD_BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    验证明文与哈希密码是否匹配
+    验证明文与哈希密码是否匹配（同步、耗时上百毫秒；请求里用 core.passwords.password_hasher）
     """
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     """
-    将明文密码哈希后返回
+    将明文密码哈希后返回（同步；请求里用 core.passwords.password_hasher）
     """
     return pwd_context.hash(password)
 
@@ -61,3 +70,36 @@ def decode_access_token(token: str) -> str:
     except JWTError as e:
         # 可以在这里统一抛出自定义认证异常
         raise
+
+
+class VerifiedTokenCache:
+    """
+    已验签 token 的进程内 LRU：key 为 token 的 sha256，值为 sub，条目在 token 的 exp 时过期。
+    命中时省掉验签和解析；不缓存无效 token。
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[float, str]] = OrderedDict()
+
+    def subject(self, token: str) -> str:
+        """同 decode_access_token：无效或过期时抛出 JWTError"""
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        subject = payload.get("sub")
+        if subject is None:
+            raise JWTError("Token payload missing 'sub'")
+        if payload.get("exp") is not None:
+            self._entries[key] = (float(payload["exp"]), subject)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return subject
+
+
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_MAXSIZE)
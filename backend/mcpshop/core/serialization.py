@@ -0,0 +1,46 @@
+# mcpshop/core/serialization.py
+"""
+读接口的快速序列化路径（商品 / 订单 / 购物车列表）。
+
+- 查询只选响应模型需要的列，拿 Core Row 而不是 ORM 实体（见 crud 里的 *_OUT_COLUMNS）；
+- 路由模块里预先构建 TypeAdapter，from_attributes 校验 Row / ORM 对象 / dict 都可以；
+- dump_response 校验后 dump_python 交给 orjson 编码；未安装 orjson 时用 pydantic 自带的 dump_json。
+路由仍声明 response_model（生成 OpenAPI 文档），返回 Response 实例时 FastAPI 不再重复校验和编码。
+默认路径（校验 → 转成 JSON 兼容的 dict → json.dumps）的对比见 scripts.bench_serialization。
+"""
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:          # 可选依赖：没有就用 pydantic 编码
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """orjson 编码的 JSONResponse；content 已经是 bytes 时原样输出"""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        if orjson is None:
+            return super().render(content)
+        # OPT_UTC_Z：UTC 时间输出为 ...Z，与 pydantic 默认编码一致
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+
+def dump_response(adapter: TypeAdapter, data: Any, response: Response | None = None,
+                  status_code: int = 200) -> FastJSONResponse:
+    """
+    按 adapter 校验 data 并编码为 JSON 响应。
+    response 为路由注入的 Response：依赖项在上面设置的响应头（如 Cache-Control）一并带上。
+    """
+    value = adapter.validate_python(data, from_attributes=True)
+    content = adapter.dump_python(value) if orjson is not None else adapter.dump_json(value)
+    out = FastJSONResponse(content, status_code=status_code)
+    if response is not None:
+        out.raw_headers.extend(response.raw_headers)
+    return out
@@ -0,0 +1,203 @@
+# mcpshop/core/sql_metrics.py
+"""
+按请求统计 SQL：语句数、数据库总耗时、最慢的几条，疑似 N+1 和慢查询日志。
+
+- instrument_engine(engine)：在引擎上挂 before/after_cursor_execute 事件（db.session 对主库和副本调用）；
+  语句计入当前请求（contextvar，SQLAlchemy 的 greenlet 会沿用调用方的上下文），请求外的执行只参与慢查询日志；
+- SQLMetricsMiddleware（纯 ASGI，在 create_app 里注册）：每个 HTTP 请求开一份统计，
+  响应头带 Server-Timing: db;dur=12.3;desc="5 queries"（只含响应头发出之前的查询），
+  请求结束后按「方法 + 路由模板」汇总到 sql_metrics，管理员接口查看；
+- 同一请求里同一条语句（参数不同也算）执行 SQL_N_PLUS_ONE_THRESHOLD 次以上记为疑似 N+1，
+  每个路由 + 语句只打一次日志，次数照常计入统计；
+- 超过 SQL_SLOW_QUERY_MS 的语句按 SQL_SLOW_QUERY_SAMPLE_RATE 抽样记日志，
+  参数只记指纹（类型 + 短哈希），相同参数的慢查询可以对上号，又不会把取值写进日志。
+"""
+import hashlib
+import random
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.core.passwords import LatencyWindow
+
+_SLOWEST_KEPT = 3           # 每个请求 / 路由保留的最慢语句条数
+_STATEMENT_PREVIEW = 300    # 日志和统计里语句截断的长度
+
+
+def _compact(statement: str) -> str:
+    return " ".join(statement.split())[:_STATEMENT_PREVIEW]
+
+
+def param_fingerprint(parameters, executemany: bool = False) -> str:
+    """绑定参数的指纹：各参数的类型 + 取值的短哈希，如 "str,int#1a2b3c4d"；executemany 前缀行数"""
+    if executemany:
+        rows = list(parameters or ())
+        return f"{len(rows)}x[{param_fingerprint(rows[0]) if rows else ''}]"
+    if isinstance(parameters, dict):
+        types = ",".join(f"{k}:{type(v).__name__}" for k, v in parameters.items())
+    else:
+        types = ",".join(type(v).__name__ for v in (parameters or ()))
+    digest = hashlib.blake2b(repr(parameters).encode(), digest_size=4).hexdigest()
+    return f"{types}#{digest}"
+
+
+@dataclass
+class RequestSQL:
+    """一个请求内的 SQL 统计"""
+    path: str = ""
+    count: int = 0
+    total_ms: float = 0.0
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+    statements: Counter = field(default_factory=Counter)
+
+    def add(self, statement: str, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        self.statements[statement] += 1
+        if len(self.slowest) < _SLOWEST_KEPT or ms > self.slowest[-1][0]:
+            self.slowest.append((ms, statement))
+            self.slowest.sort(key=lambda s: s[0], reverse=True)
+            del self.slowest[_SLOWEST_KEPT:]
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        return [(s, n) for s, n in self.statements.items() if n >= threshold]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total_ms:.1f};desc="{self.count} queries"'
+
+
+_current: ContextVar[RequestSQL | None] = ContextVar("request_sql", default=None)
+
+
+@dataclass
+class RouteSQLStats:
+    requests: int = 0
+    queries: int = 0
+    max_queries: int = 0
+    n_plus_one: int = 0             # 出现疑似 N+1 的请求数
+    db_ms: LatencyWindow = field(default_factory=LatencyWindow)
+    slowest: list[tuple[float, str]] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "avg_queries": round(self.queries / self.requests, 2) if self.requests else 0.0,
+            "max_queries": self.max_queries,
+            "n_plus_one": self.n_plus_one,
+            "db_ms": self.db_ms.as_dict(),
+            "slowest": [{"ms": round(ms, 2), "statement": _compact(s)} for ms, s in self.slowest],
+        }
+
+
+class SQLMetrics:
+    def __init__(self, max_routes: int = 500, max_flagged: int = 10_000):
+        self.routes: dict[str, RouteSQLStats] = {}
+        self.slow_queries = 0
+        self.max_routes = max_routes
+        self.max_flagged = max_flagged
+        self._flagged: set[tuple[str, str]] = set()     # 已打过 N+1 日志的（路由, 语句）
+
+    def record(self, route: str, req: RequestSQL) -> None:
+        stats = self.routes.get(route)
+        if stats is None:
+            if len(self.routes) >= self.max_routes:
+                return
+            stats = self.routes[route] = RouteSQLStats()
+        stats.requests += 1
+        stats.queries += req.count
+        stats.max_queries = max(stats.max_queries, req.count)
+        stats.db_ms.add(req.total_ms)
+        merged = sorted(stats.slowest + req.slowest, key=lambda s: s[0], reverse=True)
+        stats.slowest = merged[:_SLOWEST_KEPT]
+
+        repeated = req.repeated(settings.SQL_N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            stats.n_plus_one += 1
+        for statement, n in repeated:
+            key = (route, statement)
+            if key in self._flagged or len(self._flagged) >= self.max_flagged:
+                continue
+            self._flagged.add(key)
+            logger.warning(f"[sql] {route} 疑似 N+1：同一语句在一个请求里执行了 {n} 次：{_compact(statement)}")
+
+    def as_dict(self) -> dict:
+        routes = sorted(self.routes.items(), key=lambda kv: kv[1].queries, reverse=True)
+        return {
+            "slow_queries": self.slow_queries,
+            "routes": {route: stats.as_dict() for route, stats in routes},
+        }
+
+    def reset(self) -> None:
+        self.routes.clear()
+        self.slow_queries = 0
+        self._flagged.clear()
+
+
+sql_metrics = SQLMetrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._sql_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_sql_started", None)
+    if started is None:
+        return
+    ms = (time.perf_counter() - started) * 1000
+    req = _current.get()
+    if req is not None:
+        req.add(statement, ms)
+    if ms >= settings.SQL_SLOW_QUERY_MS:
+        sql_metrics.slow_queries += 1
+        if random.random() < settings.SQL_SLOW_QUERY_SAMPLE_RATE:
+            where = f" {req.path}" if req is not None else ""
+            logger.warning(
+                f"[sql] 慢查询 {ms:.1f}ms{where} params={param_fingerprint(parameters, executemany)}："
+                f"{_compact(statement)}"
+            )
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """给引擎挂上统计事件（重复调用无副作用）"""
+    target = engine.sync_engine
+    if not event.contains(target, "before_cursor_execute", _before_cursor_execute):
+        event.listen(target, "before_cursor_execute", _before_cursor_execute)
+        event.listen(target, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_name(scope: Scope) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', None) or '(unmatched)'}"
+
+
+class SQLMetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.SQL_METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        req = RequestSQL(path=scope["path"])
+        token = _current.set(req)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", req.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            sql_metrics.record(_route_name(scope), req)
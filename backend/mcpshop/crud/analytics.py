@@ -0,0 +1,280 @@
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import case, delete, func, insert, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.config import settings
+from mcpshop.models.order import Order, OrderStatus
+from mcpshop.models.order_item import OrderItem
+from mcpshop.models.outbox import OutboxEvent
+from mcpshop.models.product import Product
+from mcpshop.models.sales import CustomerValue, SalesDaily, SalesSkuDaily
+from mcpshop.models.user import User
+
+# 计入销售统计的订单状态
+SALE_STATUSES = (OrderStatus.PAID, OrderStatus.SHIPPED)
+SKU_RANKINGS = ("revenue", "units")
+
+_TZ = ZoneInfo(settings.ANALYTICS_TIMEZONE)
+_COUNTERS = ("orders", "units", "revenue_cents")
+
+
+def sale_day(moment: datetime) -> date:
+    """统计日期：ANALYTICS_TIMEZONE 的自然日；SQLite 返回的无时区时间按 UTC 处理"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(_TZ).date()
+
+
+def today() -> date:
+    return sale_day(datetime.now(timezone.utc))
+
+
+def _upsert(db: AsyncSession, model, keys: list[str]):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE：计数列累加"""
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    table = model.__table__
+    stmt = dialect.insert(table)
+    set_ = {c: table.c[c] + stmt.excluded[c] for c in _COUNTERS}
+    if model is CustomerValue:
+        set_["first_order_at"] = case(
+            (table.c.first_order_at.is_(None), stmt.excluded.first_order_at),
+            (stmt.excluded.first_order_at < table.c.first_order_at, stmt.excluded.first_order_at),
+            else_=table.c.first_order_at,
+        )
+        set_["last_order_at"] = case(
+            (table.c.last_order_at.is_(None), stmt.excluded.last_order_at),
+            (stmt.excluded.last_order_at > table.c.last_order_at, stmt.excluded.last_order_at),
+            else_=table.c.last_order_at,
+        )
+    return stmt.on_conflict_do_update(index_elements=[table.c[k] for k in keys], set_=set_)
+
+
+async def record_order_sale(db: AsyncSession, order_id: int) -> bool:
+    """
+    order.paid 事件的处理（services.order_pipeline）：把已成交订单累加到读模型，不提交。
+    与事件标记 done 在同一事务里，重复投递不会重复累加；订单已不存在（归档 / 删除）或
+    不是成交状态时跳过，返回是否累加。
+    """
+    order = (await db.execute(
+        select(Order.user_id, Order.total_cents, Order.status, Order.created_at).where(Order.order_id == order_id)
+    )).first()
+    if order is None or order.status not in SALE_STATUSES:
+        return False
+    lines = (await db.execute(
+        select(OrderItem.sku, OrderItem.quantity, OrderItem.unit_price).where(OrderItem.order_id == order_id)
+    )).all()
+    await record_sale(db, order.user_id, order.total_cents, [tuple(l) for l in lines], order.created_at)
+    return True
+
+
+async def record_sale(
+    db: AsyncSession, user_id: int, total_cents: int, items: list[tuple[str, int, int]], sold_at: datetime
+) -> None:
+    """
+    累加一笔成交到读模型，不提交。items 为 [(sku, 数量, 单价)]。
+    不要放进下单事务：sales_daily[今天] 是所有订单共用的热点行，会把并发提交串行化。
+    商品行按 sku 排序写入，并发累加的事务加锁顺序一致。
+    """
+    day = sale_day(sold_at or datetime.now(timezone.utc))
+    per_sku: dict[str, list[int]] = {}
+    for sku, qty, price in items:
+        acc = per_sku.setdefault(sku, [0, 0])
+        acc[0] += qty
+        acc[1] += qty * price
+    per_sku = dict(sorted(per_sku.items()))
+    units = sum(acc[0] for acc in per_sku.values())
+    await db.execute(
+        _upsert(db, SalesDaily, ["day"]),
+        [{"day": day, "orders": 1, "units": units, "revenue_cents": total_cents}],
+    )
+    await db.execute(
+        _upsert(db, SalesSkuDaily, ["day", "sku"]),
+        [{"day": day, "sku": sku, "orders": 1, "units": u, "revenue_cents": r} for sku, (u, r) in per_sku.items()],
+    )
+    await db.execute(
+        _upsert(db, CustomerValue, ["user_id"]),
+        [{"user_id": user_id, "orders": 1, "units": units, "revenue_cents": total_cents,
+          "first_order_at": sold_at, "last_order_at": sold_at}],
+    )
+
+
+async def _promote_legacy_orders(db: AsyncSession) -> int:
+    """
+    旧版同步下单扣完库存即成交，却没有设置状态，留下的订单停在 PENDING，也没有 order.placed 事件。
+    把这些订单迁为 PAID（不提交），返回迁移数。新流程受理的 PENDING 订单与事件在同一事务写入，
+    处理完的事件被清理前订单早已离开 PENDING，不会被误迁。
+    """
+    placed = select(OutboxEvent.payload["order_id"].as_integer()).where(OutboxEvent.topic == "order.placed")
+    result = await db.execute(
+        update(Order)
+        .where(Order.status == OrderStatus.PENDING, Order.order_id.not_in(placed))
+        .values(status=OrderStatus.PAID)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def rebuild_sales_analytics(db: AsyncSession, chunk_rows: int = 5000) -> dict[str, int]:
+    """
+    按 orders / order_items 全量重算读模型（首次上线回填、修正数据时使用），提交并返回各表行数。
+    先把旧版下单留下的 PENDING 订单迁为 PAID（见 _promote_legacy_orders），它们同样计入统计。
+    流式读取订单明细，内存只占聚合结果（天数 × 商品数 + 用户数）。
+    已归档（services.order_partitions）的订单不在库里，重算后会从统计中消失。
+    """
+    if db.bind.dialect.name == "postgresql":
+        # 重算期间挡住并发的增量累加，避免被覆盖或重复计算
+        await db.execute(text("LOCK TABLE sales_daily, sales_sku_daily, customer_value IN EXCLUSIVE MODE"))
+    legacy = await _promote_legacy_orders(db)
+    stmt = (
+        select(
+            Order.order_id, Order.user_id, Order.total_cents, Order.created_at,
+            OrderItem.sku, OrderItem.quantity, OrderItem.unit_price,
+        )
+        .join(OrderItem, OrderItem.order_id == Order.order_id)
+        .where(Order.status.in_(SALE_STATUSES))
+        .order_by(Order.order_id)
+        .execution_options(yield_per=chunk_rows)
+    )
+    daily: dict[date, list[int]] = {}
+    skus: dict[tuple[date, str], list[int]] = {}       # [订单数, 件数, 金额, 最后计入的订单号]
+    customers: dict[int, dict] = {}
+    last_order = None
+    result = await db.stream(stmt)
+    async for rows in result.partitions():
+        for order_id, user_id, total, created_at, sku, qty, price in rows:
+            created_at = created_at or datetime.now(timezone.utc)
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            day = sale_day(created_at)
+            new_order = order_id != last_order
+            last_order = order_id
+            d = daily.setdefault(day, [0, 0, 0])
+            s = skus.setdefault((day, sku), [0, 0, 0, None])
+            c = customers.setdefault(user_id, {
+                "user_id": user_id, "orders": 0, "units": 0, "revenue_cents": 0,
+                "first_order_at": created_at, "last_order_at": created_at,
+            })
+            if new_order:
+                d[0] += 1
+                d[2] += total
+                c["orders"] += 1
+                c["revenue_cents"] += total
+                c["first_order_at"] = min(c["first_order_at"], created_at)
+                c["last_order_at"] = max(c["last_order_at"], created_at)
+            if s[3] != order_id:            # 同一订单里同一 sku 可能有多行，只计一单
+                s[0] += 1
+                s[3] = order_id
+            d[1] += qty
+            c["units"] += qty
+            s[1] += qty
+            s[2] += qty * price
+    await db.execute(delete(SalesDaily))
+    await db.execute(delete(SalesSkuDaily))
+    await db.execute(delete(CustomerValue))
+    if daily:
+        await db.execute(insert(SalesDaily), [
+            {"day": day, "orders": o, "units": u, "revenue_cents": r} for day, (o, u, r) in daily.items()
+        ])
+    if skus:
+        await db.execute(insert(SalesSkuDaily), [
+            {"day": day, "sku": sku, "orders": o, "units": u, "revenue_cents": r}
+            for (day, sku), (o, u, r, _) in skus.items()
+        ])
+    if customers:
+        await db.execute(insert(CustomerValue), list(customers.values()))
+    await db.commit()
+    return {"days": len(daily), "sku_days": len(skus), "customers": len(customers), "legacy_orders": legacy}
+
+
+async def get_daily_sales(db: AsyncSession, start: date, end: date) -> list[dict]:
+    """[start, end] 每天的成交，没有成交的日子补 0"""
+    result = await db.execute(
+        select(SalesDaily).where(SalesDaily.day.between(start, end)).order_by(SalesDaily.day)
+    )
+    rows = {r.day: r for r in result.scalars()}
+    days = []
+    day = start
+    while day <= end:
+        r = rows.get(day)
+        days.append({
+            "day": day,
+            "orders": r.orders if r else 0,
+            "units": r.units if r else 0,
+            "revenue_cents": r.revenue_cents if r else 0,
+        })
+        day += timedelta(days=1)
+    return days
+
+
+async def get_top_skus(
+    db: AsyncSession, start: date, end: date, limit: int = 10, by: str = "revenue"
+) -> list[dict]:
+    """[start, end] 的热销商品，按金额或件数倒序"""
+    units = func.sum(SalesSkuDaily.units).label("units")
+    revenue = func.sum(SalesSkuDaily.revenue_cents).label("revenue_cents")
+    orders = func.sum(SalesSkuDaily.orders).label("orders")
+    result = await db.execute(
+        select(SalesSkuDaily.sku, Product.name, orders, units, revenue)
+        .outerjoin(Product, Product.sku == SalesSkuDaily.sku)
+        .where(SalesSkuDaily.day.between(start, end))
+        .group_by(SalesSkuDaily.sku, Product.name)
+        .order_by((units if by == "units" else revenue).desc(), SalesSkuDaily.sku)
+        .limit(limit)
+    )
+    return [dict(r) for r in result.mappings()]
+
+
+async def get_top_customers(db: AsyncSession, limit: int = 10) -> list[dict]:
+    """累计消费最高的用户"""
+    result = await db.execute(
+        select(CustomerValue, User.username)
+        .outerjoin(User, User.user_id == CustomerValue.user_id)
+        .order_by(CustomerValue.revenue_cents.desc(), CustomerValue.user_id)
+        .limit(limit)
+    )
+    return [_customer(cv, username) for cv, username in result.all()]
+
+
+async def get_customer_value(db: AsyncSession, user_id: int) -> dict | None:
+    result = await db.execute(
+        select(CustomerValue, User.username)
+        .outerjoin(User, User.user_id == CustomerValue.user_id)
+        .where(CustomerValue.user_id == user_id)
+    )
+    row = result.first()
+    return _customer(*row) if row else None
+
+
+def _customer(cv: CustomerValue, username: str | None) -> dict:
+    return {
+        "user_id": cv.user_id,
+        "username": username,
+        "orders": cv.orders,
+        "units": cv.units,
+        "revenue_cents": cv.revenue_cents,
+        "avg_order_cents": cv.revenue_cents // cv.orders if cv.orders else 0,
+        "first_order_at": cv.first_order_at,
+        "last_order_at": cv.last_order_at,
+    }
+
+
+async def get_sales_summary(db: AsyncSession, days: int = 7, top: int = 5) -> dict:
+    """最近 days 天（含今天）的汇总、每日走势和热销商品"""
+    end = today()
+    start = end - timedelta(days=days - 1)
+    daily = await get_daily_sales(db, start, end)
+    orders = sum(d["orders"] for d in daily)
+    revenue = sum(d["revenue_cents"] for d in daily)
+    return {
+        "start": start,
+        "end": end,
+        "orders": orders,
+        "units": sum(d["units"] for d in daily),
+        "revenue_cents": revenue,
+        "avg_order_cents": revenue // orders if orders else 0,
+        "daily": daily,
+        "top_skus": await get_top_skus(db, start, end, top),
+    }
@@ -1,59 +1,62 @@
-from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 
-from mcpshop.models.cart_item import CartItem
+from mcpshop.crud.product import get_product_cached, get_products_cached
 from mcpshop.models.product import Product
+from mcpshop.schemas.cart import CartOperation
+from mcpshop.services.cart_store import CartLimitError, cart_store
 
-async def add_to_cart(db: AsyncSession, user_id: int, sku: str, quantity: int = 1) -> CartItem:
-    # 校验商品存在 & 库存充足
-    prod = await db.get(Product, sku)
+# 购物车数据在 Redis（services.cart_store），异步批量写回 cart_items；
+# 这里负责校验商品并拼上商品快照（走商品缓存，不回表）。
+
+async def add_to_cart(db: AsyncSession, user_id: int, sku: str, quantity: int = 1) -> dict[str, Any]:
+    # 校验商品存在 & 库存充足（走商品缓存；下单时还会加锁复核库存）
+    prod = await get_product_cached(db, sku)
     if not prod or prod.stock < quantity:
         raise HTTPException(status_code=400, detail="商品不存在或库存不足")
+    try:
+        # 合并数量并校验库存，由 Redis 脚本原子完成
+        new_qty = await cart_store.incr(db, user_id, sku, quantity, limit=prod.stock)
+    except CartLimitError:
+        raise HTTPException(status_code=400, detail="库存不足")
+    lines = await cart_store.get_lines(db, user_id)
+    line = next((l for l in lines if l["sku"] == sku), {"sku": sku, "quantity": new_qty, "added_at": None})
+    return {**line, "product": prod}
 
-    # 查询购物车中是否已存在该商品
-    result = await db.execute(
-        select(CartItem).where(CartItem.user_id == user_id, CartItem.sku == sku)
-    )
-    item = result.scalars().first()
-    if item:
-        # 合并数量并校验库存
-        if prod.stock < item.quantity + quantity:
-            raise HTTPException(status_code=400, detail="库存不足")
-        item.quantity += quantity
-    else:
-        item = CartItem(user_id=user_id, sku=sku, quantity=quantity)
-        db.add(item)
-
-    # 提交事务并预加载关联的 product
-    await db.commit()
-    await db.refresh(item)
-    await db.refresh(item, ["product"])
-    return item
+async def update_cart(db: AsyncSession, user_id: int, operations: list[CartOperation]) -> list[dict[str, Any]]:
+    """
+    批量加购 / 改数量 / 移除：一次查询校验全部商品与库存，一次原子写入，要么全部生效要么都不生效。
+    返回更新后的整个购物车。
+    """
+    skus = list(dict.fromkeys(op.sku for op in operations))
+    result = await db.execute(select(Product.sku, Product.stock).where(Product.sku.in_(skus)))
+    limits = dict(result.all())
+    # 移除已下架的商品总是允许的；增加数量时商品必须存在
+    missing = [op.sku for op in operations if op.sku not in limits and (op.quantity or op.delta or 0) > 0]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"商品不存在：{', '.join(dict.fromkeys(missing))}")
+    ops = [
+        (op.sku, "set", op.quantity) if op.quantity is not None else (op.sku, "delta", op.delta)
+        for op in operations
+    ]
+    try:
+        await cart_store.apply(db, user_id, ops, limits)
+    except CartLimitError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await get_cart_items(db, user_id)
 
-async def remove_cart_item(db: AsyncSession, cart_item_id: int) -> None:
-    # 删除指定购物项
-    result = await db.execute(
-        select(CartItem).where(CartItem.cart_item_id == cart_item_id)
-    )
-    item = result.scalars().first()
-    if item:
-        await db.delete(item)
-        await db.commit()
+async def remove_cart_item(db: AsyncSession, user_id: int, sku: str) -> None:
+    # 删除指定购物项（按 sku，只能删自己的）
+    await cart_store.remove(db, user_id, sku)
 
-async def get_cart_items(db: AsyncSession, user_id: int) -> list[CartItem]:
-    # 查询并预加载关联的 product，避免懒加载错误
-    result = await db.execute(
-        select(CartItem)
-          .options(selectinload(CartItem.product))
-          .where(CartItem.user_id == user_id)
-    )
-    return result.scalars().all()
+async def get_cart_items(db: AsyncSession, user_id: int) -> list[dict[str, Any]]:
+    # 商品快照批量取：缓存未命中的合并成一次查询；商品已被删除的购物项直接略过
+    lines = await cart_store.get_lines(db, user_id)
+    products = await get_products_cached(db, [line["sku"] for line in lines])
+    return [{**line, "product": products[line["sku"]]} for line in lines if products.get(line["sku"])]
 
 async def clear_cart(db: AsyncSession, user_id: int) -> None:
     # 清空购物车
-    items = await get_cart_items(db, user_id)
-    for item in items:
-        await db.delete(item)
-    await db.commit()
+    await cart_store.clear(db, user_id)
@@ -1,8 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import case, delete, func, insert, text
 from mcpshop.models.category import Category
+from mcpshop.models.category_facet import CategoryFacet, PRICE_BUCKETS, UNCATEGORIZED
+from mcpshop.models.product import Product
 from mcpshop.schemas.category import CategoryCreate
 
+_REFRESH_LOCK_KEY = 0x66616374      # pg_advisory_xact_lock：同一时刻只有一个进程全量重算聚合
+
 async def create_category(db: AsyncSession, cat_in: CategoryCreate) -> Category:
     cat = Category(name=cat_in.name)
     db.add(cat)
@@ -16,4 +21,86 @@ async def get_category(db: AsyncSession, category_id: int) -> Category | None:
 
 async def list_categories(db: AsyncSession) -> list[Category]:
     result = await db.execute(select(Category))
-    return result.scalars().all()
\ No newline at end of file
+    return result.scalars().all()
+
+async def get_category_facets(db: AsyncSession, category_id: int | None = None) -> list[dict]:
+    """
+    读预计算的分类聚合：每个分类的商品数、有货数和价格直方图。
+    只扫 category_facets（分类数 × 桶数行），不碰 products。
+    """
+    stmt = (
+        select(CategoryFacet, Category.name)
+        .outerjoin(Category, Category.category_id == CategoryFacet.category_id)
+        .where(CategoryFacet.product_count > 0)
+        .order_by(CategoryFacet.category_id, CategoryFacet.bucket)
+    )
+    if category_id is not None:
+        stmt = stmt.where(CategoryFacet.category_id == category_id)
+    result = await db.execute(stmt)
+
+    facets: dict[int, dict] = {}
+    for row, name in result.all():
+        facet = facets.setdefault(row.category_id, {
+            "category_id": row.category_id,
+            "name": name or ("未分类" if row.category_id == UNCATEGORIZED else ""),
+            "product_count": 0,
+            "in_stock_count": 0,
+            "price_histogram": [],
+        })
+        facet["product_count"] += row.product_count
+        facet["in_stock_count"] += row.in_stock_count
+        facet["price_histogram"].append({
+            "min_cents": PRICE_BUCKETS[row.bucket],
+            "max_cents": PRICE_BUCKETS[row.bucket + 1] if row.bucket + 1 < len(PRICE_BUCKETS) else None,
+            "count": row.product_count,
+        })
+    return list(facets.values())
+
+def empty_facet(category: Category | None, category_id: int) -> dict:
+    """存在但还没有商品的分类：各项计数为 0"""
+    return {
+        "category_id": category_id,
+        "name": category.name if category else "未分类",
+        "product_count": 0,
+        "in_stock_count": 0,
+        "price_histogram": [],
+    }
+
+async def refresh_category_facets(db: AsyncSession, wait: bool = True) -> int | None:
+    """
+    全量重算分类聚合（一次 GROUP BY 扫描 products），返回写入行数。
+    管理员手动刷新、Core 批量写商品之后调用；增量维护见 models.category_facet。
+    wait=False（应用启动时）：已有其他进程在重算就跳过，返回 None，多个 worker 同时启动只算一次。
+    """
+    if db.bind.dialect.name == "postgresql":
+        if wait:
+            await db.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _REFRESH_LOCK_KEY})
+        elif not (await db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": _REFRESH_LOCK_KEY}
+        )).scalar():
+            await db.rollback()
+            return None
+        # 重算期间挡住并发的增量更新，避免它们被覆盖或重复计算
+        await db.execute(text("LOCK TABLE category_facets IN EXCLUSIVE MODE"))
+    bucket = case(
+        *((Product.price_cents >= edge, i) for i, edge in reversed(list(enumerate(PRICE_BUCKETS)))),
+        else_=0,
+    )
+    category = func.coalesce(Product.category_id, UNCATEGORIZED)
+    source = (
+        select(
+            category,
+            bucket,
+            func.count(),
+            func.sum(case((Product.stock > 0, 1), else_=0)),
+        )
+        .group_by(category, bucket)
+    )
+    await db.execute(delete(CategoryFacet))
+    result = await db.execute(
+        insert(CategoryFacet).from_select(
+            ["category_id", "bucket", "product_count", "in_stock_count"], source
+        )
+    )
+    await db.commit()
+    return result.rowcount
@@ -1,41 +1,187 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import insert, select
 from sqlalchemy.orm import selectinload
+from datetime import datetime
 from typing import List
-from mcpshop.models.order import Order
+from mcpshop.core.pagination import apply_keyset, paginate
+from mcpshop.models.order import Order, OrderStatus
 from mcpshop.models.order_item import OrderItem
 from mcpshop.models.product import Product
+from mcpshop.core.logger import logger
+from mcpshop.crud.product import decrement_stock, lock_products, product_cache
+from mcpshop.services.cart_store import cart_store
+from mcpshop.services.inventory import hot_inventory
+from mcpshop.services.outbox import enqueue
 
-async def create_order(db: AsyncSession, user_id: int, items: list[dict]) -> Order:
-    total = 0
-    order = Order(user_id=user_id, total_cents=0)
-    db.add(order)
-    await db.flush()                      # 先拿到 order_id
+# 订单列表只取 OrderOut / OrderItemOut 需要的列
+ORDER_OUT_COLUMNS = [Order.order_id, Order.total_cents, Order.status, Order.created_at]
+ORDER_ITEM_OUT_COLUMNS = [OrderItem.sku, OrderItem.quantity, OrderItem.unit_price]
 
+async def _remove_from_cart(db: AsyncSession, user_id: int, quantities: dict[str, int]) -> None:
+    """订单已提交：从购物车（Redis 为准）扣掉已下单的数量；失败只记日志，不影响下单结果"""
+    try:
+        await cart_store.remove_ordered(db, user_id, quantities)
+    except Exception as e:
+        logger.warning(f"[order] 用户 {user_id} 下单后移出购物车失败：{e}")
+
+async def submit_order(db: AsyncSession, user_id: int, items: list[dict], clear_cart: bool = False) -> Order:
+    """
+    异步下单的受理阶段：校验商品、预扣热点商品，在同一事务里写入 PENDING 订单、订单明细、
+    order.placed 事件（clear_cart=True 时提交后从购物车扣掉已下单的商品）。不锁普通商品的库存行，
+    真正扣库存由 outbox worker 调用 allocate_order 完成。
+    商品不存在或库存明显不足时抛出 ValueError；热点商品暂时无法下单时抛出 InventoryUnavailable。
+    """
+    quantities: dict[str, int] = {}
     for it in items:
-        prod: Product = await db.get(Product, it["sku"], with_for_update=True)  # ✅ 行锁保证并发安全
-        if not prod:
-            raise ValueError(f"商品 {it['sku']} 不存在")
-        qty = it["quantity"]
-        if prod.stock < qty:
-            raise ValueError(f"商品 {prod.sku} 库存不足")
-        total += prod.price_cents * qty
-        db.add(OrderItem(
-            order_id=order.order_id,
-            sku=prod.sku,
-            quantity=qty,
-            unit_price=prod.price_cents
-        ))
-        prod.stock -= qty
-
-    order.total_cents = total
-    await db.commit()
-    await db.refresh(order, ["items"])     # ✅ 提前加载 items，避免懒加载失败
+        quantities[it["sku"]] = quantities.get(it["sku"], 0) + it["quantity"]
+
+    resv = await hot_inventory.reserve(quantities)
+    hot = resv.items if resv else {}
+    try:
+        result = await db.execute(
+            select(Product.sku, Product.price_cents, Product.stock).where(Product.sku.in_(sorted(quantities)))
+        )
+        products = {r.sku: r for r in result}
+        for sku, qty in sorted(quantities.items()):
+            if sku not in products:
+                raise ValueError(f"商品 {sku} 不存在")
+            if sku not in hot and products[sku].stock < qty:
+                raise ValueError(f"商品 {sku} 库存不足")      # 不加锁的预检，最终以 allocate_order 为准
+
+        order = Order(
+            user_id=user_id,
+            status=OrderStatus.PENDING,
+            total_cents=sum(products[s].price_cents * q for s, q in quantities.items()),
+        )
+        db.add(order)
+        await db.flush()                      # 先拿到 order_id
+        await db.execute(insert(OrderItem), [
+            {"order_id": order.order_id, "sku": sku, "quantity": qty, "unit_price": products[sku].price_cents}
+            for sku, qty in quantities.items()
+        ])
+        # 热点商品已在 Redis 扣减，worker 只需处理其余商品
+        enqueue(db, "order.placed", {"order_id": order.order_id, "hot": hot})
+        if resv:
+            await hot_inventory.confirm(resv)
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        if resv:
+            await hot_inventory.cancel(resv)
+        raise
+
+    if clear_cart:
+        await _remove_from_cart(db, user_id, quantities)
+    await db.refresh(order, ["items"])
     return order
 
+async def allocate_order(
+    db: AsyncSession, order_id: int, hot: dict[str, int]
+) -> tuple[Order | None, str | None, list[str]]:
+    """
+    异步下单的处理阶段（outbox worker 调用，不提交）：锁订单和普通商品行，
+    库存足够则扣减并置为 PAID（本项目没有支付环节，扣库存成功即视为下单完成），否则置为 CANCELLED。
+    hot 为受理阶段已在 Redis 扣减的热点商品，这里不再扣。
+    订单不是 PENDING 时什么都不做（重复投递）。返回 (订单, 本次取消的原因, 本次扣了库存的 sku)。
+    """
+    order = await db.get(Order, order_id, with_for_update=True)
+    if order is None or order.status != OrderStatus.PENDING:
+        return order, None, []
+    result = await db.execute(
+        select(OrderItem.sku, OrderItem.quantity, OrderItem.unit_price).where(OrderItem.order_id == order_id)
+    )
+    lines = result.all()
+    cold: dict[str, int] = {}
+    for sku, qty, _ in lines:
+        if sku not in hot:
+            cold[sku] = cold.get(sku, 0) + qty
+    locked = await lock_products(db, sorted(cold))
+    short = [sku for sku in sorted(cold) if sku not in locked or locked[sku].stock < cold[sku]]
+    if short:
+        order.status = OrderStatus.CANCELLED
+        return order, f"商品 {', '.join(short)} 库存不足", []
+    await decrement_stock(db, cold, locked)
+    order.status = OrderStatus.PAID
+    # 销售统计由 order.paid 在独立事务里累加，不在这里碰 sales_daily 的热点行
+    enqueue(db, "order.paid", {"order_id": order_id})
+    return order, None, list(cold)
+
+async def cancel_pending_order(db: AsyncSession, order_id: int) -> Order | None:
+    """
+    把仍为 PENDING 的订单置为 CANCELLED（不提交），返回该订单；订单不存在或已不是 PENDING 时返回 None。
+    下单事件进入死信时调用：普通商品的库存还没扣，热点商品的预扣由调用方提交后退回。
+    """
+    order = await db.get(Order, order_id, with_for_update=True)
+    if order is None or order.status != OrderStatus.PENDING:
+        return None
+    order.status = OrderStatus.CANCELLED
+    return order
+
+async def get_order(db: AsyncSession, order_id: int) -> Order | None:
+    result = await db.execute(
+        select(Order).options(selectinload(Order.items)).where(Order.order_id == order_id)
+    )
+    return result.scalars().first()
+
 async def get_orders_by_user(db: AsyncSession, user_id: int) -> List[Order]:
     result = await db.execute(
         select(Order).options(selectinload(Order.items))   # ✅ 解决 MissingGreenlet
         .where(Order.user_id == user_id)
     )
     return result.scalars().all()
+
+async def list_orders_page(
+    db: AsyncSession,
+    limit: int = 20,
+    cursor: str | None = None,
+    user_id: int | None = None,
+    with_items: bool = True,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> tuple[List[Order], str | None]:
+    """
+    按 (created_at, order_id) 倒序游标分页查询订单，只为本页订单加载 items。
+    user_id 为空时查全部订单（管理员）；since / until 限定下单时间 [since, until)，
+    PostgreSQL 分区表上只扫描相关月份；cursor 无效时抛出 ValueError。
+    """
+    stmt = select(Order)
+    if with_items:
+        stmt = stmt.options(selectinload(Order.items))
+    result = await db.execute(_orders_page_stmt(stmt, limit, cursor, user_id, since, until))
+    return paginate(result.scalars().all(), limit, lambda o: (o.created_at, o.order_id), "orders")
+
+async def list_order_rows_page(
+    db: AsyncSession,
+    limit: int = 20,
+    cursor: str | None = None,
+    user_id: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> tuple[list[dict], str | None]:
+    """
+    同 list_orders_page，但只取 OrderOut 需要的列：订单一条查询、本页明细一条查询，
+    返回 dict（items 为明细 Row 列表），给列表接口的快速序列化路径用。
+    """
+    stmt = select(*ORDER_OUT_COLUMNS)
+    result = await db.execute(_orders_page_stmt(stmt, limit, cursor, user_id, since, until))
+    rows, next_cursor = paginate(result.all(), limit, lambda o: (o.created_at, o.order_id), "orders")
+    items: dict[int, list] = {r.order_id: [] for r in rows}
+    if items:
+        result = await db.execute(
+            select(OrderItem.order_id, *ORDER_ITEM_OUT_COLUMNS)
+            .where(OrderItem.order_id.in_(list(items)))
+            .order_by(OrderItem.order_id, OrderItem.order_item_id)
+        )
+        for line in result:
+            items[line.order_id].append(line)
+    return [{**r._mapping, "items": items[r.order_id]} for r in rows], next_cursor
+
+def _orders_page_stmt(stmt, limit: int, cursor: str | None, user_id: int | None,
+                      since: datetime | None, until: datetime | None):
+    if user_id is not None:
+        stmt = stmt.where(Order.user_id == user_id)
+    if since is not None:
+        stmt = stmt.where(Order.created_at >= since)
+    if until is not None:
+        stmt = stmt.where(Order.created_at < until)
+    return apply_keyset(stmt, [Order.created_at, Order.order_id], cursor, scope="orders").limit(limit + 1)
@@ -1,10 +1,137 @@
 # app/crud/product.py
+import asyncio
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import or_
-from typing import List
-from mcpshop.models.product import Product
-from mcpshop.schemas.product import ProductCreate
+from sqlalchemy import (
+    DateTime, Float, Integer, Row, String, bindparam, case, column, delete, func, literal, literal_column, update,
+    values as values_clause,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.exc import InvalidRequestError
+from datetime import datetime
+from typing import Any, List
+from mcpshop.core.cache import TwoTierCache
+from mcpshop.core.config import settings
+from mcpshop.core.pagination import apply_keyset, paginate
+from mcpshop.core.logger import logger
+from mcpshop.core.search import build_search_text, build_tsquery, reciprocal_rank_fusion, tokenize
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.cart_item import CartItem
+from mcpshop.models.category_facet import UNCATEGORIZED, apply_facet_deltas, price_bucket
+from mcpshop.models.product import Product, SEARCH_VECTOR
+from mcpshop.schemas.product import ProductCreate, ProductOut
+from mcpshop.services.cart_store import cart_store
+from mcpshop.services.product_index import (
+    index_row, product_index, schedule_remove, schedule_upsert,
+)
+from mcpshop.services.suggest import publish_remove, publish_upsert
+
+# —— 商品实体缓存：进程内 LRU → Redis → 数据库 ——
+product_cache = TwoTierCache(
+    "product",
+    ttl=settings.PRODUCT_CACHE_TTL,
+    local_ttl=settings.PRODUCT_CACHE_LOCAL_TTL,
+    maxsize=settings.PRODUCT_CACHE_MAXSIZE,
+)
+
+# 修改这些字段时需要同步语义索引
+_INDEXED_FIELDS = {"name", "description", "price_cents", "category_id"}
+
+# 缓存快照包含的列（search_text 只给检索用，不进缓存）
+_SNAPSHOT_COLUMNS = [c for c in Product.__table__.columns if c.key != "search_text"]
+
+# 列表 / 检索只取 ProductOut 需要的列，结果为 Core Row（属性访问与 Product 相同）
+PRODUCT_OUT_COLUMNS = [Product.__table__.c[name] for name in ProductOut.model_fields]
+
+
+def _from_snapshot(data: dict[str, Any]) -> Product:
+    """由缓存快照构造游离态 Product：属性视为已加载，只读使用"""
+    values = {
+        c.key: datetime.fromisoformat(data[c.key])
+        if isinstance(data[c.key], str) and isinstance(c.type, DateTime) else data[c.key]
+        for c in _SNAPSHOT_COLUMNS
+    }
+    prod = Product(**values)
+    make_transient_to_detached(prod)
+    return prod
+
+
+async def get_product_cached(db: AsyncSession, sku: str) -> Product | None:
+    """
+    走两级缓存查询商品（不存在也会被短暂缓存）。
+    返回游离态实例，只读使用。修改/删除要先用 get_product_by_sku 从主库读出会话中的实例，
+    再调用 update_product / delete_product，它们会加锁重读并负责失效缓存
+    （缓存快照可能已过时，挂回会话做变更检测会丢掉别人的修改）。
+    """
+    async def _load() -> dict[str, Any] | None:
+        # 只查列、不建 ORM 实例，避免占用会话 identity map，后续才能挂回缓存实例
+        result = await db.execute(select(*_SNAPSHOT_COLUMNS).where(Product.sku == sku))
+        row = result.mappings().first()
+        return dict(row) if row else None
+
+    data = await product_cache.get_or_load(sku, _load)
+    return _from_snapshot(data) if data else None
+
+
+async def get_products_cached(db: AsyncSession, skus: list[str]) -> dict[str, Product | None]:
+    """批量版 get_product_cached：缓存未命中的 sku 合并成一条 IN 查询回源"""
+    async def _load(missing: list[str]) -> dict[str, dict[str, Any]]:
+        result = await db.execute(select(*_SNAPSHOT_COLUMNS).where(Product.sku.in_(missing)))
+        return {row["sku"]: dict(row) for row in result.mappings()}
+
+    data = await product_cache.get_many_or_load(skus, _load)
+    return {sku: _from_snapshot(d) if d else None for sku, d in data.items()}
+
+
+async def _lock_row(db: AsyncSession, prod: Product) -> bool:
+    """
+    SELECT ... FOR UPDATE 重读会话中的商品，行锁持有到提交；行已被删除时返回 False。
+    修改前必须调用：分类聚合的增量（models.category_facet）按属性历史里的旧值计算，
+    旧值要来自锁住的这一行，并发修改才不会算错。
+    """
+    try:
+        await db.refresh(prod, with_for_update=True)
+    except InvalidRequestError:     # 行已不存在
+        await db.rollback()
+        return False
+    return True
+
+
+async def update_product(db: AsyncSession, prod: Product, fields: dict[str, Any]) -> Product | None:
+    """加锁更新会话中的商品并失效缓存；行已被删除时返回 None"""
+    if not fields:
+        return prod
+    if not await _lock_row(db, prod):
+        await product_cache.invalidate(prod.sku)
+        return None
+    for k, v in fields.items():
+        setattr(prod, k, v)
+    await db.commit()
+    await product_cache.invalidate(prod.sku)
+    await db.refresh(prod)
+    if fields.keys() & _INDEXED_FIELDS:
+        schedule_upsert([index_row(prod)])
+    if "name" in fields:
+        await publish_upsert([(prod.sku, prod.name)])
+    return prod
+
+
+async def delete_product(db: AsyncSession, prod: Product) -> None:
+    if not await _lock_row(db, prod):
+        await product_cache.invalidate(prod.sku)
+        return
+    # 购物车里的该商品一并删除（cart_items 外键），提交后再从 Redis 购物车里移除
+    holders = (await db.execute(
+        delete(CartItem).where(CartItem.sku == prod.sku).returning(CartItem.user_id)
+    )).scalars().all()
+    await db.delete(prod)
+    await db.commit()
+    await cart_store.forget_sku(prod.sku, list(set(holders)))
+    await product_cache.invalidate(prod.sku)
+    schedule_remove([prod.sku])
+    await publish_remove([prod.sku])
+
 
 async def get_all_products(db: AsyncSession) -> List[Product]:
     result = await db.execute(select(Product))
@@ -22,16 +149,254 @@ async def create_product(db: AsyncSession, p_in: ProductCreate) -> Product:
     )
     db.add(prod)
     await db.commit()
+    await product_cache.invalidate(prod.sku)       # 清掉可能存在的「不存在」负缓存
     await db.refresh(prod)
+    schedule_upsert([index_row(prod)])             # 后台写入语义索引
+    await publish_upsert([(prod.sku, prod.name)])  # 联想索引
     return prod
 
+# 批量导入时按 sku 覆盖的列
+_UPSERT_COLUMNS = ("name", "price_cents", "stock", "description", "image_url", "category_id")
+
+
+async def bulk_upsert_products(db: AsyncSession, rows: List[dict[str, Any]]) -> None:
+    """
+    批量写入商品：INSERT ... ON CONFLICT (sku) DO UPDATE，不提交、不失效缓存，由调用方负责。
+    rows 的键见 _UPSERT_COLUMNS 加 sku；同一批内 sku 不能重复。
+    走 Core 语句不会触发 ORM 事件，search_text 在这里显式计算。
+    """
+    if not rows:
+        return
+    dialect = postgresql if _dialect_name(db) == "postgresql" else sqlite
+    values = [
+        {**r, "search_text": build_search_text(r["name"], r.get("description"))}
+        for r in rows
+    ]
+    stmt = dialect.insert(Product.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Product.sku],
+        set_={
+            **{c: stmt.excluded[c] for c in (*_UPSERT_COLUMNS, "search_text")},
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt, values)
+
+async def lock_products(db: AsyncSession, skus: list[str]) -> dict[str, Row]:
+    """
+    一条 SELECT ... WHERE sku IN (...) ORDER BY sku FOR NO KEY UPDATE 锁住这些商品，加锁顺序固定，
+    并发事务不会互相死锁。只改库存不改主键，用 NO KEY UPDATE：不与受理阶段插入订单明细时
+    外键检查加的 KEY SHARE 锁冲突（那些锁按购物车顺序获取，冲突时会与这里形成死锁环）。
+    返回 sku → (sku, price_cents, stock, category_id)，不存在的 sku 不在其中。
+    """
+    if not skus:
+        return {}
+    result = await db.execute(
+        select(Product.sku, Product.price_cents, Product.stock, Product.category_id)
+        .where(Product.sku.in_(skus))
+        .order_by(Product.sku)
+        .with_for_update(key_share=True)
+    )
+    return {r.sku: r for r in result}
+
+async def decrement_stock(db: AsyncSession, quantities: dict[str, int], locked: dict[str, Row]) -> None:
+    """
+    一条语句扣减多个商品的库存，不提交、不失效缓存。locked 为 lock_products 的结果。
+    quantities 可为负数（退回库存）。Core UPDATE 不触发 ORM 事件：有货 / 无货发生变化的商品
+    在这里同步分类聚合的有货数。
+    """
+    if not quantities:
+        return
+    products = Product.__table__
+    if _dialect_name(db) == "postgresql":
+        # UPDATE products SET stock = stock - v.qty FROM (VALUES ...) AS v(sku, qty) WHERE products.sku = v.sku
+        v = values_clause(column("sku", String), column("qty", Integer), name="v").data(list(quantities.items()))
+        await db.execute(
+            update(products).where(products.c.sku == v.c.sku).values(stock=products.c.stock - v.c.qty)
+        )
+    else:
+        # SQLite 不支持带列名的 VALUES 子查询，退化为 executemany
+        await db.execute(
+            update(products)
+            .where(products.c.sku == bindparam("b_sku"))
+            .values(stock=products.c.stock - bindparam("b_qty")),
+            [{"b_sku": sku, "b_qty": qty} for sku, qty in quantities.items()],
+        )
+    deltas: dict[tuple[int, int], list[int]] = {}
+    for sku, qty in quantities.items():
+        r = locked[sku]
+        change = int(r.stock - qty > 0) - int(r.stock > 0)
+        if change:
+            cat = r.category_id if r.category_id is not None else UNCATEGORIZED
+            deltas.setdefault((cat, price_bucket(r.price_cents)), [0, 0])[1] += change
+    if deltas:
+        await db.run_sync(lambda s: apply_facet_deltas(s.connection(), deltas))
+
 async def get_product_by_sku(db: AsyncSession, sku: str) -> Product | None:
     result = await db.execute(select(Product).where(Product.sku == sku))
     return result.scalars().first()
 
-async def search_products(db: AsyncSession, q: str, limit: int = 20) -> List[Product]:
-    stmt = select(Product).where(
-        or_(Product.name.ilike(f"%{q}%"), Product.description.ilike(f"%{q}%"))
-    ).limit(limit)
+def _dialect_name(db: AsyncSession) -> str:
+    return db.bind.dialect.name
+
+
+def _sort_keys(sort: str, rank) -> tuple[list, bool]:
+    """返回 (keyset 排序键, 是否降序)；各键同向，最后一个键 sku 保证唯一"""
+    if sort == "price_asc":
+        return [Product.price_cents, Product.sku], False
+    if sort == "price_desc":
+        return [Product.price_cents, Product.sku], True
+    if sort == "relevance" and rank is not None:
+        return [rank, Product.created_at, Product.sku], True
+    # newest，或没有关键词时的 relevance
+    return [Product.created_at, Product.sku], True
+
+
+async def search_products_page(
+    db: AsyncSession,
+    q: str,
+    limit: int = 20,
+    sort: str = "relevance",
+    cursor: str | None = None,
+) -> tuple[List[Row], str | None]:
+    """
+    商品全文搜索（游标分页），返回 (本页商品, next_cursor)；商品为只含 PRODUCT_OUT_COLUMNS 的 Row。
+    - Postgres：search_text 的 tsvector GIN 索引过滤，ts_rank_cd 计算相关度；
+    - 其它方言（SQLite 测试库）：逐词 LIKE search_text，只按商品名是否命中粗排。
+    商品名直接包含关键词时额外加权；sort 取值见 core.search.SORT_OPTIONS。
+    cursor 无效时抛出 ValueError。
+    """
+    keyword = q.strip()
+    tokens = tokenize(keyword, for_query=True)
+    conditions = []
+    rank = None
+    if tokens:
+        if _dialect_name(db) == "postgresql":
+            tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), build_tsquery(tokens))
+            conditions.append(SEARCH_VECTOR.op("@@")(tsquery))
+            rank = func.ts_rank_cd(SEARCH_VECTOR, tsquery, type_=Float)
+        else:
+            conditions.extend(
+                Product.search_text.contains(token, autoescape=True) for token in tokens
+            )
+            rank = literal(0.0)
+        rank = rank + case((Product.name.icontains(keyword, autoescape=True), 1.0), else_=0.0)
+    elif keyword:
+        # 关键词里没有可分的词（如纯符号），退回商品名模糊匹配（Postgres 上走 trigram 索引）
+        conditions.append(Product.name.icontains(keyword, autoescape=True))
+
+    keys, descending = _sort_keys(sort, rank)
+    with_rank = sort == "relevance" and rank is not None
+    columns = [*PRODUCT_OUT_COLUMNS, rank.label("rank")] if with_rank else PRODUCT_OUT_COLUMNS
+    scope = f"products:{sort}"
+    stmt = apply_keyset(select(*columns).where(*conditions), keys, cursor, descending, scope).limit(limit + 1)
     result = await db.execute(stmt)
-    return result.scalars().all()
\ No newline at end of file
+
+    if with_rank:
+        return paginate(result.all(), limit, lambda r: (r.rank, r.created_at, r.sku), scope)
+    return paginate(result.all(), limit, lambda r: [getattr(r, k.key) for k in keys], scope)
+
+
+async def search_products(
+    db: AsyncSession, q: str, limit: int = 20, sort: str = "relevance", mode: str = "lexical"
+) -> List[Row]:
+    """
+    商品搜索，只取第一页。mode 见 core.search.SEARCH_MODES：
+    - lexical：全文检索，规则见 search_products_page；
+    - hybrid：全文检索与语义向量并发召回，RRF 融合排序，见 _hybrid_search。
+    """
+    if mode == "hybrid" and q.strip():
+        return await _hybrid_search(db, q, limit, sort)
+    items, _ = await search_products_page(db, q, limit, sort)
+    return items
+
+
+async def _with_budget(coro, timeout: float, name: str) -> list[str]:
+    """在时间预算内执行一路召回；超时或出错时记日志并返回空，由另一路兜底"""
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"[search] {name}召回超时（{timeout}s），本次跳过")
+    except Exception as e:
+        logger.warning(f"[search] {name}召回失败，本次跳过：{e}")
+    return []
+
+
+async def _hybrid_search(db: AsyncSession, q: str, limit: int, sort: str) -> List[Row]:
+    """
+    混合检索：全文检索和向量检索各取 3 倍 limit 的候选并发召回（各自有超时预算），
+    按 reciprocal rank fusion 融合后回表；sort 不是 relevance 时在融合结果上再排序。
+    """
+    pool = max(limit * 3, 20)
+
+    async def _lexical() -> list[str]:
+        # 独立会话：超时取消不会把调用方会话留在半截查询的状态
+        async with AsyncSessionLocal() as lex_db:
+            items, _ = await search_products_page(lex_db, q, pool, "relevance")
+            return [p.sku for p in items]
+
+    async def _vector() -> list[str]:
+        return [sku for sku, _ in await product_index.query(q, pool)]
+
+    lexical, vector = await asyncio.gather(
+        _with_budget(_lexical(), settings.SEARCH_LEXICAL_TIMEOUT, "全文"),
+        _with_budget(_vector(), settings.SEARCH_VECTOR_TIMEOUT, "向量"),
+    )
+    fused = reciprocal_rank_fusion([lexical, vector], k=settings.SEARCH_RRF_K)
+    if not fused:
+        return []
+    result = await db.execute(select(*PRODUCT_OUT_COLUMNS).where(Product.sku.in_(fused)))
+    by_sku = {r.sku: r for r in result}
+    items = [by_sku[sku] for sku in fused if sku in by_sku]
+    if sort == "price_asc":
+        items.sort(key=lambda p: p.price_cents)
+    elif sort == "price_desc":
+        items.sort(key=lambda p: p.price_cents, reverse=True)
+    elif sort == "newest":
+        items.sort(key=lambda p: p.created_at, reverse=True)
+    return items[:limit]
+
+
+async def semantic_search_products(
+    db: AsyncSession, q: str, top_k: int = 10, max_price_cents: int | None = None
+) -> List[Row]:
+    """
+    语义检索：向量索引召回 sku，再按相似度顺序回表取商品。
+    索引里有、数据库里已删的 sku 直接跳过；索引不可用时抛出 SemanticIndexError。
+    """
+    hits = await product_index.query(q, top_k, max_price_cents)
+    if not hits:
+        return []
+    result = await db.execute(select(*PRODUCT_OUT_COLUMNS).where(Product.sku.in_([sku for sku, _ in hits])))
+    by_sku = {r.sku: r for r in result}
+    return [by_sku[sku] for sku, _ in hits if sku in by_sku]
+
+
+async def rebuild_search_text(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    为 search_text 为空的存量商品补齐分词结果，返回处理行数。
+    幂等，应用启动时调用；updated_at 保持不变。
+    """
+    table = Product.__table__
+    stmt = (
+        update(table)
+        .where(table.c.sku == bindparam("b_sku"))
+        .values(search_text=bindparam("b_text"), updated_at=table.c.updated_at)
+    )
+    total = 0
+    while True:
+        result = await db.execute(
+            select(Product.sku, Product.name, Product.description)
+            .where(Product.search_text.is_(None))
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+        await db.execute(stmt, [
+            {"b_sku": r.sku, "b_text": build_search_text(r.name, r.description)}
+            for r in rows
+        ])
+        await db.commit()
+        total += len(rows)
+    return total
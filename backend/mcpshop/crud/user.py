@@ -1,32 +1,117 @@
 # app/crud/user.py
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import DateTime
+from sqlalchemy.orm import make_transient_to_detached
+from datetime import datetime
+from typing import Any
+from mcpshop.core.cache import TwoTierCache
+from mcpshop.core.config import settings
+from mcpshop.core.pagination import apply_keyset, paginate
 from mcpshop.models.user import User
-from mcpshop.core.security import get_password_hash, verify_password
+from mcpshop.core.logger import logger
+from mcpshop.core.passwords import password_hasher
 from mcpshop.schemas.user import UserCreate
+from mcpshop.services.cart_store import cart_store
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
 
+# —— 用户记录缓存（鉴权用）：进程内 LRU → Redis → 数据库 ——
+user_cache = TwoTierCache(
+    "user",
+    ttl=settings.USER_CACHE_TTL,
+    local_ttl=settings.USER_CACHE_LOCAL_TTL,
+    maxsize=settings.USER_CACHE_MAXSIZE,
+)
+
+# 缓存快照的列：密码哈希不进缓存
+_SNAPSHOT_COLUMNS = [c for c in User.__table__.columns if c.key != "password_hash"]
+
+
+def _from_snapshot(data: dict[str, Any]) -> User:
+    values = {
+        c.key: datetime.fromisoformat(data[c.key])
+        if isinstance(data[c.key], str) and isinstance(c.type, DateTime) else data[c.key]
+        for c in _SNAPSHOT_COLUMNS
+    }
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
 async def get_user_by_username(db: AsyncSession, username: str) -> User | None:
     result = await db.execute(select(User).where(User.username == username))
     return result.scalars().first()
 
+async def get_user_cached(db: AsyncSession, username: str) -> User | None:
+    """
+    鉴权用：走两级缓存查询用户（不存在也会被短暂缓存）。
+    返回游离态实例，不含 password_hash；要修改用户请用 get_user_by_username 重新查。
+    删除用户、修改 is_admin 的函数负责失效缓存。
+    """
+    async def _load() -> dict[str, Any] | None:
+        result = await db.execute(select(*_SNAPSHOT_COLUMNS).where(User.username == username))
+        row = result.mappings().first()
+        return dict(row) if row else None
+
+    data = await user_cache.get_or_load(username, _load)
+    return _from_snapshot(data) if data else None
+
+async def delete_user(db: AsyncSession, user: User) -> None:
+    await db.delete(user)
+    await db.commit()
+    await user_cache.invalidate(user.username)
+    await cart_store.forget_user(user.user_id)
+
+async def set_user_admin(db: AsyncSession, user: User, is_admin: bool) -> User:
+    user.is_admin = is_admin
+    await db.commit()
+    await db.refresh(user)
+    await user_cache.invalidate(user.username)
+    return user
+
+async def list_users_page(
+    db: AsyncSession, limit: int = 50, cursor: str | None = None
+) -> tuple[list[User], str | None]:
+    """按 user_id 升序游标分页查询用户；cursor 无效时抛出 ValueError"""
+    stmt = apply_keyset(select(User), [User.user_id], cursor, descending=False, scope="users").limit(limit + 1)
+    result = await db.execute(stmt)
+    return paginate(result.scalars().all(), limit, lambda u: (u.user_id,), "users")
+
 async def authenticate_user(db: AsyncSession, username: str, password: str) -> User | None:
+    """
+    校验用户名密码（bcrypt 在独立线程池里算，排队已满时抛出 PasswordHasherBusy）。
+    哈希成本与配置不一致时顺带按新成本重算并写回，写回失败不影响本次登录。
+    """
     user = await get_user_by_username(db, username)
-    if not user or not verify_password(password, user.password_hash):
+    if not user:
+        return None
+    try:
+        ok, new_hash = await password_hasher.verify_and_update(password, user.password_hash)
+    except ValueError:          # 占位哈希（如压测用户的 "!"）无法识别：不可登录
+        return None
+    if not ok:
         return None
+    if new_hash:
+        user.password_hash = new_hash
+        try:
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"[auth] 用户 {username} 密码哈希升级失败，下次登录重试：{e}")
     return user
 
 async def create_user(db: AsyncSession, user_in: UserCreate) -> User:
     db_user = User(
         username=user_in.username,
         email=user_in.email,
-        password_hash=get_password_hash(user_in.password)
+        password_hash=await password_hasher.hash(user_in.password)
     )
     db.add(db_user)
     try:
         await db.commit()
         await db.refresh(db_user)
+        await user_cache.invalidate(db_user.username)     # 清掉可能存在的「不存在」缓存
         return db_user
     except IntegrityError as e:
         await db.rollback()
@@ -0,0 +1,236 @@
+# mcpshop/db/partitions.py
+"""
+orders / order_items 按 created_at 做 PostgreSQL 声明式月分区（RANGE）。
+
+- 分区表的主键必须包含分区键，库里的主键是 (order_id, created_at)；
+  ORM 仍以 order_id 为主键映射（序列生成，本身唯一），models 和查询代码不用改；
+- order_items 多一列 created_at（默认 now()，ORM 不映射）。明细与订单在同一事务里插入，
+  PostgreSQL 的 now() 是事务开始时间，取值与订单相同，两张表按同样的边界分区，
+  外键 (order_id, created_at) 指向 orders；
+- 分区名 orders_p202610 / order_items_p202610，边界为 UTC 自然月；
+- 不建 DEFAULT 分区：启动时和后台任务（services.order_partitions）提前建好
+  ORDER_PARTITION_PREMAKE 个月，按 created_at 过滤的查询只扫描相关分区。
+其他方言（SQLite）照常由 create_all 建普通表。需要 PostgreSQL 12+（外键引用分区表）。
+"""
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from mcpshop.db.base import Base
+from mcpshop.models.order import Order
+from mcpshop.models.product import Product
+
+PARTITIONED_TABLES = ("orders", "order_items")     # 建表顺序；删分区时反过来
+_PARTITION_RE = re.compile(r"^(orders|order_items)_p(\d{4})(\d{2})$")
+_LOCK_KEY = 0x6F726470                              # pg_advisory_xact_lock：多进程同时维护分区时排队
+
+# 上线后才加的列 -> 依赖它的索引：create_all 不会给已存在的表补列，启动时补齐（列须可为空）
+_ADDED_COLUMNS = {Product.__table__.c.search_text: ("ix_products_search_tsv",)}
+
+_SEQUENCES = {"orders": ("orders_order_id_seq", "order_id"),
+              "order_items": ("order_items_order_item_id_seq", "order_item_id")}
+
+_PARENT_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id    BIGINT NOT NULL DEFAULT nextval('orders_order_id_seq'),
+        user_id     BIGINT NOT NULL REFERENCES users (user_id),
+        total_cents BIGINT NOT NULL,
+        status      orderstatus NOT NULL,
+        created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (order_id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_orders_created_id ON orders (created_at, order_id)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_user_created_id ON orders (user_id, created_at, order_id)",
+    """
+    CREATE TABLE IF NOT EXISTS order_items (
+        order_item_id BIGINT NOT NULL DEFAULT nextval('order_items_order_item_id_seq'),
+        order_id      BIGINT NOT NULL,
+        sku           VARCHAR(32) NOT NULL REFERENCES products (sku),
+        quantity      INTEGER NOT NULL,
+        unit_price    INTEGER NOT NULL,
+        created_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (order_item_id, created_at),
+        FOREIGN KEY (order_id, created_at) REFERENCES orders (order_id, created_at)
+    ) PARTITION BY RANGE (created_at)
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)",
+)
+
+
+def month_of(moment: datetime | date) -> date:
+    """所在 UTC 自然月的第一天"""
+    if isinstance(moment, datetime):
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc)
+        moment = moment.date()
+    return moment.replace(day=1)
+
+
+def add_months(month: date, n: int) -> date:
+    y, m = divmod(month.month - 1 + n, 12)
+    return date(month.year + y, m + 1, 1)
+
+
+def current_month() -> date:
+    return month_of(datetime.now(timezone.utc))
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def regular_tables() -> list:
+    """PostgreSQL 上交给 create_all 的表（除分区表外的全部）"""
+    return [t for t in Base.metadata.sorted_tables if t.name not in PARTITIONED_TABLES]
+
+
+async def lock_maintenance(conn: AsyncConnection) -> None:
+    """事务级咨询锁，事务结束自动释放"""
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+
+
+async def is_partitioned(conn: AsyncConnection, table: str = "orders") -> bool | None:
+    """表是否为分区表；表不存在时返回 None"""
+    result = await conn.execute(
+        text("SELECT c.relkind = 'p' FROM pg_class c WHERE c.oid = to_regclass(:t)"), {"t": table}
+    )
+    return result.scalar()
+
+
+async def list_partitions(conn: AsyncConnection, table: str = "orders") -> list[date]:
+    """已有的月分区（按月份升序）"""
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:t)"
+        ),
+        {"t": table},
+    )
+    months = []
+    for name in result.scalars():
+        m = _PARTITION_RE.match(name)
+        if m and m.group(1) == table:
+            months.append(date(int(m.group(2)), int(m.group(3)), 1))
+    return sorted(months)
+
+
+async def create_partitioned_tables(conn: AsyncConnection) -> None:
+    """建分区父表（已存在则跳过）；users / products 需已建好"""
+    await lock_maintenance(conn)
+    await conn.run_sync(lambda sync_conn: Order.__table__.c.status.type.create(sync_conn, checkfirst=True))
+    for seq, _ in _SEQUENCES.values():
+        await conn.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {seq}"))
+    for ddl in _PARENT_DDL:
+        await conn.execute(text(ddl))
+    for table, (seq, column) in _SEQUENCES.items():
+        await conn.execute(text(f"ALTER SEQUENCE {seq} OWNED BY {table}.{column}"))
+
+
+async def ensure_partitions(conn: AsyncConnection, first: date, last: date) -> list[str]:
+    """为 [first, last] 之间的每个月建分区（已存在的跳过），返回新建的分区名"""
+    await lock_maintenance(conn)
+    existing = set(await list_partitions(conn, "orders"))
+    created = []
+    month = month_of(first)
+    while month <= last:
+        if month not in existing:
+            bounds = f"FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+            for table in PARTITIONED_TABLES:
+                name = partition_name(table, month)
+                await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES {bounds}"))
+                created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+async def drop_partition(conn: AsyncConnection, month: date) -> None:
+    """摘下并删除某个月的分区：先明细后订单（DETACH 会检查外键引用）"""
+    await lock_maintenance(conn)
+    for table in reversed(PARTITIONED_TABLES):
+        name = partition_name(table, month)
+        if month in await list_partitions(conn, table):
+            await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+
+async def add_missing_columns(conn: AsyncConnection) -> list[str]:
+    """给旧库补上 _ADDED_COLUMNS 里的列和索引（已存在的跳过），返回新加的列"""
+    postgres = conn.dialect.name == "postgresql"
+    if postgres:
+        await lock_maintenance(conn)
+
+    def upgrade(sync_conn) -> list[str]:
+        inspector = inspect(sync_conn)
+        added = []
+        for column, index_names in _ADDED_COLUMNS.items():
+            table = column.table
+            if column.name not in {c["name"] for c in inspector.get_columns(table.name)}:
+                type_ = column.type.compile(sync_conn.dialect)
+                exists = "IF NOT EXISTS " if postgres else ""
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {exists}{column.name} {type_}"))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                if index.name in index_names:
+                    index.create(sync_conn, checkfirst=True)      # 只在 PostgreSQL 上建的索引由 ddl_if 跳过
+        return added
+
+    return await conn.run_sync(upgrade)
+
+
+async def create_schema(conn: AsyncConnection, premake: int) -> None:
+    """
+    启动建表。PostgreSQL 上 orders / order_items 建成分区表，并补齐当月起 premake 个月的分区；
+    已有的普通表不动（用 scripts.order_partitions migrate 迁移），只补后加的列。
+    """
+    if conn.dialect.name != "postgresql":
+        await conn.run_sync(Base.metadata.create_all)
+        await add_missing_columns(conn)
+        return
+    await conn.run_sync(Base.metadata.create_all, tables=regular_tables())
+    await add_missing_columns(conn)
+    if await is_partitioned(conn, "orders") is False:
+        return
+    await create_partitioned_tables(conn)
+    month = current_month()
+    await ensure_partitions(conn, month, add_months(month, premake))
+
+
+async def migrate_to_partitioned(conn: AsyncConnection, premake: int) -> int:
+    """
+    把普通表 orders / order_items 迁成分区表（在调用方的事务里，提交前两张表不可读写），
+    返回迁移的订单数。序列沿用原来的，order_id 不变。
+    """
+    await lock_maintenance(conn)
+    if await is_partitioned(conn, "orders") is not False:
+        raise RuntimeError("orders 不存在或已经是分区表")
+    await conn.execute(text("LOCK TABLE orders, order_items IN ACCESS EXCLUSIVE MODE"))
+    for table in reversed(PARTITIONED_TABLES):
+        # 旧表的索引 / 主键名会和新表冲突，连同表一起改名
+        indexes = (await conn.execute(
+            text("SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                 "WHERE i.indrelid = to_regclass(:t)"),
+            {"t": table},
+        )).scalars().all()
+        await conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy"))
+        for index in indexes:
+            await conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+
+    oldest = (await conn.execute(text("SELECT min(created_at) FROM orders_legacy"))).scalar()
+    await create_partitioned_tables(conn)
+    month = current_month()
+    await ensure_partitions(conn, month_of(oldest) if oldest else month, add_months(month, premake))
+    moved = (await conn.execute(text(
+        "INSERT INTO orders (order_id, user_id, total_cents, status, created_at) "
+        "SELECT order_id, user_id, total_cents, status, COALESCE(created_at, now()) FROM orders_legacy"
+    ))).rowcount
+    await conn.execute(text(
+        "INSERT INTO order_items (order_item_id, order_id, sku, quantity, unit_price, created_at) "
+        "SELECT i.order_item_id, i.order_id, i.sku, i.quantity, i.unit_price, COALESCE(o.created_at, now()) "
+        "FROM order_items_legacy i JOIN orders_legacy o ON o.order_id = i.order_id"
+    ))
+    await conn.execute(text("DROP TABLE order_items_legacy, orders_legacy"))
+    return moved
@@ -1,30 +1,221 @@
 # backend/mcpshop/db/session.py
+"""
+数据库引擎与会话：一个主库 + 任意个只读副本（DATABASE_REPLICA_URLS）。
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+- 连接池大小、溢出、回收、pre-ping、echo 都由 Settings 的 DB_* 配置（SQLite 不设连接池参数）；
+- 每个引擎都挂上 core.sql_metrics 的 SQL 统计事件；
+- get_db 走主库，写接口和需要强一致的读都用它；
+- get_read_db 给只读接口（商品列表、分类、订单历史、统计报表）用，轮询分配到健康的副本：
+  - 读己之写：登录用户发起写请求（POST/PUT/PATCH/DELETE）后 DB_READ_STICKY_SECONDS 秒内
+    的读都回主库。标记记在 Redis（多 worker 共享）；Redis 不可用时登录用户的读一律走主库。
+    窗口不小于 DB_REPLICA_MAX_LAG（见 core.config）；后台任务替用户改的数据（如 outbox worker
+    推进订单状态）不经过 get_db，由写入方提交后调用 replica_router.mark_write；
+  - 健康检查：后台任务每 DB_REPLICA_CHECK_INTERVAL 秒探测一次，连不上或复制延迟超过
+    DB_REPLICA_MAX_LAG 秒的副本摘除，恢复后自动加回；请求里遇到连接错误也立即摘除；
+  - 没有配置副本或全部不健康时退回主库。
+"""
+import asyncio
+import itertools
+import time
+
+from jose import JWTError
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from starlette.requests import HTTPConnection
+
+from mcpshop.core.cache import REDIS_RETRY_INTERVAL
 from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.core.security import token_cache
+from mcpshop.core.sql_metrics import instrument_engine
 
-# 1. 创建异步引擎
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=True,
-    future=True,
-)
+_WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
 
-# 2. 创建 sessionmaker
-AsyncSessionLocal = sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
+# 副本复制延迟（秒）；主库（未处于恢复模式）或已回放到最新时为 0
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
 )
 
+
+def _engine_kwargs(url: str) -> dict:
+    kwargs = {"echo": settings.DB_ECHO, "future": True, "pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if make_url(url).get_backend_name() != "sqlite":
+        kwargs.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return kwargs
+
+
+def _session_factory(bind: AsyncEngine) -> sessionmaker:
+    return sessionmaker(bind=bind, class_=AsyncSession, expire_on_commit=False)
+
+
+# 1. 主库引擎
+engine = create_async_engine(settings.DATABASE_URL, **_engine_kwargs(settings.DATABASE_URL))
+instrument_engine(engine)
+
+# 2. 主库 sessionmaker
+AsyncSessionLocal = _session_factory(engine)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_engine(url, **_engine_kwargs(url))
+        instrument_engine(self.engine)
+        self.session_factory = _session_factory(self.engine)
+        self.healthy = True
+        self.lag: float | None = None
+        self.error: str | None = None
+
+
+class ReplicaRouter:
+    def __init__(self, urls: list[str]):
+        self.replicas = [Replica(u) for u in urls]
+        self._rr = itertools.count()
+        self._sticky: dict[str, float] = {}          # 本 worker 记下的写入：用户名 -> 到期时间
+        self._redis_retry_at = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def pick(self) -> Replica | None:
+        """轮询选一个健康的副本；没有时返回 None（走主库）"""
+        healthy = [r for r in self.replicas if r.healthy]
+        return healthy[next(self._rr) % len(healthy)] if healthy else None
+
+    def eject(self, replica: Replica, reason: str) -> None:
+        if replica.healthy:
+            logger.warning(f"[db] 摘除只读副本 {replica.name}：{reason}")
+        replica.healthy = False
+        replica.error = reason
+
+    async def mark_write(self, username: str) -> None:
+        """记下用户刚写过，DB_READ_STICKY_SECONDS 秒内的读走主库"""
+        ttl = settings.DB_READ_STICKY_SECONDS
+        now = time.monotonic()
+        self._sticky[username] = now + ttl
+        if len(self._sticky) > 10_000:
+            self._sticky = {u: t for u, t in self._sticky.items() if t > now}
+        if now < self._redis_retry_at:
+            return
+        try:
+            await get_redis().set(f"db:sticky:{username}", 1, px=int(ttl * 1000))
+        except REDIS_ERRORS as e:
+            self._redis_retry_at = now + REDIS_RETRY_INTERVAL
+            logger.warning(f"[db] Redis 不可用，{REDIS_RETRY_INTERVAL} 秒内登录用户的读都走主库：{e}")
+
+    async def is_sticky(self, username: str) -> bool:
+        now = time.monotonic()
+        if self._sticky.get(username, 0.0) > now:
+            return True
+        if now < self._redis_retry_at:
+            return True                             # 无从得知其他 worker 的写入，保守走主库
+        try:
+            return bool(await get_redis().exists(f"db:sticky:{username}"))
+        except REDIS_ERRORS as e:
+            self._redis_retry_at = now + REDIS_RETRY_INTERVAL
+            logger.warning(f"[db] Redis 不可用，{REDIS_RETRY_INTERVAL} 秒内登录用户的读都走主库：{e}")
+            return True
+
+    async def check(self, replica: Replica) -> None:
+        """探测一个副本：能连上且复制延迟不超过 DB_REPLICA_MAX_LAG 才算健康"""
+        try:
+            async with asyncio.timeout(settings.DB_REPLICA_CHECK_INTERVAL):
+                async with replica.engine.connect() as conn:
+                    if conn.dialect.name == "postgresql":
+                        lag = float((await conn.execute(_PG_LAG_SQL)).scalar() or 0)
+                    else:
+                        await conn.execute(text("SELECT 1"))
+                        lag = 0.0
+        except (OSError, TimeoutError, OperationalError, InterfaceError) as e:
+            replica.lag = None
+            self.eject(replica, f"连接失败：{e!r}")
+            return
+        replica.lag = lag
+        if lag > settings.DB_REPLICA_MAX_LAG:
+            self.eject(replica, f"复制延迟 {lag:.1f} 秒")
+            return
+        if not replica.healthy:
+            logger.info(f"[db] 只读副本 {replica.name} 恢复，重新加入")
+        replica.healthy = True
+        replica.error = None
+
+    async def run_health_checks(self) -> None:
+        """常驻任务：定期探测全部副本"""
+        while True:
+            await asyncio.gather(*(self.check(r) for r in self.replicas))
+            await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL)
+
+    def status(self) -> list[dict]:
+        return [
+            {"replica": r.name, "healthy": r.healthy, "lag": r.lag, "error": r.error}
+            for r in self.replicas
+        ]
+
+    async def dispose(self) -> None:
+        for r in self.replicas:
+            await r.engine.dispose()
+
+
+replica_router = ReplicaRouter(settings.DATABASE_REPLICA_URLS)
+
+
+def _principal(conn: HTTPConnection) -> str | None:
+    """请求携带的 Bearer token 对应的用户名（走已验签 token 缓存）；没有或无效时返回 None"""
+    scheme, _, token = conn.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return token_cache.subject(token)
+    except JWTError:
+        return None
+
+
 # 3. 依赖函数：直接 yield AsyncSession
-async def get_db() -> AsyncSession:
+async def get_db(conn: HTTPConnection) -> AsyncSession:
     """
-    Yield 一个 AsyncSession，并在使用完后自动关闭连接。
+    Yield 一个主库 AsyncSession，并在使用完后自动关闭连接。
     用法：
         async def endpoint(db: AsyncSession = Depends(get_db)):
             await db.execute(...)
+    配置了只读副本时，登录用户的写请求结束后标记读己之写。
     """
     async with AsyncSessionLocal() as session:
         yield session
+    if replica_router.enabled and conn.scope.get("method") in _WRITE_METHODS:
+        username = _principal(conn)
+        if username:
+            await replica_router.mark_write(username)
+
+
+async def get_read_db(conn: HTTPConnection) -> AsyncSession:
+    """
+    只读接口用：优先 yield 副本上的 AsyncSession（副本延迟内可能读到稍旧的数据）。
+    用户刚写过、没有健康副本时走主库；副本连接出错时摘除该副本（本次请求仍报错）。
+    """
+    replica = replica_router.pick()
+    if replica is not None:
+        username = _principal(conn)
+        if username and await replica_router.is_sticky(username):
+            replica = None
+    if replica is None:
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    try:
+        async with replica.session_factory() as session:
+            yield session
+    except (OperationalError, InterfaceError) as e:
+        replica_router.eject(replica, f"查询失败：{e.orig!r}")
+        raise
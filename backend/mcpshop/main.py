@@ -4,11 +4,29 @@ load_dotenv(dotenv_path=r"C:\CodeProject\Pycharm\MCPshop\.env")
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 from mcpshop.core.config import settings
-from mcpshop.api import auth, cart, chat, orders, products, users  # ★ 新增 users
-from mcpshop.db.session import engine
-from mcpshop.db.base import Base
+from mcpshop.core.http_cache import HTTPCacheMiddleware
+from mcpshop.core.rate_limit import RateLimitMiddleware
+from mcpshop.core.sql_metrics import SQLMetricsMiddleware
+from mcpshop.api import analytics, auth, cart, categories, chat, metrics, orders, products, users  # ★ 新增 users
+from mcpshop.db.session import engine, AsyncSessionLocal, replica_router
+from mcpshop.crud.product import rebuild_search_text, product_cache
+from mcpshop.crud.user import user_cache
+from mcpshop.crud.category import refresh_category_facets
+from mcpshop.services.suggest import suggest_index
+from mcpshop.services.cart_store import cart_store
+from mcpshop.services.inventory import hot_inventory
+from mcpshop.services.outbox import outbox_workers
+from mcpshop.services.order_partitions import run_partition_maintenance
+from mcpshop.services.product_index import run_index_writer
+from mcpshop.core.redis import close_redis
+from mcpshop.core.passwords import password_hasher
+from mcpshop.core.logger import logger
+from mcpshop.core.embedding import get_embedding_function
+from mcpshop.db.partitions import create_schema
 
+import asyncio
 import uvicorn
 
 def create_app() -> FastAPI:
@@ -17,6 +35,15 @@ def create_app() -> FastAPI:
         version=settings.VERSION
     )
 
+    # --- 按请求统计 SQL（最内层：Server-Timing 头在压缩 / 缓存之前加上） ---
+    app.add_middleware(SQLMetricsMiddleware)
+
+    # --- ETag / 304 / gzip·brotli 压缩（先注册的在内层，CORS 头也会参与缓存） ---
+    app.add_middleware(HTTPCacheMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE)
+
+    # --- 限流（在 CORS 内层：429 响应也带跨域头，预检请求不计费） ---
+    app.add_middleware(RateLimitMiddleware)
+
     # --- CORS ---
     app.add_middleware(
         CORSMiddleware,
@@ -29,16 +56,67 @@ def create_app() -> FastAPI:
     # --- 业务 REST 路由（各自模块已包含 prefix） ---
     app.include_router(auth.router)
     app.include_router(cart.router)
+    app.include_router(categories.router)
     app.include_router(chat.router)
     app.include_router(orders.router)
     app.include_router(products.router)
     app.include_router(users.router)  # ★ 新增注册 users 路由
+    app.include_router(analytics.router)
+    app.include_router(metrics.router)
 
     # --- 启动时自动建表（演示用，生产请用 Alembic） ---
     @app.on_event("startup")
     async def on_startup() -> None:
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+            if conn.dialect.name == "postgresql":
+                # 商品名 trigram 索引依赖 pg_trgm 扩展
+                await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            # PostgreSQL 上 orders / order_items 建成按月分区表
+            await create_schema(conn, settings.ORDER_PARTITION_PREMAKE)
+        # 存量商品补齐全文检索分词
+        async with AsyncSessionLocal() as db:
+            await rebuild_search_text(db)
+            # 分类聚合全量重算一次（价格分桶可能已调整）；同时启动的 worker 只有一个会执行
+            await refresh_category_facets(db, wait=False)
+        # 嵌入函数连同磁盘嵌入缓存在线程里构建（扫描 vectors.bin 重建索引），不阻塞事件循环
+        await asyncio.to_thread(get_embedding_function)
+        # 订阅商品缓存失效广播，清理本 worker 的进程内副本
+        app.state.cache_listener = asyncio.create_task(product_cache.run_invalidation_listener())
+        app.state.user_cache_listener = asyncio.create_task(user_cache.run_invalidation_listener())
+        # 商品名联想索引：后台构建并定期刷新热度
+        app.state.suggest_refresher = asyncio.create_task(suggest_index.run_refresher(AsyncSessionLocal))
+        # 本地语义索引只由一个进程写：抢写锁，抢到的消费其它进程推来的写入任务
+        app.state.index_writer = asyncio.create_task(run_index_writer(AsyncSessionLocal))
+        # 购物车 write-behind：Redis → cart_items
+        app.state.cart_flusher = asyncio.create_task(cart_store.run_flusher(AsyncSessionLocal))
+        # 热点商品：Redis 预扣的库存批量写回数据库
+        app.state.inventory_reconciler = asyncio.create_task(hot_inventory.run_reconciler(AsyncSessionLocal))
+        # 下单流水线：outbox worker 池（order.placed 等事件的处理函数在 services.order_pipeline 注册）
+        app.state.outbox_workers = asyncio.create_task(outbox_workers.run(AsyncSessionLocal))
+        # 订单分区：补建未来月份，按配置归档冷分区
+        app.state.partition_maintenance = asyncio.create_task(run_partition_maintenance(AsyncSessionLocal))
+        # 只读副本：定期探测连通性和复制延迟，不健康的摘除
+        app.state.replica_health = asyncio.create_task(replica_router.run_health_checks())
+
+    @app.on_event("shutdown")
+    async def on_shutdown() -> None:
+        app.state.cache_listener.cancel()
+        app.state.user_cache_listener.cancel()
+        app.state.suggest_refresher.cancel()
+        app.state.index_writer.cancel()
+        app.state.cart_flusher.cancel()
+        app.state.inventory_reconciler.cancel()
+        app.state.outbox_workers.cancel()
+        app.state.partition_maintenance.cancel()
+        app.state.replica_health.cancel()
+        try:
+            await cart_store.flush(AsyncSessionLocal)       # 关闭前尽量把积压写回
+        except Exception as e:
+            logger.warning(f"[cart] 关闭前写回失败，留待下次启动：{e}")
+        await replica_router.dispose()
+        await close_redis()
+        password_hasher.shutdown()
+        await asyncio.to_thread(get_embedding_function().close)
 
     return app
 
@@ -1,8 +1,11 @@
 from .user import User
 from .product import Product
 from .category import Category
+from .category_facet import CategoryFacet
 from .cart_item import CartItem
 from .order import Order
 from .order_item import OrderItem
+from .outbox import OutboxEvent
+from .sales import CustomerValue, SalesDaily, SalesSkuDaily
 from .conversation import Conversation
 from .message import Message
\ No newline at end of file
@@ -0,0 +1,100 @@
+from bisect import bisect_right
+
+from sqlalchemy import Column, Integer, event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from mcpshop.db.base import Base
+from mcpshop.models.product import Product
+
+# 价格分桶边界（分），即 [0, 50 元)、[50, 100 元)、…、[5000 元, +∞)
+# 修改后需要 refresh_category_facets 全量重算（应用启动时会自动执行，也可由管理员接口触发）
+PRICE_BUCKETS = (0, 5000, 10000, 20000, 50000, 100000, 200000, 500000)
+
+# 未分类商品记在 category_id = 0 下（自增主键从 1 开始）
+UNCATEGORIZED = 0
+
+
+def price_bucket(price_cents: int) -> int:
+    return max(bisect_right(PRICE_BUCKETS, price_cents) - 1, 0)
+
+
+class CategoryFacet(Base):
+    """
+    分类聚合（预计算）：每个 (分类, 价格桶) 一行，记录商品数和有货商品数。
+    侧边栏直接读这张表，查询量与分类数成正比，与商品数无关。
+    ORM 写商品时由下方事件在同一事务里增量维护；Core 批量写入后调用 refresh_category_facets。
+    """
+    __tablename__ = "category_facets"
+    category_id = Column(Integer, primary_key=True, autoincrement=False)
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    product_count = Column(Integer, nullable=False, default=0)
+    in_stock_count = Column(Integer, nullable=False, default=0)
+
+
+def _contribution(category_id, price_cents, stock) -> tuple[int, int, int]:
+    """一个商品对聚合表的贡献：(category_id, bucket, 是否有货)"""
+    return (
+        category_id if category_id is not None else UNCATEGORIZED,
+        price_bucket(price_cents),
+        1 if (stock or 0) > 0 else 0,
+    )
+
+
+def apply_facet_deltas(connection, deltas: dict[tuple[int, int], list[int]]) -> None:
+    """deltas: {(category_id, bucket): [商品数增量, 有货数增量]}；Core 批量改库存时也用它同步聚合"""
+    rows = [
+        {"category_id": cat, "bucket": bucket, "product_count": n, "in_stock_count": s}
+        for (cat, bucket), (n, s) in deltas.items() if n or s
+    ]
+    if not rows:
+        return
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    table = CategoryFacet.__table__
+    stmt = dialect.insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.category_id, table.c.bucket],
+        set_={
+            "product_count": table.c.product_count + stmt.excluded.product_count,
+            "in_stock_count": table.c.in_stock_count + stmt.excluded.in_stock_count,
+        },
+    )
+    connection.execute(stmt, rows)
+
+
+def _old_value(state, key: str):
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+
+# —— ORM 写商品时同步维护聚合（与商品写入同一事务） ——
+@event.listens_for(Product, "after_insert")
+def _facet_on_insert(mapper, connection, target: Product) -> None:
+    cat, bucket, in_stock = _contribution(target.category_id, target.price_cents, target.stock)
+    apply_facet_deltas(connection, {(cat, bucket): [1, in_stock]})
+
+
+@event.listens_for(Product, "after_delete")
+def _facet_on_delete(mapper, connection, target: Product) -> None:
+    cat, bucket, in_stock = _contribution(target.category_id, target.price_cents, target.stock)
+    apply_facet_deltas(connection, {(cat, bucket): [-1, -in_stock]})
+
+
+@event.listens_for(Product, "after_update")
+def _facet_on_update(mapper, connection, target: Product) -> None:
+    state = inspect(target)
+    keys = ("category_id", "price_cents", "stock")
+    if not any(state.attrs[k].history.deleted for k in keys):
+        return
+    old = _contribution(*(_old_value(state, k) for k in keys))
+    new = _contribution(target.category_id, target.price_cents, target.stock)
+    if old == new:
+        return
+    deltas: dict[tuple[int, int], list[int]] = {}
+    deltas.setdefault(old[:2], [0, 0])
+    deltas[old[:2]][0] -= 1
+    deltas[old[:2]][1] -= old[2]
+    deltas.setdefault(new[:2], [0, 0])
+    deltas[new[:2]][0] += 1
+    deltas[new[:2]][1] += new[2]
+    apply_facet_deltas(connection, deltas)
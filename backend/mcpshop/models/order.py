@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, BigInteger, DateTime, ForeignKey, Index, Enum as SQLEnum
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from mcpshop.db.base import Base
@@ -20,3 +20,9 @@ class Order(Base):
 
     user = relationship("User", back_populates="orders")
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # —— 游标分页：全部订单 / 某用户订单按 (created_at, order_id) 倒序翻页 ——
+        Index("ix_orders_created_id", created_at, order_id),
+        Index("ix_orders_user_created_id", user_id, created_at, order_id),
+    )
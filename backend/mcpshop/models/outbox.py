@@ -0,0 +1,26 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime, Index, JSON, text
+from sqlalchemy.sql import func
+from mcpshop.db.base import Base
+
+class OutboxEvent(Base):
+    """
+    事务性 outbox：业务写入与事件写入在同一事务提交，由后台 worker 异步投递（至少一次）。
+    status: pending → done；重试 OUTBOX_MAX_ATTEMPTS 次仍失败记为 dead，留待人工处理。
+    available_at 既是重试时间，也是认领租约的到期时间：worker 认领时把它推后 OUTBOX_LEASE 秒，
+    处理中途崩溃的事件在租约到期后会被其它 worker 重新认领。
+    """
+    __tablename__ = "outbox_events"
+    event_id = Column(BigInteger, primary_key=True, autoincrement=True)
+    topic = Column(String(64), nullable=False)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        # 只索引待处理事件（Postgres 部分索引；SQLite 上为普通索引）
+        Index("ix_outbox_pending", available_at, event_id, postgresql_where=text("status = 'pending'")),
+    )
@@ -1,7 +1,15 @@
-from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Text, DateTime, ForeignKey, Index, event, literal_column
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from mcpshop.db.base import Base
+from mcpshop.core.search import build_search_text
+
+def search_vector(search_text):
+    """to_tsvector('simple', coalesce(search_text, ''))，索引与查询共用"""
+    return func.to_tsvector(
+        literal_column("'simple'::regconfig"),
+        func.coalesce(search_text, literal_column("''")),
+    )
 
 class Product(Base):
     __tablename__ = "products"
@@ -12,9 +20,40 @@ class Product(Base):
     stock = Column(Integer, nullable=False, default=0)
     description = Column(Text, nullable=True)
     image_url = Column(String(255), nullable=True)
+    # 全文检索用的分词结果（name + description），由下方事件自动维护
+    search_text = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     category = relationship("Category", back_populates="products")
     cart_items = relationship("CartItem", back_populates="product")
     order_items = relationship("OrderItem", back_populates="product")
+
+    __table_args__ = (
+        # —— 游标分页的排序键索引 ——
+        Index("ix_products_created_sku", created_at, sku),
+        Index("ix_products_price_sku", price_cents, sku),
+        # —— 仅 Postgres：tsvector GIN 索引 + 商品名 trigram 索引（SQLite 测试库自动跳过） ——
+        Index(
+            "ix_products_search_tsv",
+            search_vector(search_text),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_products_name_trgm",
+            name,
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# 全文检索向量表达式：查询时必须复用同一表达式，才能命中下方的表达式索引
+SEARCH_VECTOR = search_vector(Product.__table__.c.search_text)
+
+
+# —— ORM 写入时同步维护 search_text ——
+@event.listens_for(Product, "before_insert")
+@event.listens_for(Product, "before_update")
+def _sync_search_text(mapper, connection, target: Product) -> None:
+    target.search_text = build_search_text(target.name, target.description)
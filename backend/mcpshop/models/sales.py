@@ -0,0 +1,43 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Date, DateTime, Index
+from mcpshop.db.base import Base
+
+# 销售统计读模型：订单变为已成交（PAID）时写一条 order.paid 事件，由 outbox worker 在独立事务里增量累加，
+# 管理后台和 sales_summary 工具只读这几张小表，不扫 orders / order_items。
+# 日期按 ANALYTICS_TIMEZONE 的自然日划分。全量重算见 crud.analytics.rebuild_sales_analytics。
+
+class SalesDaily(Base):
+    """每日成交：订单数、件数、金额"""
+    __tablename__ = "sales_daily"
+    day = Column(Date, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    units = Column(BigInteger, nullable=False, default=0)
+    revenue_cents = Column(BigInteger, nullable=False, default=0)
+
+
+class SalesSkuDaily(Base):
+    """每日每个商品的成交件数和金额（按时间段取热销商品）"""
+    __tablename__ = "sales_sku_daily"
+    day = Column(Date, primary_key=True)
+    sku = Column(String(32), primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    units = Column(BigInteger, nullable=False, default=0)
+    revenue_cents = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_sales_sku_daily_sku", sku, day),
+    )
+
+
+class CustomerValue(Base):
+    """每个用户的累计消费（LTV）"""
+    __tablename__ = "customer_value"
+    user_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    orders = Column(Integer, nullable=False, default=0)
+    units = Column(BigInteger, nullable=False, default=0)
+    revenue_cents = Column(BigInteger, nullable=False, default=0)
+    first_order_at = Column(DateTime(timezone=True), nullable=True)
+    last_order_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_customer_value_revenue", revenue_cents),
+    )
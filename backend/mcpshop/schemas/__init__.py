@@ -3,8 +3,10 @@
 # 统一导出，方便在路由里一次性 import
 from .user import UserCreate, UserOut
 from .auth import Token, TokenData
-from .category import CategoryCreate, CategoryOut
-from .product import ProductCreate, ProductOut, ProductUpdate
+from .category import CategoryCreate, CategoryOut, CategoryFacetOut, PriceBucketOut
+from .product import HotStockOut, ProductCreate, ProductOut, ProductSuggestion, ProductUpdate
 from .cart import CartItemCreate, CartItemOut
 from .order import OrderCreate, OrderOut, OrderItemOut
 from .chat import MessageIn, MessageOut, ConversationOut
+from .pagination import Page
+from .analytics import CustomerValueOut, DailySalesOut, SalesSummaryOut, SkuSalesOut
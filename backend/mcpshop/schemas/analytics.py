@@ -0,0 +1,37 @@
+# app/schemas/analytics.py
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import date, datetime
+
+class DailySalesOut(BaseModel):
+    day: date
+    orders: int
+    units: int
+    revenue_cents: int
+
+class SkuSalesOut(BaseModel):
+    sku: str
+    name: Optional[str] = None          # 商品已删除时为空
+    orders: int
+    units: int
+    revenue_cents: int
+
+class CustomerValueOut(BaseModel):
+    user_id: int
+    username: Optional[str] = None
+    orders: int
+    units: int
+    revenue_cents: int
+    avg_order_cents: int
+    first_order_at: Optional[datetime] = None
+    last_order_at: Optional[datetime] = None
+
+class SalesSummaryOut(BaseModel):
+    start: date
+    end: date
+    orders: int
+    units: int
+    revenue_cents: int
+    avg_order_cents: int
+    daily: List[DailySalesOut]
+    top_skus: List[SkuSalesOut]
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import List, Optional
 from datetime import datetime
 
 from mcpshop.schemas.product import ProductOut
@@ -12,10 +12,22 @@ class CartItemCreate(CartItemBase):
     pass
 
 class CartItemOut(CartItemBase):
-    cart_item_id: int
-    added_at: datetime
+    added_at: Optional[datetime] = None
     # 嵌套商品详细信息，使用 ProductOut
     product: Optional[ProductOut]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+class CartOperation(BaseModel):
+    sku: str
+    quantity: Optional[int] = Field(None, ge=0)     # 设为该数量，0 表示移除
+    delta: Optional[int] = None                     # 在现有数量上增减
+
+    @model_validator(mode="after")
+    def one_of(self):
+        if (self.quantity is None) == (self.delta is None):
+            raise ValueError("quantity 与 delta 必须且只能给一个")
+        return self
+
+class CartBatchUpdate(BaseModel):
+    operations: List[CartOperation] = Field(..., min_length=1, max_length=100)
@@ -1,5 +1,6 @@
 # app/schemas/category.py
 from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class CategoryBase(BaseModel):
     name: str = Field(..., max_length=50)
@@ -12,3 +13,15 @@ class CategoryOut(CategoryBase):
 
     class Config:
         orm_mode = True
+
+class PriceBucketOut(BaseModel):
+    min_cents: int
+    max_cents: Optional[int] = None     # None 表示无上限
+    count: int
+
+class CategoryFacetOut(BaseModel):
+    category_id: int                    # 0 表示未分类
+    name: str
+    product_count: int
+    in_stock_count: int
+    price_histogram: List[PriceBucketOut]
@@ -1,15 +1,16 @@
 # app/schemas/order.py
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List
 from datetime import datetime
 
+from mcpshop.models.order import OrderStatus
+
 class OrderItemOut(BaseModel):
     sku: str
     quantity: int
     unit_price: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class OrderCreate(BaseModel):
     # 如果前端传当前购物车，就不用再传 items
@@ -18,9 +19,8 @@ class OrderCreate(BaseModel):
 class OrderOut(BaseModel):
     order_id: int
     total_cents: int
-    status: str
+    status: OrderStatus         # PENDING：已受理，后台处理中；PAID / CANCELLED：处理完成
     created_at: datetime
     items: List[OrderItemOut]
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
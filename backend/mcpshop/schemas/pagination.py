@@ -0,0 +1,10 @@
+# app/schemas/pagination.py
+from pydantic import BaseModel
+from typing import Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    """游标分页响应：next_cursor 为空表示已到最后一页"""
+    items: List[T]
+    next_cursor: Optional[str] = None
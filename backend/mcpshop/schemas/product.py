@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Optional
 
@@ -21,10 +21,19 @@ class ProductUpdate(BaseModel):
     image_url: Optional[str] = None
     category_id: Optional[int] = None
 
+class ProductSuggestion(BaseModel):
+    sku: str
+    name: str
+
+class HotStockOut(BaseModel):
+    sku: str
+    available: int      # Redis 中的可售数
+    reserved: int       # 已预扣、订单尚未完成
+    pending: int        # 已成交、尚未写回数据库
+
 class ProductOut(ProductBase):
     sku: str
     created_at: datetime
     updated_at: Optional[datetime] = None
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
@@ -21,6 +21,9 @@ class UserCreate(UserBase):
             raise ValueError("用户名只能包含英文字母和数字，且长度 3~50")
         return v
 
+class UserAdminUpdate(BaseModel):
+    is_admin: bool
+
 class UserOut(UserBase):
     user_id:    int
     is_admin:   bool              # —— 新增字段 ——
@@ -0,0 +1,191 @@
+"""
+下单压测：并发下单、商品高度重叠
+----------------------------------------------
+    python -m mcpshop.scripts.bench_checkout [--orders 2000] [--concurrency 32]
+                                             [--skus 20] [--lines 3] [--workers 4] [--cleanup]
+
+准备 --skus 个压测商品（BENCH- 前缀，库存充足）和 --concurrency 个压测用户，
+每个并发任务反复下单：从这批商品里随机挑 --lines 个、以随机顺序传入，
+模拟不同购物车以不同顺序争抢同一批行锁。
+走线上的下单路径：submit_order 受理，本进程起 --workers 个 outbox worker 执行 order.placed
+（allocate_order 锁行扣库存）。输出受理延迟分位数、全部订单处理完的 orders/s、失败原因，
+并核对库存扣减与已成交订单明细是否一致。
+--cleanup 删除压测产生的订单、商品和用户，并重算分类聚合和销售统计。
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from sqlalchemy import delete, func, select
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.crud.analytics import rebuild_sales_analytics
+from mcpshop.crud.category import refresh_category_facets
+from mcpshop.crud.order import submit_order
+from mcpshop.crud.product import bulk_upsert_products, product_cache
+from mcpshop.db.session import AsyncSessionLocal, engine
+from mcpshop.models.order import Order, OrderStatus
+from mcpshop.models.order_item import OrderItem
+from mcpshop.models.product import Product
+from mcpshop.models.user import User
+from mcpshop.services import order_pipeline  # noqa: F401  注册 order.placed 处理函数
+from mcpshop.services.outbox import OutboxWorkerPool, notify
+
+SKU_PREFIX = "BENCH-"
+USER_PREFIX = "bench_user_"
+INITIAL_STOCK = 10_000_000
+
+
+async def _prepare(skus: int, users: int) -> list[int]:
+    async with AsyncSessionLocal() as db:
+        await bulk_upsert_products(db, [
+            {"sku": f"{SKU_PREFIX}{i:04d}", "name": f"压测商品 {i}", "price_cents": 100 + i,
+             "stock": INITIAL_STOCK, "description": None, "image_url": None, "category_id": None}
+            for i in range(skus)
+        ])
+        existing = set((await db.execute(
+            select(User.username).where(User.username.like(f"{USER_PREFIX}%"))
+        )).scalars())
+        for i in range(users):
+            name = f"{USER_PREFIX}{i}"
+            if name not in existing:
+                db.add(User(username=name, email=f"{name}@bench.invalid", password_hash="!"))
+        await db.commit()
+        await refresh_category_facets(db)
+        await product_cache.invalidate(*(f"{SKU_PREFIX}{i:04d}" for i in range(skus)))
+        result = await db.execute(
+            select(User.user_id).where(User.username.like(f"{USER_PREFIX}%")).order_by(User.user_id).limit(users)
+        )
+        return list(result.scalars())
+
+
+async def _worker(user_id: int, skus: list[str], lines: int, quota: list[int],
+                  latencies: list[float], errors: Counter, order_ids: list[int]) -> None:
+    rng = random.Random(user_id)
+    while quota[0] > 0:
+        quota[0] -= 1
+        items = [{"sku": sku, "quantity": 1} for sku in rng.sample(skus, lines)]   # 顺序随机
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                order = await submit_order(db, user_id, items)
+            latencies.append(time.perf_counter() - started)
+            order_ids.append(order.order_id)
+            notify()
+        except Exception as e:
+            errors[type(e).__name__] += 1
+
+
+async def _drain(order_ids: list[int], timeout: float = 300.0) -> Counter:
+    """等待压测订单全部离开 PENDING，返回各状态的订单数"""
+    deadline = time.monotonic() + timeout
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Order.status, func.count()).where(Order.order_id.in_(order_ids)).group_by(Order.status)
+            )
+            statuses = Counter({status: n for status, n in result})
+        if not statuses[OrderStatus.PENDING] or time.monotonic() > deadline:
+            return statuses
+        await asyncio.sleep(0.2)
+
+
+async def _verify(skus: list[str]) -> tuple[int, int]:
+    """返回 (库存扣减总数, 已成交订单明细数量总和)，二者应相等"""
+    async with AsyncSessionLocal() as db:
+        stock = (await db.execute(
+            select(func.coalesce(func.sum(Product.stock), 0)).where(Product.sku.in_(skus))
+        )).scalar_one()
+        sold = (await db.execute(
+            select(func.coalesce(func.sum(OrderItem.quantity), 0))
+            .join(Order, Order.order_id == OrderItem.order_id)
+            .where(OrderItem.sku.in_(skus), Order.status.in_((OrderStatus.PAID, OrderStatus.SHIPPED)))
+        )).scalar_one()
+    return INITIAL_STOCK * len(skus) - stock, sold
+
+
+async def _cleanup(skus: list[str]) -> None:
+    async with AsyncSessionLocal() as db:
+        bench_users = select(User.user_id).where(User.username.like(f"{USER_PREFIX}%"))
+        bench_orders = select(Order.order_id).where(Order.user_id.in_(bench_users))
+        await db.execute(delete(OrderItem).where(OrderItem.order_id.in_(bench_orders)))
+        await db.execute(delete(Order).where(Order.user_id.in_(bench_users)))
+        await db.execute(delete(Product).where(Product.sku.in_(skus)))
+        await db.execute(delete(User).where(User.username.like(f"{USER_PREFIX}%")))
+        await db.commit()
+        await refresh_category_facets(db)
+        # 销售统计里已累加了压测订单（日汇总无法按用户拆出来），按剩下的订单全量重算
+        await rebuild_sales_analytics(db)
+    await product_cache.invalidate(*skus)
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+async def _main(orders: int, concurrency: int, skus: int, lines: int, workers: int, cleanup: bool) -> None:
+    engine.echo = False
+    sku_list = [f"{SKU_PREFIX}{i:04d}" for i in range(skus)]
+    pool = OutboxWorkerPool(
+        workers=workers, batch=settings.OUTBOX_BATCH, poll_interval=settings.OUTBOX_POLL_INTERVAL,
+        lease=settings.OUTBOX_LEASE, max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    )
+    pool_task = None
+    try:
+        user_ids = await _prepare(skus, concurrency)
+        # 已有压测订单时（未 --cleanup 的上一轮）把库存核对基线算进去
+        before = await _verify(sku_list)
+        latencies: list[float] = []
+        errors: Counter = Counter()
+        order_ids: list[int] = []
+        quota = [orders]
+        pool_task = asyncio.create_task(pool.run(AsyncSessionLocal))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _worker(uid, sku_list, min(lines, skus), quota, latencies, errors, order_ids) for uid in user_ids
+        ))
+        accepted = time.perf_counter() - started
+        statuses = await _drain(order_ids)
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        logger.info(
+            f"受理 {len(latencies)} 笔，失败 {sum(errors.values())}，耗时 {accepted:.2f}s；"
+            f"受理延迟 p50={_percentile(latencies, 0.5) * 1000:.1f}ms "
+            f"p95={_percentile(latencies, 0.95) * 1000:.1f}ms p99={_percentile(latencies, 0.99) * 1000:.1f}ms"
+        )
+        logger.info(
+            f"全部处理完耗时 {elapsed:.2f}s，{len(order_ids) / elapsed:.1f} orders/s；"
+            + "，".join(f"{status.value} {n}" for status, n in statuses.items())
+        )
+        for name, count in errors.most_common():
+            logger.warning(f"失败：{name} × {count}")
+        deducted, sold = await _verify(sku_list)
+        if deducted - before[0] == sold - before[1]:
+            logger.info(f"库存核对一致：本轮扣减 {deducted - before[0]}")
+        else:
+            logger.error(f"库存核对不一致：扣减 {deducted - before[0]}，订单明细 {sold - before[1]}")
+        if cleanup:
+            await _cleanup(sku_list)
+            logger.info("压测数据已清理")
+    finally:
+        if pool_task is not None:
+            pool_task.cancel()
+            await asyncio.gather(pool_task, return_exceptions=True)
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并发下单压测（商品重叠、加锁顺序随机）")
+    parser.add_argument("--orders", type=int, default=2000, help="总下单数")
+    parser.add_argument("--concurrency", type=int, default=32, help="并发任务数（每个任务一个压测用户）")
+    parser.add_argument("--skus", type=int, default=20, help="参与争抢的商品数，越少冲突越多")
+    parser.add_argument("--lines", type=int, default=3, help="每笔订单的商品行数")
+    parser.add_argument("--workers", type=int, default=settings.OUTBOX_WORKERS, help="本进程的 outbox worker 数")
+    parser.add_argument("--cleanup", action="store_true", help="结束后删除压测数据")
+    args = parser.parse_args()
+    asyncio.run(_main(args.orders, args.concurrency, args.skus, args.lines, args.workers, args.cleanup))
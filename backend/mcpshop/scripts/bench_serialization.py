@@ -0,0 +1,207 @@
+"""
+列表接口序列化压测：默认路径 vs 快速路径
+----------------------------------------------
+    python -m mcpshop.scripts.bench_serialization [--products 2000] [--orders 500] [--limit 100]
+                                                  [--rounds 50] [--desc-len 2000] [--cleanup]
+
+准备 --products 个压测商品（BENCH-SER- 前缀，描述长 --desc-len 字）和一个压测用户的 --orders 笔订单
+（每笔 3 行明细），对商品列表、订单列表、购物车列表各跑 --rounds 轮，每轮取 --limit 条：
+- 默认路径：查出完整 ORM 实体（订单 selectinload 明细），按 FastAPI 处理 response_model 的方式
+  校验 → 转成 JSON 兼容的 dict → json.dumps；
+- 快速路径：只查响应模型需要的列（Core Row），预构建的 TypeAdapter 校验后用 orjson 编码
+  （core.serialization.dump_response，即接口实际使用的路径）。
+输出两条路径查询、序列化各自耗时的中位数和响应体大小，并核对两边输出的 JSON 是否一致。
+购物车数据在 Redis、商品快照来自缓存，只比较序列化。
+--cleanup 删除压测产生的订单、商品和用户。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+from sqlalchemy import delete, select
+from sqlalchemy.orm import selectinload
+
+from mcpshop.core.logger import logger
+from mcpshop.core.pagination import apply_keyset, paginate
+from mcpshop.core.serialization import dump_response, orjson
+from mcpshop.crud.category import refresh_category_facets
+from mcpshop.crud.order import list_order_rows_page
+from mcpshop.crud.product import PRODUCT_OUT_COLUMNS, bulk_upsert_products, product_cache
+from mcpshop.db.session import AsyncSessionLocal, engine
+from mcpshop.models.order import Order, OrderStatus
+from mcpshop.models.order_item import OrderItem
+from mcpshop.models.product import Product
+from mcpshop.models.user import User
+from mcpshop.schemas.cart import CartItemOut
+from mcpshop.schemas.order import OrderOut
+from mcpshop.schemas.pagination import Page
+from mcpshop.schemas.product import ProductOut
+
+SKU_PREFIX = "BENCH-SER-"
+USERNAME = "bench_serialization"
+
+
+async def _prepare(products: int, orders: int, desc_len: int) -> int:
+    text = ("这是一段用于压测序列化的商品描述，" * (desc_len // 16 + 1))[:desc_len]
+    async with AsyncSessionLocal() as db:
+        await bulk_upsert_products(db, [
+            {"sku": f"{SKU_PREFIX}{i:05d}", "name": f"序列化压测商品 {i}", "price_cents": 100 + i,
+             "stock": 1000, "description": text, "image_url": f"https://img.invalid/{i}.jpg",
+             "category_id": None}
+            for i in range(products)
+        ])
+        user = (await db.execute(select(User).where(User.username == USERNAME))).scalars().first()
+        if user is None:
+            user = User(username=USERNAME, email=f"{USERNAME}@bench.invalid", password_hash="!")
+            db.add(user)
+            await db.flush()
+        existing = len((await db.execute(select(Order.order_id).where(Order.user_id == user.user_id))).all())
+        for n in range(existing, orders):
+            skus = [f"{SKU_PREFIX}{(n * 3 + k) % products:05d}" for k in range(3)]
+            db.add(Order(
+                user_id=user.user_id, total_cents=300, status=OrderStatus.PAID,
+                items=[OrderItem(sku=sku, quantity=1, unit_price=100) for sku in skus],
+            ))
+        await db.commit()
+        await refresh_category_facets(db)
+        await product_cache.invalidate(*(f"{SKU_PREFIX}{i:05d}" for i in range(products)))
+        return user.user_id
+
+
+async def _cleanup(products: int) -> None:
+    skus = [f"{SKU_PREFIX}{i:05d}" for i in range(products)]
+    async with AsyncSessionLocal() as db:
+        bench_orders = select(Order.order_id).where(
+            Order.user_id.in_(select(User.user_id).where(User.username == USERNAME))
+        )
+        await db.execute(delete(OrderItem).where(OrderItem.order_id.in_(bench_orders)))
+        await db.execute(delete(Order).where(Order.order_id.in_(bench_orders)))
+        await db.execute(delete(Product).where(Product.sku.in_(skus)))
+        await db.execute(delete(User).where(User.username == USERNAME))
+        await db.commit()
+        await refresh_category_facets(db)
+    await product_cache.invalidate(*skus)
+
+
+async def _default_body(response_model, content) -> bytes:
+    """FastAPI 处理 response_model 的默认路径（routing.serialize_response + JSONResponse）"""
+    field = create_model_field(name="Response_bench", type_=response_model, mode="serialization")
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+def _product_stmt(columns, limit: int):
+    stmt = select(*columns).where(Product.sku.like(f"{SKU_PREFIX}%"))
+    return apply_keyset(stmt, [Product.created_at, Product.sku], None).limit(limit + 1)
+
+
+async def _products_default(limit: int) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(_product_stmt([Product], limit))).scalars().all()
+    items, next_cursor = paginate(rows, limit, lambda p: (p.created_at, p.sku))
+    loaded = time.perf_counter()
+    body = await _default_body(Page[ProductOut], {"items": items, "next_cursor": next_cursor})
+    return body, loaded - started
+
+
+async def _products_fast(limit: int, adapter: TypeAdapter) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(_product_stmt(PRODUCT_OUT_COLUMNS, limit))).all()
+    items, next_cursor = paginate(rows, limit, lambda r: (r.created_at, r.sku))
+    loaded = time.perf_counter()
+    return dump_response(adapter, {"items": items, "next_cursor": next_cursor}).body, loaded - started
+
+
+async def _orders_default(user_id: int, limit: int) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        stmt = select(Order).options(selectinload(Order.items)).where(Order.user_id == user_id)
+        rows = (await db.execute(
+            apply_keyset(stmt, [Order.created_at, Order.order_id], None).limit(limit + 1)
+        )).scalars().all()
+    items, next_cursor = paginate(rows, limit, lambda o: (o.created_at, o.order_id))
+    loaded = time.perf_counter()
+    body = await _default_body(Page[OrderOut], {"items": items, "next_cursor": next_cursor})
+    return body, loaded - started
+
+
+async def _orders_fast(user_id: int, limit: int, adapter: TypeAdapter) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        items, next_cursor = await list_order_rows_page(db, limit, user_id=user_id)
+    loaded = time.perf_counter()
+    return dump_response(adapter, {"items": items, "next_cursor": next_cursor}).body, loaded - started
+
+
+async def _run(name: str, rounds: int, default, fast) -> None:
+    """交替执行两条路径 rounds 轮，输出查询 / 序列化耗时中位数（ms）"""
+    timings = {"default": ([], []), "fast": ([], [])}
+    bodies = {}
+    for _ in range(rounds):
+        for path, fn in (("default", default), ("fast", fast)):
+            started = time.perf_counter()
+            body, query = await fn()
+            total = time.perf_counter() - started
+            timings[path][0].append(query * 1000)
+            timings[path][1].append((total - query) * 1000)
+            bodies[path] = body
+    same = json.loads(bodies["default"]) == json.loads(bodies["fast"])
+    (dq, ds), (fq, fs) = ([statistics.median(t) for t in timings[p]] for p in ("default", "fast"))
+    logger.info(
+        f"[{name}] 默认路径 查询 {dq:.2f}ms + 序列化 {ds:.2f}ms = {dq + ds:.2f}ms，{len(bodies['default'])} 字节；"
+        f"快速路径 查询 {fq:.2f}ms + 序列化 {fs:.2f}ms = {fq + fs:.2f}ms，{len(bodies['fast'])} 字节；"
+        f"序列化 {ds / fs if fs else 0:.1f}x，合计 {(dq + ds) / (fq + fs) if fq + fs else 0:.1f}x；"
+        f"输出{'一致' if same else '不一致！'}"
+    )
+
+
+async def _main(args) -> None:
+    engine.echo = False
+    if orjson is None:
+        logger.warning("未安装 orjson，快速路径使用 pydantic 自带的 dump_json")
+    try:
+        user_id = await _prepare(args.products, args.orders, args.desc_len)
+        limit = args.limit
+        product_page, order_page = TypeAdapter(Page[ProductOut]), TypeAdapter(Page[OrderOut])
+        cart_list = TypeAdapter(List[CartItemOut])
+
+        await _run("商品列表", args.rounds,
+                   lambda: _products_default(limit), lambda: _products_fast(limit, product_page))
+        await _run("订单列表", args.rounds,
+                   lambda: _orders_default(user_id, limit), lambda: _orders_fast(user_id, limit, order_page))
+
+        async with AsyncSessionLocal() as db:
+            products = (await db.execute(_product_stmt([Product], limit))).scalars().all()
+        cart = [{"sku": p.sku, "quantity": 1, "added_at": p.created_at, "product": p} for p in products]
+
+        async def cart_default():
+            return await _default_body(List[CartItemOut], cart), 0.0
+
+        async def cart_fast():
+            return dump_response(cart_list, cart).body, 0.0
+
+        await _run("购物车列表", args.rounds, cart_default, cart_fast)
+        if args.cleanup:
+            await _cleanup(args.products)
+            logger.info("压测数据已清理")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="列表接口序列化压测（默认路径 vs 列投影 + TypeAdapter + orjson）")
+    parser.add_argument("--products", type=int, default=2000, help="压测商品数")
+    parser.add_argument("--orders", type=int, default=500, help="压测用户的订单数")
+    parser.add_argument("--limit", type=int, default=100, help="每页条数")
+    parser.add_argument("--rounds", type=int, default=50, help="每个场景的轮数")
+    parser.add_argument("--desc-len", type=int, default=2000, help="商品描述长度（字）")
+    parser.add_argument("--cleanup", action="store_true", help="结束后删除压测数据")
+    asyncio.run(_main(parser.parse_args()))
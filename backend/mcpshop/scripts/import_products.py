@@ -0,0 +1,53 @@
+"""
+商品目录批量导入
+----------------------------------------------
+    python -m mcpshop.scripts.import_products feed.csv [--format csv|jsonl]
+                                             [--batch-size 1000] [--sync-index]
+
+流式读取 CSV / JSONL（可为 .gz），按 sku 分批 INSERT ... ON CONFLICT DO UPDATE，
+定期打印进度和吞吐（rows/s），结束时输出错误行（最多 1000 条）。
+--sync-index 会在导入后做一次语义索引对账；不加时可稍后运行 sync_product_index。
+"""
+import argparse
+import asyncio
+
+from mcpshop.core.logger import logger
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.services.catalog_import import FORMATS, ImportReport, detect_format, import_products, open_text
+from mcpshop.services.product_index import product_index, schedule_reconcile
+
+
+def _log_progress(report: ImportReport) -> None:
+    logger.info(
+        f"已处理 {report.processed} 行，写入 {report.upserted}，失败 {report.failed}，"
+        f"{report.rows_per_sec} rows/s"
+    )
+
+
+async def _main(path: str, fmt: str | None, batch_size: int, sync_index: bool) -> None:
+    fmt = fmt or detect_format(path)
+    with open(path, "rb") as raw, open_text(raw, path) as stream:
+        async with AsyncSessionLocal() as db:
+            report = await import_products(db, stream, fmt, batch_size=batch_size, on_progress=_log_progress)
+            for err in report.errors:
+                logger.warning(f"第 {err['line']} 行（sku={err['sku']}）：{err['error']}")
+            logger.info(
+                f"导入完成：处理 {report.processed} 行，写入 {report.upserted}，失败 {report.failed}，"
+                f"耗时 {report.elapsed:.1f}s，{report.rows_per_sec} rows/s"
+            )
+            if sync_index and product_index.try_own_writes():
+                stats = await product_index.reconcile(db)
+                logger.info(f"语义索引对账完成：{stats}")
+            elif sync_index:
+                await schedule_reconcile()
+                logger.info("语义索引由运行中的服务写入，已提交对账任务")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="商品目录批量导入")
+    parser.add_argument("path", help="商品文件：.csv / .jsonl / .ndjson，可带 .gz")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="缺省按扩展名判断")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--sync-index", action="store_true", help="导入后对账语义索引")
+    args = parser.parse_args()
+    asyncio.run(_main(args.path, args.format, args.batch_size, args.sync_index))
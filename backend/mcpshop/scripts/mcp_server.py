@@ -6,15 +6,18 @@ from fastmcp import FastMCP
 from mcpshop.db.session import AsyncSessionLocal
 from mcpshop.crud import product as crud_product, cart as crud_cart
 from mcpshop.schemas.product import ProductCreate
+from mcpshop.schemas.cart import CartBatchUpdate
 from mcpshop.core.security import decode_access_token
-from mcpshop.crud.user import get_user_by_username
+from mcpshop.core.search import SEARCH_MODES, SORT_OPTIONS
+from mcpshop.services.product_index import SemanticIndexError
+from mcpshop.crud.user import delete_user as delete_user_record, get_user_by_username, list_users_page
+from mcpshop.crud.order import list_orders_page
+from mcpshop.crud.analytics import get_sales_summary, get_top_customers
 from sqlalchemy.exc import IntegrityError
 from jose import JWTError
+from fastapi import HTTPException
+from pydantic import ValidationError
 from sqlalchemy import text
-from sqlalchemy import select
-from mcpshop.models.user import User
-from sqlalchemy import select
-from mcpshop.models.order import Order
 from typing import Optional
 # 强制覆盖系统环境变量
 load_dotenv(r"C:\CodeProject\Pycharm\MCPshop\.env", override=True)
@@ -23,15 +26,41 @@ mcp = FastMCP("SmartStoreToolServer")
 
 # 公共工具：列商品
 @mcp.tool()
-async def list_products(q: str = "", top_k: int = 5) -> list[dict]:
+async def list_products(
+    q: str = "", top_k: int = 5, sort: str = "relevance", mode: str = "hybrid"
+) -> list[dict]:
+    """
+    搜索商品，sort 可选 relevance / price_asc / price_desc / newest；
+    mode=hybrid（默认）同时按关键词和语义召回并融合排序，mode=lexical 只按关键词。
+    """
+    if sort not in SORT_OPTIONS:
+        sort = "relevance"
+    if mode not in SEARCH_MODES:
+        mode = "hybrid"
     async with AsyncSessionLocal() as db:
-        items = await crud_product.search_products(db, q, top_k)
+        items = await crud_product.search_products(db, q, top_k, sort, mode)
     return [
         {"sku": p.sku, "name": p.name,
          "price": p.price_cents / 100, "stock": p.stock}
         for p in items
     ]
 
+# 公共工具：语义检索商品（自然语言描述，如「便宜的防水鞋」）
+@mcp.tool()
+async def semantic_search_products(q: str, top_k: int = 5, max_price: float | None = None) -> str:
+    """按自然语言描述检索商品，max_price 为价格上限（元）"""
+    max_price_cents = round(max_price * 100) if max_price is not None else None     # 19.99 * 100 = 1998.99…
+    async with AsyncSessionLocal() as db:
+        try:
+            items = await crud_product.semantic_search_products(db, q, top_k, max_price_cents)
+        except SemanticIndexError as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+    return json.dumps([
+        {"sku": p.sku, "name": p.name,
+         "price": p.price_cents / 100, "stock": p.stock}
+        for p in items
+    ], ensure_ascii=False)
+
 # 公共工具：加购物车
 @mcp.tool()
 async def add_to_cart(user_id: int, sku: str, qty: int = 1) -> dict:
@@ -39,6 +68,27 @@ async def add_to_cart(user_id: int, sku: str, qty: int = 1) -> dict:
         await crud_cart.add_to_cart(db, user_id, sku, qty)
     return {"ok": True}
 
+# 公共工具：批量改购物车
+@mcp.tool()
+async def update_cart(user_id: int, operations: list[dict]) -> str:
+    """
+    一次修改多个商品，全部成功或全部不生效。
+    operations 形如 [{"sku": "A1", "delta": 2}, {"sku": "B2", "quantity": 0}]：
+    delta 为增减数量，quantity 为设为该数量（0 表示移除），二者选一。
+    """
+    try:
+        body = CartBatchUpdate(operations=operations)
+    except ValidationError as e:
+        return json.dumps({"error": e.errors(include_url=False)}, ensure_ascii=False, default=str)
+    async with AsyncSessionLocal() as db:
+        try:
+            items = await crud_cart.update_cart(db, user_id, body.operations)
+        except HTTPException as e:
+            return json.dumps({"error": e.detail}, ensure_ascii=False)
+    return json.dumps({"ok": True, "cart": [
+        {"sku": i["sku"], "name": i["product"].name, "quantity": i["quantity"]} for i in items
+    ]}, ensure_ascii=False)
+
 # 管理员工具：添加商品
 @mcp.tool()
 async def add_product(
@@ -83,9 +133,10 @@ async def add_product(
         except IntegrityError:
             return json.dumps({"error": f"SKU “{sku}” 已存在，请换一个。"}, ensure_ascii=False)
 
-#管理员工具：列全部用户
+#管理员工具：列全部用户（游标分页）
 @mcp.tool()
-async def list_users(token: str) -> str:
+async def list_users(token: str, limit: int = 50, cursor: Optional[str] = None) -> str:
+    """分页列出用户；返回 next_cursor 不为空时，用它作为 cursor 取下一页"""
     try:
         username = decode_access_token(token)
     except JWTError:
@@ -94,12 +145,16 @@ async def list_users(token: str) -> str:
         user = await get_user_by_username(db, username)
         if not user or not user.is_admin:
             return json.dumps({"error": "管理员权限不足"}, ensure_ascii=False)
-        # ORM查询所有用户
-        result = await db.execute(select(User))
-        users = result.scalars().all()
-        return json.dumps([{
-            "user_id": u.user_id, "username": u.username, "email": u.email, "is_admin": u.is_admin
-        } for u in users], ensure_ascii=False)
+        try:
+            users, next_cursor = await list_users_page(db, max(1, min(limit, 200)), cursor)
+        except ValueError as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+        return json.dumps({
+            "items": [{
+                "user_id": u.user_id, "username": u.username, "email": u.email, "is_admin": u.is_admin
+            } for u in users],
+            "next_cursor": next_cursor,
+        }, ensure_ascii=False)
 
 #管理员工具：删除用户
 @mcp.tool()
@@ -122,12 +177,19 @@ async def delete_user(token: str, username: str) -> str:
         user = await get_user_by_username(db, username)
         if not user:
             return json.dumps({"error": "用户不存在"}, ensure_ascii=False)
-        await db.delete(user)
-        await db.commit()
+        await delete_user_record(db, user)        # 同时失效 API 进程的鉴权缓存
         return json.dumps({"ok": True, "deleted_user": username}, ensure_ascii=False)
 
 @mcp.tool()
-async def list_all_orders(token: Optional[str] = None) -> str:   # ✅ 可选
+async def list_all_orders(
+    token: Optional[str] = None,    # ✅ 可选
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> str:
+    """
+    分页列出全部订单（按下单时间倒序）；next_cursor 不为空时用它取下一页。
+    营业额、销量、热销商品等统计问题请用 sales_summary，不要逐页汇总订单。
+    """
     # —— 1. 补 token，如果后端没注入就报错 ——
     if not token:       # None 或空串都算未注入
         return json.dumps({"error": "缺少管理员 Token"}, ensure_ascii=False)
@@ -143,9 +205,13 @@ async def list_all_orders(token: Optional[str] = None) -> str:   # ✅ 可选
         if not user or not user.is_admin:
             return json.dumps({"error": "管理员权限不足"}, ensure_ascii=False)
 
-        result = await db.execute(select(Order))          # ORM 写法更稳
-        orders  = result.scalars().all()
-        payload = [{
+        try:
+            orders, next_cursor = await list_orders_page(
+                db, max(1, min(limit, 200)), cursor, with_items=False
+            )
+        except ValueError as e:
+            return json.dumps({"error": str(e)}, ensure_ascii=False)
+        items = [{
             "order_id":    o.order_id,
             "user_id":     o.user_id,
             "total_cents": o.total_cents,
@@ -153,7 +219,46 @@ async def list_all_orders(token: Optional[str] = None) -> str:   # ✅ 可选
             "created_at":  o.created_at.isoformat(),
         } for o in orders]
 
-        return json.dumps(payload, ensure_ascii=False)
+        return json.dumps({"items": items, "next_cursor": next_cursor}, ensure_ascii=False)
+
+
+#管理员工具：销售统计（读预聚合结果，只返回汇总数字）
+@mcp.tool()
+async def sales_summary(token: Optional[str] = None, days: int = 7, top: int = 5) -> str:
+    """
+    最近 days 天（含今天）的成交汇总：订单数、件数、营业额（元）、客单价、
+    每日走势 [日期, 订单数, 营业额]、热销商品和消费最高的用户。
+    """
+    if not token:
+        return json.dumps({"error": "缺少管理员 Token"}, ensure_ascii=False)
+    try:
+        username = decode_access_token(token)
+    except JWTError:
+        return json.dumps({"error": "无效或过期 Token"}, ensure_ascii=False)
+
+    async with AsyncSessionLocal() as db:
+        user = await get_user_by_username(db, username)
+        if not user or not user.is_admin:
+            return json.dumps({"error": "管理员权限不足"}, ensure_ascii=False)
+        top = max(1, min(top, 20))
+        summary = await get_sales_summary(db, max(1, min(days, 366)), top)
+        customers = await get_top_customers(db, top)
+    return json.dumps({
+        "range": [summary["start"].isoformat(), summary["end"].isoformat()],
+        "orders": summary["orders"],
+        "units": summary["units"],
+        "revenue": summary["revenue_cents"] / 100,
+        "avg_order": summary["avg_order_cents"] / 100,
+        "daily": [[d["day"].isoformat(), d["orders"], d["revenue_cents"] / 100] for d in summary["daily"]],
+        "top_skus": [
+            {"sku": t["sku"], "name": t["name"], "units": t["units"], "revenue": t["revenue_cents"] / 100}
+            for t in summary["top_skus"]
+        ],
+        "top_customers": [
+            {"username": c["username"], "orders": c["orders"], "revenue": c["revenue_cents"] / 100}
+            for c in customers
+        ],
+    }, ensure_ascii=False)
 
 
 if __name__ == "__main__":
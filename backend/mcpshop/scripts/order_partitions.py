@@ -0,0 +1,92 @@
+"""
+订单分区管理（PostgreSQL）
+----------------------------------------------
+    python -m mcpshop.scripts.order_partitions status
+    python -m mcpshop.scripts.order_partitions migrate
+    python -m mcpshop.scripts.order_partitions ensure [--months 3]
+    python -m mcpshop.scripts.order_partitions archive --before 2025-01 [--dir data/archive]
+
+status   列出现有月分区和各自的订单数
+migrate  把已有的普通表 orders / order_items 迁成按月分区表（单事务，期间下单会阻塞，请在低峰执行）
+ensure   补建当月起 --months 个月的分区
+archive  把 --before 所在月之前的分区导出为 Parquet 后删除（需要 pyarrow）
+"""
+import argparse
+import asyncio
+from datetime import date
+
+from sqlalchemy import text
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.db.partitions import (
+    add_months, current_month, ensure_partitions, is_partitioned, list_partitions,
+    migrate_to_partitioned, partition_name,
+)
+from mcpshop.db.session import AsyncSessionLocal, engine
+from mcpshop.services.order_partitions import archive_before
+
+
+def _month(value: str) -> date:
+    try:
+        year, month = value.split("-")
+        return date(int(year), int(month), 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError("格式应为 YYYY-MM")
+
+
+async def _status() -> None:
+    async with engine.connect() as conn:
+        state = await is_partitioned(conn, "orders")
+        if not state:
+            logger.info("orders 不存在" if state is None else "orders 是普通表，尚未分区（可运行 migrate）")
+            return
+        for month in await list_partitions(conn, "orders"):
+            count = (await conn.execute(text(f"SELECT count(*) FROM {partition_name('orders', month)}"))).scalar()
+            logger.info(f"{month:%Y-%m}  {count} 单")
+
+
+async def _migrate() -> None:
+    async with engine.begin() as conn:
+        moved = await migrate_to_partitioned(conn, settings.ORDER_PARTITION_PREMAKE)
+    logger.info(f"迁移完成：{moved} 单")
+
+
+async def _ensure(months: int) -> None:
+    async with engine.begin() as conn:
+        month = current_month()
+        created = await ensure_partitions(conn, month, add_months(month, months))
+    logger.info(f"新建分区：{', '.join(created) or '无'}")
+
+
+async def _archive(before: date, directory: str | None) -> None:
+    months = await archive_before(AsyncSessionLocal, before, directory)
+    logger.info(f"已归档 {len(months)} 个月：{', '.join(f'{m:%Y-%m}' for m in months) or '无'}")
+
+
+async def _main(args) -> None:
+    engine.echo = False
+    try:
+        if args.command == "status":
+            await _status()
+        elif args.command == "migrate":
+            await _migrate()
+        elif args.command == "ensure":
+            await _ensure(args.months)
+        else:
+            await _archive(args.before, args.dir)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="订单按月分区管理与冷数据归档（PostgreSQL）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="列出分区")
+    sub.add_parser("migrate", help="普通表迁成分区表")
+    ensure = sub.add_parser("ensure", help="补建未来分区")
+    ensure.add_argument("--months", type=int, default=settings.ORDER_PARTITION_PREMAKE)
+    archive = sub.add_parser("archive", help="归档旧分区为 Parquet 并删除")
+    archive.add_argument("--before", type=_month, required=True, help="归档此月（YYYY-MM）之前的分区")
+    archive.add_argument("--dir", default=None, help=f"归档目录，默认 {settings.ORDER_ARCHIVE_DIR}")
+    asyncio.run(_main(parser.parse_args()))
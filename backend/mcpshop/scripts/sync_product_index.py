@@ -0,0 +1,34 @@
+"""
+商品语义索引全量对账
+----------------------------------------------
+    python -m mcpshop.scripts.sync_product_index [--batch-size 256]
+
+逐批扫描 products 表写入 ChromaDB，只有内容哈希变化的商品才会重新嵌入，
+并清理索引里已被删除的商品。可用于首次建索引，或定时兜底增量同步的遗漏。
+本地索引正由运行中的服务写入时（写锁被占用），对账任务交给服务执行。
+"""
+import argparse
+import asyncio
+
+from mcpshop.core.logger import logger
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.core.redis import close_redis
+from mcpshop.services.product_index import product_index, schedule_reconcile
+
+
+async def _main(batch_size: int) -> None:
+    if not product_index.try_own_writes():
+        await schedule_reconcile()
+        await close_redis()
+        logger.info("语义索引由运行中的服务写入，已提交对账任务")
+        return
+    async with AsyncSessionLocal() as db:
+        stats = await product_index.reconcile(db, batch_size=batch_size)
+    logger.info(f"语义索引对账完成：{stats}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="商品语义索引全量对账")
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(_main(args.batch_size))
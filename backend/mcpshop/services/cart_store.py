@@ -0,0 +1,521 @@
+# mcpshop/services/cart_store.py
+"""
+Redis 购物车（write-behind 持久化到 cart_items）。
+
+- 每个用户一个 hash：cart:{user_id} = {sku: 数量, "_": 已加载标记}，
+  加购时间在 cart:{user_id}:added；增减数量由 Lua 脚本原子完成（含库存上限校验）；
+- 有变动的用户记入 cart:dirty 集合，后台 flusher 每 CART_FLUSH_INTERVAL 秒批量取出，
+  在一个事务里用 Redis 中的最新内容整体覆盖这些用户的 cart_items 行；
+  多个 worker 通过 Redis 锁保证同一时刻只有一个在写回，旧快照不会覆盖新快照；
+- Redis 里没有某用户的购物车（冷启动 / 过期）时先从 cart_items 装载，再执行操作；
+- Redis 不可用时直接读写 cart_items（与旧实现一致）。降级期间写过的用户记在本 worker，
+  Redis 恢复后（本 worker 下一次访问 Redis 或写回任务的下一轮）删除这些用户在 Redis 里的旧购物车，
+  下次访问从 cart_items 重新装载，降级期间的修改不会被旧状态覆盖；
+- 写回时丢弃已删除商品 / 用户的行（并从 Redis 购物车里清掉）；整批写入仍失败时逐个用户写回，
+  个别写不进去的购物车记日志后丢弃，不会卡住其他用户的写回。
+
+本模块只管数量；商品快照由 crud.cart 通过商品缓存拼装。
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.models.cart_item import CartItem
+from mcpshop.models.product import Product
+from mcpshop.models.user import User
+
+DIRTY_KEY = "cart:dirty"
+FLUSH_LOCK_KEY = "cart:flush:lock"
+_LOADED = "_"
+
+# KEYS: cart, added, dirty；ARGV: sku, delta, 上限, 当前时间, user_id, ttl
+# 返回 [状态, 数量]：状态 0 成功，-1 未装载，-2 超过上限（数量为原值）
+_INCR_LUA = """
+if redis.call('HEXISTS', KEYS[1], '_') == 0 then return {-1, 0} end
+local old = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local new = old + tonumber(ARGV[2])
+if tonumber(ARGV[2]) > 0 and new > tonumber(ARGV[3]) then return {-2, old} end
+if new <= 0 then
+  redis.call('HDEL', KEYS[1], ARGV[1])
+  redis.call('HDEL', KEYS[2], ARGV[1])
+  new = 0
+else
+  redis.call('HSET', KEYS[1], ARGV[1], new)
+  redis.call('HSETNX', KEYS[2], ARGV[1], ARGV[4])
+end
+redis.call('SADD', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return {0, new}
+"""
+
+# KEYS: cart, added；ARGV: ttl, 然后成对的 sku, 数量, 加购时间
+# 只在尚未装载时写入，避免并发装载覆盖刚发生的修改
+_LOAD_LUA = """
+if redis.call('HEXISTS', KEYS[1], '_') == 1 then return 0 end
+redis.call('HSET', KEYS[1], '_', '1')
+for i = 2, #ARGV, 3 do
+  redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+  redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 2])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return 1
+"""
+
+# KEYS: cart, added, dirty；ARGV: 当前时间, user_id, ttl, 然后每个操作四个参数 sku, set|delta, 值, 上限
+# 先按顺序算出全部新数量并校验（同一 sku 可出现多次），全部通过才写入：要么都生效，要么都不生效
+# 返回 {0, sku1, 数量1, ...}；{-1} 未装载；{-2, 第几个操作（从 0 开始）} 超过上限
+_APPLY_LUA = """
+if redis.call('HEXISTS', KEYS[1], '_') == 0 then return {-1} end
+local pending, order = {}, {}
+for b = 4, #ARGV, 4 do
+  local sku = ARGV[b]
+  local old = pending[sku]
+  if old == nil then
+    old = tonumber(redis.call('HGET', KEYS[1], sku) or '0')
+    table.insert(order, sku)
+  end
+  local value = tonumber(ARGV[b + 2])
+  local new = value
+  if ARGV[b + 1] == 'delta' then new = old + value end
+  if new < 0 then new = 0 end
+  if new > old and new > tonumber(ARGV[b + 3]) then return {-2, (b - 4) / 4} end
+  pending[sku] = new
+end
+local out = {0}
+for _, sku in ipairs(order) do
+  local new = pending[sku]
+  if new == 0 then
+    redis.call('HDEL', KEYS[1], sku)
+    redis.call('HDEL', KEYS[2], sku)
+  else
+    redis.call('HSET', KEYS[1], sku, new)
+    redis.call('HSETNX', KEYS[2], sku, ARGV[1])
+  end
+  table.insert(out, sku)
+  table.insert(out, new)
+end
+redis.call('SADD', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return out
+"""
+
+# KEYS: cart, added, dirty；ARGV: sku, user_id, ttl
+# 返回移除前的数量（不在购物车里为 0）；-1 未装载
+_REMOVE_LUA = """
+if redis.call('HEXISTS', KEYS[1], '_') == 0 then return -1 end
+local old = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+if old == 0 then return 0 end
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('SADD', KEYS[3], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return old
+"""
+
+# KEYS: cart, added, dirty；ARGV: user_id, ttl
+_CLEAR_LUA = """
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[1], '_', '1')
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('SADD', KEYS[3], ARGV[1])
+return 1
+"""
+
+
+class CartLimitError(ValueError):
+    """加购后数量会超过库存"""
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_time(raw: bytes | None) -> datetime:
+    """Redis 中的加购时间；SQLite 装载进来的无时区时间按 UTC 处理"""
+    if raw is None:
+        return datetime.now(timezone.utc)
+    moment = datetime.fromisoformat(raw.decode())
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class CartStore:
+    def __init__(self, ttl: int, flush_interval: float, flush_batch: int):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._scripts: dict[str, Any] = {}
+        self._fallback_users: set[int] = set()     # Redis 不可用期间直接写过 cart_items 的用户
+
+    @staticmethod
+    def _keys(user_id: int) -> tuple[str, str]:
+        return f"cart:{user_id}", f"cart:{user_id}:added"
+
+    def _script(self, name: str, source: str):
+        if name not in self._scripts:
+            self._scripts[name] = get_redis().register_script(source)
+        return self._scripts[name]
+
+    # ------------------------------------------------------------ #
+    # 读写
+    # ------------------------------------------------------------ #
+    async def get_lines(self, db: AsyncSession, user_id: int) -> list[dict[str, Any]]:
+        """返回 [{"sku", "quantity", "added_at"}]，按加购时间排序"""
+        try:
+            await self._evict_fallback_carts()
+            await self._ensure_loaded(db, user_id)
+            cart_key, added_key = self._keys(user_id)
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.hgetall(cart_key)
+            pipe.hgetall(added_key)
+            quantities, added = await pipe.execute()
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] Redis 不可用，直接读 cart_items：{e}")
+            return await self._db_lines(db, user_id)
+        lines = [
+            {
+                "sku": sku.decode(),
+                "quantity": int(qty),
+                "added_at": _parse_time(added.get(sku)),
+            }
+            for sku, qty in quantities.items() if sku.decode() != _LOADED
+        ]
+        return sorted(lines, key=lambda l: l["added_at"])
+
+    async def incr(self, db: AsyncSession, user_id: int, sku: str, delta: int, limit: int) -> int:
+        """
+        原子地把某商品数量加上 delta（可为负），返回新数量（0 表示已移出购物车）。
+        增加后超过 limit（库存）时抛出 CartLimitError，数量不变。
+        """
+        try:
+            await self._evict_fallback_carts()
+            status, quantity = await self._run_incr(db, user_id, sku, delta, limit)
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] Redis 不可用，直接写 cart_items：{e}")
+            self._fallback_users.add(user_id)
+            return await self._db_incr(db, user_id, sku, delta, limit)
+        if status == -2:
+            raise CartLimitError(f"商品 {sku} 库存不足")
+        return quantity
+
+    async def _run_incr(self, db, user_id, sku, delta, limit) -> tuple[int, int]:
+        cart_key, added_key = self._keys(user_id)
+        script = self._script("incr", _INCR_LUA)
+        for _ in range(2):
+            status, quantity = await script(
+                keys=[cart_key, added_key, DIRTY_KEY],
+                args=[sku, delta, limit, _now(), user_id, self.ttl],
+            )
+            if status != -1:
+                return int(status), int(quantity)
+            await self._ensure_loaded(db, user_id, force=True)
+        raise RuntimeError("购物车装载失败")
+
+    async def apply(
+        self, db: AsyncSession, user_id: int, ops: list[tuple[str, str, int]], limits: dict[str, int]
+    ) -> dict[str, int]:
+        """
+        原子地执行一批操作 ops = [(sku, "set" | "delta", 值)]，limits 为各 sku 的上限（库存）。
+        返回涉及 sku 的新数量（0 表示已移出）。任一操作使数量增加并超过上限时抛出
+        CartLimitError，整批都不生效。
+        """
+        args: list[Any] = [_now(), user_id, self.ttl]
+        for sku, mode, value in ops:
+            args += [sku, mode, value, limits.get(sku, 0)]
+        cart_key, added_key = self._keys(user_id)
+        try:
+            await self._evict_fallback_carts()
+            script = self._script("apply", _APPLY_LUA)
+            for _ in range(2):
+                result = await script(keys=[cart_key, added_key, DIRTY_KEY], args=args)
+                if result[0] != -1:
+                    break
+                await self._ensure_loaded(db, user_id, force=True)
+            else:
+                raise RuntimeError("购物车装载失败")
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] Redis 不可用，直接写 cart_items：{e}")
+            self._fallback_users.add(user_id)
+            return await self._db_apply(db, user_id, ops, limits)
+        if result[0] == -2:
+            raise CartLimitError(f"商品 {ops[int(result[1])][0]} 库存不足")
+        return {result[i].decode(): int(result[i + 1]) for i in range(1, len(result), 2)}
+
+    async def remove(self, db: AsyncSession, user_id: int, sku: str) -> int:
+        """把某商品移出购物车（HGET + HDEL 一次完成），返回移除前的数量"""
+        cart_key, added_key = self._keys(user_id)
+        try:
+            await self._evict_fallback_carts()
+            script = self._script("remove", _REMOVE_LUA)
+            for _ in range(2):
+                old = await script(keys=[cart_key, added_key, DIRTY_KEY], args=[sku, user_id, self.ttl])
+                if old != -1:
+                    return int(old)
+                await self._ensure_loaded(db, user_id, force=True)
+            raise RuntimeError("购物车装载失败")
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] Redis 不可用，直接写 cart_items：{e}")
+            self._fallback_users.add(user_id)
+            return await self._db_remove(db, user_id, sku)
+
+    async def remove_ordered(self, db: AsyncSession, user_id: int, quantities: dict[str, int]) -> None:
+        """
+        下单提交后调用：按下单时的快照从购物车原子地扣掉已下单的数量（扣到 0 移除）。
+        下单期间新加购的商品、多加的数量都会保留。
+        """
+        await self.apply(db, user_id, [(sku, "delta", -qty) for sku, qty in quantities.items()], {})
+
+    async def clear(self, db: AsyncSession, user_id: int) -> None:
+        try:
+            await self._evict_fallback_carts()
+            cart_key, added_key = self._keys(user_id)
+            await self._script("clear", _CLEAR_LUA)(
+                keys=[cart_key, added_key, DIRTY_KEY], args=[user_id, self.ttl]
+            )
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] Redis 不可用，直接清空 cart_items：{e}")
+            self._fallback_users.add(user_id)
+            await db.execute(delete(CartItem).where(CartItem.user_id == user_id))
+            await db.commit()
+
+    async def forget_sku(self, sku: str, user_ids: list[int]) -> None:
+        """商品删除后调用：从这些用户的 Redis 购物车里移除该商品（漏掉的由写回时清理）"""
+        if not user_ids:
+            return
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            for uid in user_ids:
+                for key in self._keys(uid):
+                    pipe.hdel(key, sku)
+            await pipe.execute()
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] 从购物车移除已删除商品 {sku} 失败（写回时再清理）：{e}")
+
+    async def forget_user(self, user_id: int) -> None:
+        """用户删除后调用：丢弃其 Redis 购物车"""
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.delete(*self._keys(user_id))
+            pipe.srem(DIRTY_KEY, user_id)
+            await pipe.execute()
+        except REDIS_ERRORS as e:
+            logger.warning(f"[cart] 丢弃已删除用户 {user_id} 的购物车失败（写回时再清理）：{e}")
+
+    async def _evict_fallback_carts(self) -> None:
+        """
+        Redis 恢复后第一次访问时调用：降级期间直接写过 cart_items 的用户，Redis 里的购物车已过时，
+        删掉后下次访问从 cart_items 重新装载（没有装载标记的购物车写回时也会跳过）。
+        """
+        if not self._fallback_users:
+            return
+        users = list(self._fallback_users)
+        pipe = get_redis().pipeline(transaction=False)
+        for uid in users:
+            pipe.delete(*self._keys(uid))
+        pipe.srem(DIRTY_KEY, *users)
+        await pipe.execute()
+        self._fallback_users.difference_update(users)
+        logger.info(f"[cart] Redis 已恢复，{len(users)} 个降级期间修改过的购物车将从 cart_items 重新装载")
+
+    async def _ensure_loaded(self, db: AsyncSession, user_id: int, force: bool = False) -> None:
+        """冷启动：Redis 中没有该用户的购物车时，从 cart_items 装载"""
+        cart_key, added_key = self._keys(user_id)
+        if not force and await get_redis().hexists(cart_key, _LOADED):
+            return
+        args: list[Any] = [self.ttl]
+        for line in await self._db_lines(db, user_id):
+            added_at = line["added_at"] or datetime.now(timezone.utc)
+            args += [line["sku"], line["quantity"], added_at.isoformat()]
+        await self._script("load", _LOAD_LUA)(keys=[cart_key, added_key], args=args)
+
+    # ------------------------------------------------------------ #
+    # write-behind
+    # ------------------------------------------------------------ #
+    async def flush(self, session_factory) -> int:
+        """把一批有变动的购物车写回 cart_items，返回处理的用户数"""
+        r = get_redis()
+        raw_ids = await r.spop(DIRTY_KEY, self.flush_batch)
+        if not raw_ids:
+            return 0
+        user_ids = [int(u) for u in raw_ids]
+        try:
+            pipe = r.pipeline(transaction=False)
+            for uid in user_ids:
+                cart_key, added_key = self._keys(uid)
+                pipe.hgetall(cart_key)
+                pipe.hgetall(added_key)
+            results = await pipe.execute()
+            carts: dict[int, list[dict[str, Any]]] = {}
+            for i, uid in enumerate(user_ids):
+                quantities, added = results[2 * i], results[2 * i + 1]
+                if _LOADED.encode() not in quantities:
+                    continue            # 购物车已过期：没有可信的最新状态，保留数据库中的行
+                carts[uid] = [
+                    {"user_id": uid, "sku": sku.decode(), "quantity": int(qty),
+                     "added_at": _parse_time(added.get(sku))}
+                    for sku, qty in quantities.items() if sku.decode() != _LOADED
+                ]
+            async with session_factory() as db:
+                carts = await self._drop_orphans(db, carts)
+            try:
+                async with session_factory() as db:
+                    await self._write_carts(db, carts)
+            except IntegrityError as e:
+                logger.warning(f"[cart] 批量写回失败，改为逐个用户写回：{e.orig!r}")
+                await self._write_each(session_factory, carts)
+        except Exception:
+            # 写回失败（数据库 / Redis 不可用）：放回脏集合，下一轮重试
+            await r.sadd(DIRTY_KEY, *user_ids)
+            raise
+        return len(user_ids)
+
+    @staticmethod
+    async def _write_carts(db: AsyncSession, carts: dict[int, list[dict[str, Any]]]) -> None:
+        # 整体覆盖：Redis 里的购物车就是这些用户的最新状态
+        await db.execute(delete(CartItem).where(CartItem.user_id.in_(list(carts))))
+        rows = [row for lines in carts.values() for row in lines]
+        if rows:
+            await db.execute(insert(CartItem), rows)
+        await db.commit()
+
+    async def _write_each(self, session_factory, carts: dict[int, list[dict[str, Any]]]) -> None:
+        """逐个用户写回；违反约束的购物车记日志后丢弃（不放回脏集合，否则每一轮都会失败）"""
+        for uid, lines in carts.items():
+            try:
+                async with session_factory() as db:
+                    await self._write_carts(db, {uid: lines})
+            except IntegrityError as e:
+                logger.error(f"[cart] 用户 {uid} 的购物车无法写回，已丢弃本次变更：{e.orig!r}")
+
+    async def _drop_orphans(
+        self, db: AsyncSession, carts: dict[int, list[dict[str, Any]]]
+    ) -> dict[int, list[dict[str, Any]]]:
+        """去掉已删除用户的购物车、已删除商品的行（外键会让整批写入失败），并同步清理 Redis"""
+        if not carts:
+            return carts
+        users = set((await db.execute(select(User.user_id).where(User.user_id.in_(list(carts))))).scalars())
+        skus = {row["sku"] for lines in carts.values() for row in lines}
+        live = set((await db.execute(select(Product.sku).where(Product.sku.in_(skus))))
+                   .scalars()) if skus else set()
+        for uid in [u for u in carts if u not in users]:
+            del carts[uid]
+            await self.forget_user(uid)
+        for sku in skus - live:
+            holders = [uid for uid, lines in carts.items() if any(row["sku"] == sku for row in lines)]
+            await self.forget_sku(sku, holders)
+        return {uid: [row for row in lines if row["sku"] in live] for uid, lines in carts.items()}
+
+    async def run_flusher(self, session_factory) -> None:
+        """常驻任务：定期写回；积压时不等待，连续写到清空"""
+        lock_ms = int(self.flush_interval * 10_000)
+        while True:
+            try:
+                started = time.monotonic()
+                r = get_redis()
+                await self._evict_fallback_carts()
+                flushed = 0
+                if await r.set(FLUSH_LOCK_KEY, b"1", nx=True, px=lock_ms):
+                    try:
+                        flushed = await self.flush(session_factory)
+                    finally:
+                        await r.delete(FLUSH_LOCK_KEY)
+                if flushed >= self.flush_batch:
+                    continue
+                await asyncio.sleep(max(0.0, self.flush_interval - (time.monotonic() - started)))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[cart] 购物车写回失败，稍后重试：{e}")
+                await asyncio.sleep(self.flush_interval * 5)
+
+    # ------------------------------------------------------------ #
+    # 直接读写 cart_items（冷启动装载 / Redis 不可用时降级）
+    # ------------------------------------------------------------ #
+    async def _db_lines(self, db: AsyncSession, user_id: int) -> list[dict[str, Any]]:
+        result = await db.execute(
+            select(CartItem.sku, CartItem.quantity, CartItem.added_at)
+            .where(CartItem.user_id == user_id)
+            .order_by(CartItem.added_at)
+        )
+        return [dict(r) for r in result.mappings()]
+
+    async def _db_incr(self, db: AsyncSession, user_id: int, sku: str, delta: int, limit: int) -> int:
+        result = await db.execute(
+            select(CartItem.cart_item_id, CartItem.quantity)
+            .where(CartItem.user_id == user_id, CartItem.sku == sku)
+            .with_for_update()
+        )
+        row = result.first()
+        old = row.quantity if row else 0
+        new = old + delta
+        if delta > 0 and new > limit:
+            await db.rollback()
+            raise CartLimitError(f"商品 {sku} 库存不足")
+        if new <= 0:
+            if row:
+                await db.execute(delete(CartItem).where(CartItem.cart_item_id == row.cart_item_id))
+            new = 0
+        elif row:
+            await db.execute(
+                update(CartItem).where(CartItem.cart_item_id == row.cart_item_id).values(quantity=new)
+            )
+        else:
+            await db.execute(insert(CartItem).values(user_id=user_id, sku=sku, quantity=new))
+        await db.commit()
+        return new
+
+    async def _db_remove(self, db: AsyncSession, user_id: int, sku: str) -> int:
+        where = (CartItem.user_id == user_id, CartItem.sku == sku)
+        old = (await db.execute(select(CartItem.quantity).where(*where).with_for_update())).scalar()
+        await db.execute(delete(CartItem).where(*where))
+        await db.commit()
+        return old or 0
+
+    async def _db_apply(
+        self, db: AsyncSession, user_id: int, ops: list[tuple[str, str, int]], limits: dict[str, int]
+    ) -> dict[str, int]:
+        """一个事务：锁住涉及的行，算出新数量，一条 DELETE + 一条批量 INSERT 写回"""
+        skus = list(dict.fromkeys(sku for sku, _, _ in ops))
+        result = await db.execute(
+            select(CartItem.sku, CartItem.quantity, CartItem.added_at)
+            .where(CartItem.user_id == user_id, CartItem.sku.in_(skus))
+            .with_for_update()
+        )
+        old = {r.sku: (r.quantity, r.added_at) for r in result}
+        quantities = {sku: old[sku][0] if sku in old else 0 for sku in skus}
+        for sku, mode, value in ops:
+            prev = quantities[sku]
+            new = max(0, value if mode == "set" else prev + value)
+            if new > prev and new > limits.get(sku, 0):
+                await db.rollback()
+                raise CartLimitError(f"商品 {sku} 库存不足")
+            quantities[sku] = new
+        now = datetime.now(timezone.utc)
+        rows = [
+            {"user_id": user_id, "sku": sku, "quantity": qty,
+             "added_at": old[sku][1] if sku in old and old[sku][1] else now}
+            for sku, qty in quantities.items() if qty > 0
+        ]
+        await db.execute(delete(CartItem).where(CartItem.user_id == user_id, CartItem.sku.in_(skus)))
+        if rows:
+            await db.execute(insert(CartItem), rows)
+        await db.commit()
+        return quantities
+
+
+cart_store = CartStore(
+    ttl=settings.CART_TTL,
+    flush_interval=settings.CART_FLUSH_INTERVAL,
+    flush_batch=settings.CART_FLUSH_BATCH,
+)
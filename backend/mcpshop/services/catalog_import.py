@@ -0,0 +1,180 @@
+# mcpshop/services/catalog_import.py
+"""
+商品目录批量导入（CSV / JSONL）。
+
+- 逐行流式解析，任何时候内存里只有一批数据；
+- 每行先按 ProductCreate 校验，不合法的行记入错误列表，不影响其它行；
+- 每批去重后执行一次 INSERT ... ON CONFLICT (sku) DO UPDATE 并提交；
+  整批失败（如外键不存在）时在保存点内逐行重试，定位出具体的错误行；
+- 每批提交后失效商品缓存，可选地在后台同步语义索引（大批量导入建议导入后
+  跑一次 scripts/sync_product_index.py）；
+- Core 批量写入不触发 ORM 事件，全部导入结束后重算一次分类聚合。
+
+CSV 需要表头，列名与 ProductCreate 字段一致，空单元格视为 None。
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Iterator, TextIO
+
+from pydantic import ValidationError
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.crud.category import refresh_category_facets
+from mcpshop.crud.product import bulk_upsert_products, product_cache
+from mcpshop.schemas.product import ProductCreate
+from mcpshop.services.product_index import schedule_upsert
+from mcpshop.services.suggest import publish_upsert
+
+FORMATS = ("csv", "jsonl")
+MAX_REPORTED_ERRORS = 1000      # 报告里最多保留的错误行数，failed 仍计全量
+
+
+@dataclass
+class ImportReport:
+    processed: int = 0          # 读到的数据行
+    upserted: int = 0           # 成功写入（新增或覆盖）的行
+    failed: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    elapsed: float = 0.0
+
+    def add_error(self, line: int, sku: str | None, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "sku": sku, "error": error})
+
+    @property
+    def rows_per_sec(self) -> float:
+        return round(self.processed / self.elapsed, 1) if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "processed": self.processed,
+            "upserted": self.upserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_sec": self.rows_per_sec,
+        }
+
+
+def detect_format(filename: str | None) -> str:
+    """按扩展名猜格式（.csv / .jsonl / .ndjson，可带 .gz），猜不出时抛 ValueError"""
+    name = (filename or "").lower().removesuffix(".gz")
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError("无法识别文件格式，请指定 csv 或 jsonl")
+
+
+def open_text(raw: BinaryIO, filename: str | None) -> TextIO:
+    """把二进制流包装成按行读取的 UTF-8 文本流（兼容 BOM），.gz 文件边读边解压"""
+    if (filename or "").lower().endswith(".gz"):
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    return io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[tuple[int, dict[str, Any] | str]]:
+    """逐行产出 (行号, 原始记录)；无法解析的行产出 (行号, 错误信息)"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {k: (v if v != "" else None) for k, v in record.items() if k}
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, f"JSON 解析失败：{e}"
+                continue
+            yield line_no, record if isinstance(record, dict) else "每行必须是一个 JSON 对象"
+    else:
+        raise ValueError(f"不支持的格式：{fmt}")
+
+
+def _validate(record: dict[str, Any]) -> dict[str, Any]:
+    return ProductCreate(**record).model_dump()
+
+
+async def _write_batch(
+    db: AsyncSession, batch: list[tuple[int, dict[str, Any]]], report: ImportReport
+) -> list[dict[str, Any]]:
+    """写入一批已校验的行，返回成功写入的行"""
+    try:
+        async with db.begin_nested():
+            await bulk_upsert_products(db, [row for _, row in batch])
+        return [row for _, row in batch]
+    except DBAPIError:
+        pass
+    # 整批失败：逐行重试，找出出错的行
+    written = []
+    for line_no, row in batch:
+        try:
+            async with db.begin_nested():
+                await bulk_upsert_products(db, [row])
+            written.append(row)
+        except DBAPIError as e:
+            report.add_error(line_no, row["sku"], str(e.orig))
+    return written
+
+
+async def import_products(
+    db: AsyncSession,
+    stream: TextIO,
+    fmt: str,
+    batch_size: int = 1000,
+    sync_index: bool = False,
+    on_progress: Callable[[ImportReport], None] | None = None,
+) -> ImportReport:
+    """
+    从文本流导入商品，返回导入报告。每批独立提交，中途失败时已提交的批次保留。
+    文件读取和解析放在线程里执行，不阻塞事件循环。
+    """
+    report = ImportReport()
+    records = iter_records(stream, fmt)
+    while True:
+        chunk = await asyncio.to_thread(lambda: list(islice(records, batch_size)))
+        if not chunk:
+            break
+        report.processed += len(chunk)
+
+        by_sku: dict[str, tuple[int, dict[str, Any]]] = {}
+        for line_no, record in chunk:
+            if isinstance(record, str):
+                report.add_error(line_no, None, record)
+                continue
+            try:
+                row = _validate(record)
+            except ValidationError as e:
+                report.add_error(line_no, record.get("sku"), "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+                ))
+                continue
+            by_sku[row["sku"]] = (line_no, row)      # 同一批内重复的 sku 以最后一行为准
+
+        written = await _write_batch(db, list(by_sku.values()), report) if by_sku else []
+        await db.commit()
+        report.upserted += len(written)
+        if written:
+            await product_cache.invalidate(*(row["sku"] for row in written))
+            await publish_upsert([(row["sku"], row["name"]) for row in written])
+            if sync_index:
+                schedule_upsert(written)
+        report.elapsed = time.monotonic() - report.started_at
+        if on_progress is not None:
+            on_progress(report)
+
+    if report.upserted:
+        await refresh_category_facets(db)
+    report.elapsed = time.monotonic() - report.started_at
+    return report
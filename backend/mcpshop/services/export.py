@@ -0,0 +1,90 @@
+# mcpshop/services/export.py
+"""
+商品 / 订单全量导出（NDJSON / CSV，可 gzip）。
+
+- 用 AsyncSession.stream + yield_per 走服务端游标（asyncpg），按批从数据库拉行，
+  编码成一个块立刻发出，内存占用与总行数无关；
+- 只查需要的列，不构造 ORM 实例；
+- 生成器自己开会话：StreamingResponse 发送期间请求依赖里的会话可能已关闭。
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Sequence
+
+from sqlalchemy import Select, select
+
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.order import Order
+from mcpshop.models.order_item import OrderItem
+from mcpshop.models.product import Product
+
+EXPORT_FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def product_export_query() -> Select:
+    return select(
+        *(c for c in Product.__table__.columns if c.key != "search_text")
+    ).order_by(Product.sku)
+
+
+def order_export_query() -> Select:
+    """订单明细平铺：每个 order_item 一行，没有明细的订单也保留一行"""
+    return (
+        select(
+            Order.order_id, Order.user_id, Order.status, Order.total_cents, Order.created_at,
+            OrderItem.sku, OrderItem.quantity, OrderItem.unit_price,
+        )
+        .select_from(Order)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.order_id)
+        .order_by(Order.order_id, OrderItem.order_item_id)
+    )
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _encode(rows: Sequence[Sequence[Any]], keys: list[str], fmt: str, header: bool) -> bytes:
+    if fmt == "ndjson":
+        return "".join(
+            json.dumps(dict(zip(keys, map(_plain, row))), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(keys)
+    writer.writerows([[_plain(v) for v in row] for row in rows])
+    # 表头带 BOM，Excel 打开 UTF-8 CSV 不乱码
+    return (("\ufeff" if header else "") + buf.getvalue()).encode("utf-8")
+
+
+async def iter_export(
+    stmt: Select, fmt: str, compress: bool = False, chunk_rows: int = 1000
+) -> AsyncIterator[bytes]:
+    """按 chunk_rows 行一块产出编码后的字节；compress 时为 gzip 流，每块 SYNC_FLUSH 立即可解"""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=chunk_rows))
+        keys = list(result.keys())
+        if fmt == "csv":
+            # 表头单独先发，首字节不必等第一批数据
+            data = _encode([], keys, fmt, header=True)
+            yield gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH) if gz else data
+        async for rows in result.partitions():
+            data = _encode(rows, keys, fmt, header=False)
+            yield gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH) if gz else data
+    if gz:
+        yield gz.flush()
+
+
+def export_filename(name: str, fmt: str, compress: bool) -> str:
+    return f"{name}.{fmt}" + (".gz" if compress else "")
@@ -0,0 +1,353 @@
+# mcpshop/services/inventory.py
+"""
+秒杀 / 热点商品库存：Redis 预扣，异步批量写回数据库。
+
+普通商品下单时锁 products 行扣库存；秒杀时成千上万个请求排队等同一行锁，连接池被占满。
+管理员把商品标记为热点（enable）后：
+- 可售库存镜像到 inv:stock:{sku}（= 数据库库存 − 待写回 − 预留中）；
+- 下单先用 Lua 脚本原子预扣（reserve），库存不足直接拒绝，不碰数据库；
+  预扣带过期时间，下单没完成（进程崩溃、事务失败）时由后台任务归还库存；
+- 订单事务提交前确认预扣（confirm），数量记入 inv:pending；
+- 后台 reconciler 每 INVENTORY_RECONCILE_INTERVAL 秒把 inv:pending 批量扣到 products.stock，
+  多个 worker 通过 Redis 锁保证同一时刻只有一个在写回。写回前先把 inv:pending 原子地改名为
+  inv:inflight，数据库提交后才删除；写回失败时放回 inv:pending，进程在中途崩溃时
+  inv:inflight 留在 Redis，下一轮先重放它，已确认的扣减不会丢。
+热点商品的 products.stock 因此会比实际可售数滞后一个写回周期。
+
+最坏情况（确认后、提交前进程崩溃；写回提交后、删除 inv:inflight 前崩溃导致重放）只会少卖，不会超卖。
+Redis 不可用时热点商品暂停下单（InventoryUnavailable），普通商品不受影响。
+建议在秒杀开始前 enable、结束后 disable；切换瞬间正在进行的下单可能按切换前的方式处理。
+"""
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.crud.product import decrement_stock, lock_products, product_cache
+
+HOT_KEY = "inv:hot"                 # 热点 sku 集合
+RESERVED_KEY = "inv:reserved"       # sku → 预留中的数量
+PENDING_KEY = "inv:pending"         # sku → 已确认、待写回数据库的数量
+INFLIGHT_KEY = "inv:inflight"       # sku → 正在写回数据库的数量（提交后删除）
+EXPIRY_KEY = "inv:expiry"           # 预扣 token 的有序集合，分值为过期时间
+RECONCILE_LOCK_KEY = "inv:reconcile:lock"
+_STOCK_PREFIX = "inv:stock:"
+
+# 脚本用到的 key 都经 KEYS 传入（不在脚本里拼 key 名），Redis Cluster 才能按 key 路由
+
+# KEYS: hot, reserved, expiry, resv:{token}, 然后每个 sku 的 inv:stock:{sku}
+# ARGV: token, 过期时间, 然后成对的 sku, 数量（与 KEYS[5..] 一一对应）
+# 返回 {0} 无热点商品；{1, sku1, 数量1, ...} 已预扣；{-1, sku} 库存不足（什么都不扣）
+_RESERVE_LUA = """
+local hot = {}
+for i = 3, #ARGV, 2 do
+  local sku, key = ARGV[i], KEYS[4 + (i - 1) / 2]
+  if redis.call('SISMEMBER', KEYS[1], sku) == 1 then
+    local have = tonumber(redis.call('GET', key) or '0')
+    if have < tonumber(ARGV[i + 1]) then return {-1, sku} end
+    table.insert(hot, {sku, key, ARGV[i + 1]})
+  end
+end
+if #hot == 0 then return {0} end
+local out = {1}
+for _, h in ipairs(hot) do
+  redis.call('DECRBY', h[2], h[3])
+  redis.call('HINCRBY', KEYS[2], h[1], h[3])
+  redis.call('HSET', KEYS[4], h[1], h[3])
+  table.insert(out, h[1])
+  table.insert(out, h[3])
+end
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+return out
+"""
+
+# KEYS: expiry, resv:{token}, reserved, pending；ARGV: token
+# 预扣转为待写回；预扣已过期（库存已归还）时返回 0
+_CONFIRM_LUA = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then return 0 end
+local items = redis.call('HGETALL', KEYS[2])
+for i = 1, #items, 2 do
+  redis.call('HINCRBY', KEYS[3], items[i], -tonumber(items[i + 1]))
+  redis.call('HINCRBY', KEYS[4], items[i], items[i + 1])
+end
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# KEYS: expiry, resv:{token}, reserved, 然后预扣里每个 sku 的 inv:stock:{sku}
+# ARGV: token, 然后 sku（与 KEYS[4..] 一一对应）
+# 归还预扣的库存；已确认或已归还时返回 0
+_RELEASE_LUA = """
+local stock = {}
+for i = 2, #ARGV do stock[ARGV[i]] = KEYS[i + 2] end
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then return 0 end
+local items = redis.call('HGETALL', KEYS[2])
+for i = 1, #items, 2 do
+  redis.call('INCRBY', stock[items[i]], items[i + 1])
+  redis.call('HINCRBY', KEYS[3], items[i], -tonumber(items[i + 1]))
+end
+redis.call('DEL', KEYS[2])
+return 1
+"""
+
+# KEYS: pending, 然后每个 sku 的 inv:stock:{sku}；ARGV: 成对的 sku, 数量（与 KEYS[2..] 一一对应）
+# 退回已确认的预扣（订单事务提交失败 / 订单取消）
+# 待写回的数量已落库时 pending 会变成负数，写回时即为给数据库加库存
+_UNDO_LUA = """
+for i = 1, #ARGV, 2 do
+  redis.call('HINCRBY', KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+  redis.call('INCRBY', KEYS[2 + (i - 1) / 2], ARGV[i + 1])
+end
+return 1
+"""
+
+# KEYS: pending, inflight。取出一批待写回数量：上一轮没有完成的 inflight 优先重放，
+# 否则把 pending 整体改名为 inflight。数据库提交后由调用方删除 inflight
+_DRAIN_LUA = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+  if redis.call('EXISTS', KEYS[1]) == 0 then return {} end
+  redis.call('RENAME', KEYS[1], KEYS[2])
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+# KEYS: pending, inflight。写回失败：inflight 的数量放回 pending
+_RESTORE_LUA = """
+local items = redis.call('HGETALL', KEYS[2])
+for i = 1, #items, 2 do
+  redis.call('HINCRBY', KEYS[1], items[i], items[i + 1])
+end
+redis.call('DEL', KEYS[2])
+return #items / 2
+"""
+
+# KEYS: hot, pending, reserved, inflight, inv:stock:{sku}；ARGV: sku, 数据库库存。标记热点并按数据库库存校准可售数
+_SYNC_LUA = """
+redis.call('SADD', KEYS[1], ARGV[1])
+local pending = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+local reserved = tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or '0')
+local inflight = tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0')
+local available = tonumber(ARGV[2]) - pending - reserved - inflight
+redis.call('SET', KEYS[5], available)
+return available
+"""
+
+
+class InventoryUnavailable(RuntimeError):
+    """Redis 不可用，热点商品暂时无法下单"""
+
+
+@dataclass
+class Reservation:
+    token: str
+    items: dict[str, int] = field(default_factory=dict)     # 热点 sku → 预扣数量
+    confirmed: bool = False
+
+
+def _resv_key(token: str) -> str:
+    return f"inv:resv:{token}"
+
+
+def _stock_key(sku: str) -> str:
+    return f"{_STOCK_PREFIX}{sku}"
+
+
+class HotInventory:
+    def __init__(self, reservation_ttl: int, reconcile_interval: float):
+        self.reservation_ttl = reservation_ttl
+        self.reconcile_interval = reconcile_interval
+        self._scripts: dict[str, object] = {}
+        self._hot_local: set[str] = set()       # 热点集合的本地副本，仅在 Redis 不可用时用来判断
+
+    def _script(self, name: str, source: str):
+        if name not in self._scripts:
+            self._scripts[name] = get_redis().register_script(source)
+        return self._scripts[name]
+
+    # ------------------------------------------------------------ #
+    # 下单
+    # ------------------------------------------------------------ #
+    async def reserve(self, quantities: dict[str, int]) -> Reservation | None:
+        """
+        原子预扣其中的热点商品。没有热点商品时返回 None；
+        任一热点商品库存不足时抛出 ValueError，什么都不扣。
+        """
+        token = uuid.uuid4().hex
+        keys = [HOT_KEY, RESERVED_KEY, EXPIRY_KEY, _resv_key(token)]
+        args: list = [token, time.time() + self.reservation_ttl]
+        for sku, qty in quantities.items():
+            keys.append(_stock_key(sku))
+            args += [sku, qty]
+        try:
+            result = await self._script("reserve", _RESERVE_LUA)(keys=keys, args=args)
+        except REDIS_ERRORS as e:
+            if self._hot_local & quantities.keys():
+                raise InventoryUnavailable("秒杀商品暂时无法下单，请稍后重试") from e
+            return None
+        if result[0] == -1:
+            raise ValueError(f"商品 {result[1].decode()} 库存不足")
+        if result[0] == 0:
+            return None
+        items = {result[i].decode(): int(result[i + 1]) for i in range(1, len(result), 2)}
+        return Reservation(token, items)
+
+    async def confirm(self, resv: Reservation) -> None:
+        """订单事务提交前调用；预扣已过期时抛出 ValueError"""
+        ok = await self._script("confirm", _CONFIRM_LUA)(
+            keys=[EXPIRY_KEY, _resv_key(resv.token), RESERVED_KEY, PENDING_KEY], args=[resv.token]
+        )
+        if not ok:
+            raise ValueError("下单超时，库存预留已释放，请重试")
+        resv.confirmed = True
+
+    async def cancel(self, resv: Reservation) -> None:
+        """下单失败：归还库存（已确认的撤销待写回数量）。Redis 出错时未确认的预扣会在过期后自动归还"""
+        try:
+            if resv.confirmed:
+                await self.restock(resv.items)
+            else:
+                await self._release(resv.token, list(resv.items))
+        except REDIS_ERRORS as e:
+            logger.warning(f"[inventory] 归还预扣失败 {resv.token}：{e}")
+
+    async def restock(self, items: dict[str, int]) -> None:
+        """退回已确认的热点库存（可售数加回，写回时数据库库存相应加回）"""
+        keys = [PENDING_KEY] + [_stock_key(sku) for sku in items]
+        args = [x for sku, qty in items.items() for x in (sku, qty)]
+        await self._script("undo", _UNDO_LUA)(keys=keys, args=args)
+
+    async def _release(self, token: str, skus: list[str]) -> int:
+        keys = [EXPIRY_KEY, _resv_key(token), RESERVED_KEY] + [_stock_key(sku) for sku in skus]
+        return await self._script("release", _RELEASE_LUA)(keys=keys, args=[token, *skus])
+
+    # ------------------------------------------------------------ #
+    # 管理
+    # ------------------------------------------------------------ #
+    async def enable(self, db: AsyncSession, sku: str) -> int | None:
+        """
+        标记为热点商品，并按数据库库存校准可售数；商品不存在时返回 None。
+        管理员修改热点商品的库存后也调用它重新校准。返回当前可售数。
+        """
+        r = get_redis()
+        async with r.lock(RECONCILE_LOCK_KEY, timeout=30, blocking_timeout=10):
+            await self._drain_once(db)              # 先把待写回的数量落库，校准才准确
+            locked = await lock_products(db, [sku])
+            if sku not in locked:
+                await db.rollback()
+                return None
+            available = await self._script("sync", _SYNC_LUA)(
+                keys=[HOT_KEY, PENDING_KEY, RESERVED_KEY, INFLIGHT_KEY, _stock_key(sku)],
+                args=[sku, locked[sku].stock],
+            )
+            await db.commit()
+        self._hot_local.add(sku)
+        return int(available)
+
+    async def resync(self, db: AsyncSession, sku: str) -> None:
+        """商品库存被直接修改后调用：是热点商品时重新校准"""
+        try:
+            if await get_redis().sismember(HOT_KEY, sku):
+                await self.enable(db, sku)
+        except REDIS_ERRORS as e:
+            logger.warning(f"[inventory] 热点商品 {sku} 库存校准失败：{e}")
+
+    async def disable(self, db: AsyncSession, sku: str) -> None:
+        """取消热点：先停止预扣，再把待写回的数量落库；仍未确认的预扣过期后自动归还"""
+        r = get_redis()
+        await r.srem(HOT_KEY, sku)
+        self._hot_local.discard(sku)
+        async with r.lock(RECONCILE_LOCK_KEY, timeout=30, blocking_timeout=10):
+            await self._drain_once(db)
+        await r.delete(_stock_key(sku))
+
+    async def status(self) -> list[dict]:
+        """各热点商品的可售 / 预留中 / 待写回数量"""
+        r = get_redis()
+        skus = sorted(s.decode() for s in await r.smembers(HOT_KEY))
+        if not skus:
+            return []
+        pipe = r.pipeline(transaction=False)
+        pipe.mget([_stock_key(s) for s in skus])
+        pipe.hmget(RESERVED_KEY, skus)
+        pipe.hmget(PENDING_KEY, skus)
+        pipe.hmget(INFLIGHT_KEY, skus)
+        available, reserved, pending, inflight = await pipe.execute()
+        return [
+            {"sku": sku, "available": int(a or 0), "reserved": int(rs or 0),
+             "pending": int(p or 0) + int(f or 0)}
+            for sku, a, rs, p, f in zip(skus, available, reserved, pending, inflight)
+        ]
+
+    # ------------------------------------------------------------ #
+    # 后台：写回 + 回收过期预扣
+    # ------------------------------------------------------------ #
+    async def _drain_once(self, db: AsyncSession) -> int:
+        """
+        把待写回数量一次性扣到 products.stock；返回写回的商品数。
+        数量先移到 inv:inflight，提交后才删除；失败时放回 inv:pending，崩溃时下一轮重放。
+        """
+        raw = await self._script("drain", _DRAIN_LUA)(keys=[PENDING_KEY, INFLIGHT_KEY])
+        quantities = {raw[i].decode(): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+        quantities = {sku: qty for sku, qty in quantities.items() if qty}
+        if not quantities:
+            await get_redis().delete(INFLIGHT_KEY)
+            return 0
+        try:
+            locked = await lock_products(db, sorted(quantities))
+            quantities = {sku: qty for sku, qty in quantities.items() if sku in locked}   # 商品已删除的丢弃
+            await decrement_stock(db, quantities, locked)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            await self._script("restore", _RESTORE_LUA)(keys=[PENDING_KEY, INFLIGHT_KEY])
+            raise
+        await get_redis().delete(INFLIGHT_KEY)
+        await product_cache.invalidate(*quantities)
+        return len(quantities)
+
+    async def release_expired(self, limit: int = 500) -> int:
+        """归还已过期预扣的库存，返回归还的预扣数"""
+        r = get_redis()
+        tokens = await r.zrangebyscore(EXPIRY_KEY, "-inf", time.time(), start=0, num=limit)
+        released = 0
+        for token in tokens:
+            token = token.decode()
+            # 预扣的 sku 写入后不再变，先读出来才能把对应的库存 key 传给脚本
+            skus = [s.decode() for s in await r.hkeys(_resv_key(token))]
+            released += await self._release(token, skus)
+        return released
+
+    async def run_reconciler(self, session_factory) -> None:
+        """常驻任务：定期写回待扣库存、回收过期预扣，并刷新热点集合的本地副本"""
+        while True:
+            try:
+                r = get_redis()
+                self._hot_local = {s.decode() for s in await r.smembers(HOT_KEY)}
+                if self._hot_local or await r.exists(PENDING_KEY, INFLIGHT_KEY, EXPIRY_KEY):
+                    lock = r.lock(RECONCILE_LOCK_KEY, timeout=30)
+                    if await lock.acquire(blocking=False):
+                        try:
+                            async with session_factory() as db:
+                                await self._drain_once(db)
+                            released = await self.release_expired()
+                            if released:
+                                logger.info(f"[inventory] 归还 {released} 个过期预扣")
+                        finally:
+                            await lock.release()
+                await asyncio.sleep(self.reconcile_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[inventory] 库存写回失败，稍后重试：{e}")
+                await asyncio.sleep(self.reconcile_interval * 5)
+
+
+hot_inventory = HotInventory(
+    reservation_ttl=settings.INVENTORY_RESERVATION_TTL,
+    reconcile_interval=settings.INVENTORY_RECONCILE_INTERVAL,
+)
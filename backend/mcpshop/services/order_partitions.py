@@ -0,0 +1,153 @@
+# mcpshop/services/order_partitions.py
+"""
+订单分区维护与冷数据归档（PostgreSQL，分区方式见 db.partitions）。
+
+- 后台任务定期补建未来 ORDER_PARTITION_PREMAKE 个月的分区；
+- 归档：把某个月的 orders / order_items 分区导出为 Parquet（zstd 压缩），
+  写到 {ORDER_ARCHIVE_DIR}/orders/2025-01.parquet、order_items/2025-01.parquet，再 DETACH + DROP。
+  整个过程在一个事务里：先锁住两个分区（只挡写入），文件先写 .tmp 再改名，
+  导出失败则回滚、分区原样保留；提交失败时文件已存在，重跑会覆盖，结果相同。
+- ORDER_ARCHIVE_AFTER_MONTHS > 0 时后台任务自动归档早于 N 个整月的分区，否则只能手动
+  （python -m mcpshop.scripts.order_partitions archive）。
+
+归档后的订单不再能通过 API 查到；销售统计读模型已累计过不受影响，
+但之后 rebuild_sales_analytics 只能重算库里还在的订单。
+pyarrow 为可选依赖，未安装时不能归档，分区维护照常。
+"""
+import asyncio
+import os
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.db.partitions import (
+    PARTITIONED_TABLES, add_months, current_month, drop_partition, ensure_partitions,
+    is_partitioned, list_partitions, partition_name,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:          # 可选依赖：没有就不能归档
+    pa = pq = None
+
+# 归档文件的列（与 db.partitions 里的建表语句一致）
+_COLUMNS = {
+    "orders": ("order_id", "user_id", "total_cents", "status", "created_at"),
+    "order_items": ("order_item_id", "order_id", "sku", "quantity", "unit_price", "created_at"),
+}
+
+
+def _schema(table: str):
+    types = {
+        "order_id": pa.int64(), "user_id": pa.int64(), "total_cents": pa.int64(), "status": pa.string(),
+        "order_item_id": pa.int64(), "sku": pa.string(), "quantity": pa.int32(), "unit_price": pa.int32(),
+        "created_at": pa.timestamp("us", tz="UTC"),
+    }
+    return pa.schema([(c, types[c]) for c in _COLUMNS[table]])
+
+
+def archive_path(table: str, month: date, directory: str | None = None) -> Path:
+    return Path(directory or settings.ORDER_ARCHIVE_DIR) / table / f"{month:%Y-%m}.parquet"
+
+
+async def _export(conn: AsyncConnection, table: str, month: date, path: Path, batch_rows: int) -> int:
+    """
+    按主键分批读取一个分区写成 Parquet，返回行数。
+    不用服务端游标：asyncpg 的游标要到事务结束才关闭，同一事务里就不能再 DROP 这个分区。
+    """
+    schema = _schema(table)
+    columns = _COLUMNS[table]
+    key = columns[0]
+    select_sql = f"SELECT {', '.join(columns)} FROM {partition_name(table, month)}"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+    rows_written, last = 0, None
+    try:
+        while True:
+            where = "" if last is None else f" WHERE {key} > :last"
+            rows = (await conn.execute(
+                text(f"{select_sql}{where} ORDER BY {key} LIMIT :n"), {"last": last, "n": batch_rows}
+            )).all()
+            if not rows:
+                break
+            arrays = [pa.array(list(col), type=field.type) for col, field in zip(zip(*rows), schema)]
+            await asyncio.to_thread(writer.write_batch, pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows_written += len(rows)
+            last = rows[-1][0]
+    except BaseException:
+        writer.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    await asyncio.to_thread(writer.close)
+    os.replace(tmp, path)
+    return rows_written
+
+
+async def archive_month(session_factory, month: date, directory: str | None = None,
+                        batch_rows: int = 10_000) -> dict[str, int]:
+    """归档某个月的分区并从库里删除，返回各表导出的行数；分区不存在时抛出 LookupError"""
+    if pq is None:
+        raise RuntimeError("未安装 pyarrow，无法归档")
+    if month >= current_month():
+        raise ValueError("不能归档当月及以后的分区")
+    async with session_factory() as db:
+        conn = await db.connection()
+        if month not in await list_partitions(conn, "orders"):
+            raise LookupError(f"没有 {month:%Y-%m} 的订单分区")
+        names = ", ".join(partition_name(t, month) for t in reversed(PARTITIONED_TABLES))
+        await conn.execute(text(f"LOCK TABLE {names} IN EXCLUSIVE MODE"))
+        counts = {}
+        for table in PARTITIONED_TABLES:
+            counts[table] = await _export(conn, table, month, archive_path(table, month, directory), batch_rows)
+        await drop_partition(conn, month)
+        await db.commit()
+    logger.info(f"[partitions] {month:%Y-%m} 已归档：{counts}")
+    return counts
+
+
+async def archive_before(session_factory, before: date, directory: str | None = None) -> list[date]:
+    """归档 before 所在月之前的全部分区，返回归档的月份"""
+    async with session_factory() as db:
+        months = [m for m in await list_partitions(await db.connection(), "orders") if m < before]
+    for month in months:
+        await archive_month(session_factory, month, directory)
+    return months
+
+
+async def maintain_partitions(session_factory) -> list[str] | None:
+    """补建未来分区，返回新建的分区名；orders 不是分区表（SQLite / 未迁移）时返回 None"""
+    async with session_factory() as db:
+        conn = await db.connection()
+        if conn.dialect.name != "postgresql" or not await is_partitioned(conn, "orders"):
+            return None
+        month = current_month()
+        created = await ensure_partitions(conn, month, add_months(month, settings.ORDER_PARTITION_PREMAKE))
+        await db.commit()
+    if created:
+        logger.info(f"[partitions] 新建分区：{', '.join(created)}")
+    return created
+
+
+async def run_partition_maintenance(session_factory) -> None:
+    """常驻任务：定期补建分区，按 ORDER_ARCHIVE_AFTER_MONTHS 自动归档"""
+    while True:
+        try:
+            partitioned = await maintain_partitions(session_factory) is not None
+            if partitioned and settings.ORDER_ARCHIVE_AFTER_MONTHS > 0:
+                if pq is None:
+                    logger.warning("[partitions] 已开启自动归档但未安装 pyarrow，跳过")
+                else:
+                    await archive_before(
+                        session_factory, add_months(current_month(), -settings.ORDER_ARCHIVE_AFTER_MONTHS)
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[partitions] 分区维护失败，稍后重试：{e}")
+        await asyncio.sleep(settings.ORDER_PARTITION_MAINTENANCE_INTERVAL)
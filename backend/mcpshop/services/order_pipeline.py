@@ -0,0 +1,133 @@
+# mcpshop/services/order_pipeline.py
+"""
+异步下单流水线。
+
+POST /api/orders 只做受理（crud.order.submit_order）：写 PENDING 订单 + order.placed 事件，立即返回；
+outbox worker 处理 order.placed：扣库存并把订单推进到 PAID / CANCELLED，
+提交后在 Redis 频道 order:status:{order_id} 广播新状态；成交的订单再由 order.paid 累加销售统计。
+客户端轮询 GET /api/orders/{order_id}，或连 WebSocket /api/orders/{order_id}/ws 等待推送。
+后续的下游处理（通知、统计等）注册为新的 outbox topic，不再拉长下单请求。
+"""
+import asyncio
+import json
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.crud.analytics import record_order_sale
+from mcpshop.crud.order import allocate_order, cancel_pending_order, get_order
+from mcpshop.crud.product import product_cache
+from mcpshop.db.session import replica_router
+from mcpshop.models.order import OrderStatus
+from mcpshop.models.user import User
+from mcpshop.services.inventory import hot_inventory
+from mcpshop.services.outbox import AfterCommit, outbox_dead_handler, outbox_handler
+
+TERMINAL_STATUSES = {OrderStatus.PAID, OrderStatus.CANCELLED, OrderStatus.SHIPPED}
+
+
+def status_channel(order_id: int) -> str:
+    return f"order:status:{order_id}"
+
+
+async def publish_status(order_id: int, status: OrderStatus, reason: str | None = None) -> None:
+    try:
+        await get_redis().publish(
+            status_channel(order_id),
+            json.dumps({"order_id": order_id, "status": status.value, "reason": reason}, ensure_ascii=False),
+        )
+    except REDIS_ERRORS as e:
+        logger.warning(f"[orders] 订单 {order_id} 状态广播失败（客户端轮询仍可获取）：{e}")
+
+
+async def _sticky_owner(db: AsyncSession, user_id: int, after_commit: AfterCommit) -> None:
+    """
+    worker 改订单状态不经过用户请求，get_db 不会标记读己之写：提交后替订单所属用户标记，
+    收到推送后马上 GET 订单的客户端读主库，不会从落后的副本读到 PENDING。须排在 publish_status 之前。
+    """
+    if not replica_router.enabled:
+        return
+    username = (await db.execute(select(User.username).where(User.user_id == user_id))).scalar()
+    if username:
+        after_commit.append(lambda: replica_router.mark_write(username))
+
+
+@outbox_handler("order.placed")
+async def _on_order_placed(db: AsyncSession, payload: dict, after_commit: AfterCommit) -> None:
+    order_id, hot = payload["order_id"], payload.get("hot") or {}
+    order, reason, allocated = await allocate_order(db, order_id, hot)
+    if order is None:
+        return
+    if order.status == OrderStatus.CANCELLED and reason is not None and hot:
+        # 本次才取消：受理时在 Redis 扣掉的热点库存退回去
+        after_commit.append(lambda: hot_inventory.restock(hot))
+    if allocated:
+        after_commit.append(lambda: product_cache.invalidate(*allocated))
+    await _sticky_owner(db, order.user_id, after_commit)   # 重复投递时多标记一次也无妨
+    after_commit.append(lambda: publish_status(order_id, order.status, reason))
+
+
+@outbox_dead_handler("order.placed")
+async def _on_order_placed_dead(db: AsyncSession, payload: dict, after_commit: AfterCommit) -> None:
+    # 重试用尽：订单不能一直停在 PENDING。与标记 dead 同一事务取消订单，提交后退回热点库存并广播
+    order_id, hot = payload["order_id"], payload.get("hot") or {}
+    reason = "下单处理失败，订单已取消"
+    order = await cancel_pending_order(db, order_id)
+    if order is None:
+        return                                      # 已经不是 PENDING（处理过或已删除）
+    await _sticky_owner(db, order.user_id, after_commit)
+    if hot:
+        after_commit.append(lambda: hot_inventory.restock(hot))
+    after_commit.append(lambda: publish_status(order_id, OrderStatus.CANCELLED, reason))
+
+
+@outbox_handler("order.paid")
+async def _on_order_paid(db: AsyncSession, payload: dict, after_commit: AfterCommit) -> None:
+    # 与下单事务分开：sales_daily[今天] 是所有订单共用的热点行，放在扣库存的事务里会把提交串行化
+    await record_order_sale(db, payload["order_id"])
+
+
+async def watch_order(session_factory, order_id: int, timeout: float = 120.0) -> AsyncIterator[dict]:
+    """
+    依次产出订单状态 {"order_id", "status", "reason"}，到达终态或超时后结束。
+    先订阅再查库，不会漏掉订阅前发生的变化；Redis 不可用时退化为每秒查库。
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pubsub = get_redis().pubsub()
+    try:
+        try:
+            await pubsub.subscribe(status_channel(order_id))
+            subscribed = True
+        except REDIS_ERRORS:
+            subscribed = False
+        last = None
+        while loop.time() < deadline:
+            async with session_factory() as db:
+                order = await get_order(db, order_id)
+            if order is None:
+                return
+            if order.status != last:
+                last = order.status
+                yield {"order_id": order_id, "status": last.value, "reason": None}
+            if last in TERMINAL_STATUSES:
+                return
+            if not subscribed:
+                await asyncio.sleep(1.0)
+                continue
+            try:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=5.0)
+            except REDIS_ERRORS:
+                subscribed = False
+                continue
+            if message is not None:
+                data = json.loads(message["data"])
+                last = OrderStatus(data["status"])
+                yield data
+                if last in TERMINAL_STATUSES:
+                    return
+    finally:
+        await pubsub.aclose()
@@ -0,0 +1,213 @@
+# mcpshop/services/outbox.py
+"""
+事务性 outbox 的投递端：worker 池。
+
+- 业务代码在自己的事务里调用 enqueue(db, topic, payload)，随业务数据一起提交；
+- 每个 worker 循环：一条 UPDATE ... WHERE event_id IN (SELECT ... FOR UPDATE SKIP LOCKED)
+  认领一批到期事件（推后 available_at 作为租约、attempts + 1），多个 worker / 进程互不阻塞；
+- 每个事件在独立事务里执行处理函数并标记 done；失败按指数退避重试，超过上限记为 dead；
+- 处理前锁住事件行并确认它仍归本次认领（未处理、attempts 未变），处理函数与标记 done 同一事务：
+  租约过期后被重新认领的事件不会被两个 worker 同时处理；
+- 至少一次投递：处理函数必须幂等（例如先检查订单状态）。
+  只应在提交后执行的副作用（Redis、广播）放进 after_commit 列表，事件提交成功后依次执行。
+
+处理函数用 @outbox_handler(topic) 注册，签名 async (db, payload, after_commit) -> None，
+不要自行提交。事件记为 dead 时若该 topic 用 @outbox_dead_handler(topic) 注册了死信处理函数
+（签名相同），它与标记 dead 在同一事务里执行，用来做补偿（如取消订单、退回库存）。
+"""
+import asyncio
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.models.outbox import OutboxEvent
+
+AfterCommit = list[Callable[[], Awaitable[Any]]]
+Handler = Callable[[AsyncSession, dict, AfterCommit], Awaitable[None]]
+
+_handlers: dict[str, Handler] = {}
+_dead_handlers: dict[str, Handler] = {}
+_wakeup = asyncio.Event()
+
+
+def outbox_handler(topic: str):
+    """注册某个 topic 的处理函数（每个 topic 一个）"""
+    def register(fn: Handler) -> Handler:
+        _handlers[topic] = fn
+        return fn
+    return register
+
+
+def outbox_dead_handler(topic: str):
+    """注册某个 topic 的死信处理函数：事件不再重试时调用一次"""
+    def register(fn: Handler) -> Handler:
+        _dead_handlers[topic] = fn
+        return fn
+    return register
+
+
+def enqueue(db: AsyncSession, topic: str, payload: dict) -> None:
+    """在调用方的事务里写入一条事件；不提交。提交后可调用 notify() 让本进程的 worker 立即处理"""
+    db.add(OutboxEvent(topic=topic, payload=payload))
+
+
+def notify() -> None:
+    _wakeup.set()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def claim(db: AsyncSession, limit: int, lease: int) -> list:
+    """认领最多 limit 个到期事件，返回 (event_id, topic, payload, attempts)"""
+    now = _now()
+    ids = (
+        select(OutboxEvent.event_id)
+        .where(OutboxEvent.status == "pending", OutboxEvent.available_at <= now)
+        .order_by(OutboxEvent.event_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.event_id.in_(ids.scalar_subquery()))
+        .values(available_at=now + timedelta(seconds=lease), attempts=OutboxEvent.attempts + 1)
+        .returning(OutboxEvent.event_id, OutboxEvent.topic, OutboxEvent.payload, OutboxEvent.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    await db.commit()
+    return sorted(rows, key=lambda r: r.event_id)
+
+
+class OutboxWorkerPool:
+    def __init__(self, workers: int, batch: int, poll_interval: float, lease: int, max_attempts: int):
+        self.workers = workers
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+
+    async def process(self, session_factory, event) -> bool:
+        """在独立事务里处理一个事件；返回是否成功"""
+        handler = _handlers.get(event.topic)
+        after_commit: AfterCommit = []
+        try:
+            if handler is None:
+                raise LookupError(f"没有注册 topic={event.topic} 的处理函数")
+            async with session_factory() as db:
+                current = (await db.execute(
+                    select(OutboxEvent.status, OutboxEvent.attempts)
+                    .where(OutboxEvent.event_id == event.event_id)
+                    .with_for_update()
+                )).first()
+                if current is None or current.status != "pending" or current.attempts != event.attempts:
+                    return True             # 已被处理，或租约过期后由别的 worker 重新认领
+                await handler(db, event.payload, after_commit)
+                await db.execute(
+                    update(OutboxEvent).where(OutboxEvent.event_id == event.event_id)
+                    .values(status="done", processed_at=_now(), last_error=None)
+                )
+                await db.commit()
+        except Exception as e:
+            await self._fail(session_factory, event, e)
+            return False
+        await self._after_commit(event, after_commit)
+        return True
+
+    @staticmethod
+    async def _after_commit(event, callbacks: AfterCommit) -> None:
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.warning(f"[outbox] 事件 {event.event_id} 提交后的回调失败：{e}")
+
+    async def _fail(self, session_factory, event, error: Exception) -> None:
+        dead = event.attempts >= self.max_attempts
+        delay = min(2 ** event.attempts, 300)
+        logger.warning(
+            f"[outbox] 事件 {event.event_id}（{event.topic}）第 {event.attempts} 次处理失败"
+            f"{'，不再重试' if dead else f'，{delay}s 后重试'}：{error}"
+        )
+        mark = (
+            update(OutboxEvent).where(OutboxEvent.event_id == event.event_id)
+            .values(
+                status="dead" if dead else "pending",
+                available_at=_now() + timedelta(seconds=delay),
+                last_error="".join(traceback.format_exception_only(error))[-2000:],
+            )
+        )
+        dead_handler = _dead_handlers.get(event.topic) if dead else None
+        after_commit: AfterCommit = []
+        if dead_handler is not None:
+            try:
+                async with session_factory() as db:
+                    await dead_handler(db, event.payload, after_commit)
+                    await db.execute(mark)
+                    await db.commit()
+                await self._after_commit(event, after_commit)
+                return
+            except Exception as e:
+                logger.error(f"[outbox] 事件 {event.event_id}（{event.topic}）的死信处理失败，需人工补偿：{e}")
+        async with session_factory() as db:
+            await db.execute(mark)
+            await db.commit()
+
+    async def _worker(self, session_factory) -> None:
+        while True:
+            try:
+                async with session_factory() as db:
+                    events = await claim(db, self.batch, self.lease)
+                for event in events:
+                    await self.process(session_factory, event)
+                if len(events) < self.batch:
+                    _wakeup.clear()
+                    try:
+                        await asyncio.wait_for(_wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[outbox] 认领事件失败，稍后重试：{e}")
+                await asyncio.sleep(self.poll_interval * 10)
+
+    async def _purge(self, session_factory) -> None:
+        """定期删除已完成且超过保留期的事件"""
+        while True:
+            await asyncio.sleep(3600)
+            try:
+                async with session_factory() as db:
+                    cutoff = _now() - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+                    await db.execute(
+                        delete(OutboxEvent).where(OutboxEvent.status == "done", OutboxEvent.processed_at < cutoff)
+                    )
+                    await db.commit()
+            except Exception as e:
+                logger.warning(f"[outbox] 清理已完成事件失败：{e}")
+
+    async def run(self, session_factory) -> None:
+        """常驻任务：启动 workers 个 worker 和一个清理任务"""
+        tasks = [asyncio.create_task(self._worker(session_factory)) for _ in range(self.workers)]
+        tasks.append(asyncio.create_task(self._purge(session_factory)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+
+outbox_workers = OutboxWorkerPool(
+    workers=settings.OUTBOX_WORKERS,
+    batch=settings.OUTBOX_BATCH,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    lease=settings.OUTBOX_LEASE,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+)
@@ -0,0 +1,337 @@
+# mcpshop/services/product_index.py
+"""
+商品语义向量索引：本地 Qwen 嵌入模型 + ChromaDB 持久化存储（settings.VECTOR_INDEX_DIR）。
+
+- 每个商品一条向量，id 为 sku，文档为「名称 + 描述」；
+- metadata 里记录文档的 content_hash，同步时只重新嵌入内容变化的商品，
+  价格等元数据变化只更新 metadata，不重新跑模型；
+- 商品增 / 改 / 删后由 crud.product 调用 schedule_upsert / schedule_remove
+  在后台增量同步，请求本身不等待嵌入；
+- reconcile() 做全量对账（补漏、清理已删除商品），见 scripts/sync_product_index.py。
+
+写入只有一个所有者：
+- 配置了 VECTOR_INDEX_URL 时连 Chroma 服务（HttpClient），由服务端串行化写入，各进程直接写；
+- 否则是 VECTOR_INDEX_DIR 下的本地库，PersistentClient 不支持多进程同时写：
+  进程对 writer.lock 加 flock，抢到的进程（run_index_writer）负责写入；
+  其它 worker、MCP 进程把写入任务推到 Redis 列表 product_index:queue，由它批量执行。
+  写锁随进程退出释放，其它进程每 WRITER_RETRY 秒尝试接管。
+
+ChromaDB 客户端是同步的，统一放到线程里执行；嵌入走常驻进程的异步接口 aembed，
+都不会阻塞事件循环。
+"""
+import asyncio
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable
+from urllib.parse import urlparse
+
+import chromadb
+from chromadb.config import Settings as ChromaSettings
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.config import settings
+from mcpshop.core.embedding import get_embedding_function
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.models.product import Product
+
+try:
+    import fcntl
+except ImportError:         # Windows：没有 flock，本地库模式下每个进程都自认写入者（只应单进程部署）
+    fcntl = None
+
+QUEUE_KEY = "product_index:queue"
+WRITER_RETRY = 30           # 没抢到写锁的进程隔多久再试（秒）
+_QUEUE_BATCH = 100          # 写入进程每次从队列取的任务数
+_QUEUE_POLL = 0.5           # 队列为空时的轮询间隔（秒）
+
+
+class SemanticIndexError(RuntimeError):
+    """向量索引或嵌入模型不可用"""
+
+
+def product_document(name: str | None, description: str | None) -> str:
+    return f"{name or ''}\n{description or ''}".strip()
+
+
+def content_hash(document: str) -> str:
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+
+def index_row(prod: Product) -> dict[str, Any]:
+    """提取写入索引所需的字段（与 ORM 会话解耦，可安全交给后台任务）"""
+    return {
+        "sku": prod.sku,
+        "name": prod.name,
+        "description": prod.description,
+        "price_cents": prod.price_cents,
+        "category_id": prod.category_id,
+    }
+
+
+class ProductVectorIndex:
+    def __init__(self, persist_dir: str, server_url: str | None = None, collection_name: str = "products"):
+        self.persist_dir = persist_dir
+        self.server_url = server_url
+        self.collection_name = collection_name
+        self._collection = None
+        self._write_lock = asyncio.Lock()
+        self._owner_fd: int | None = None
+
+    @property
+    def shared(self) -> bool:
+        """连的是 Chroma 服务：任何进程都可以直接写"""
+        return bool(self.server_url)
+
+    @property
+    def can_write(self) -> bool:
+        return self.shared or self._owner_fd is not None
+
+    def try_own_writes(self) -> bool:
+        """本地库模式：尝试成为写入者（对 writer.lock 加 flock，持有到进程退出），返回是否可写"""
+        if self.can_write:
+            return True
+        Path(self.persist_dir).mkdir(parents=True, exist_ok=True)
+        fd = os.open(Path(self.persist_dir) / "writer.lock", os.O_WRONLY | os.O_CREAT)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+        self._owner_fd = fd
+        return True
+
+    def _get_collection(self):
+        if self._collection is None:
+            if self.shared:
+                url = urlparse(self.server_url)
+                client = chromadb.HttpClient(
+                    host=url.hostname,
+                    port=url.port or (443 if url.scheme == "https" else 8000),
+                    ssl=url.scheme == "https",
+                    settings=ChromaSettings(anonymized_telemetry=False),
+                )
+            else:
+                client = chromadb.PersistentClient(
+                    path=self.persist_dir,
+                    settings=ChromaSettings(anonymized_telemetry=False),
+                )
+            # 向量由我们自己算好传入，collection 不绑定嵌入函数
+            self._collection = client.get_or_create_collection(
+                self.collection_name,
+                metadata={"hnsw:space": "cosine"},
+                embedding_function=None,
+            )
+        return self._collection
+
+    async def _embed(self, texts: list[str]) -> list[list[float]]:
+        return await get_embedding_function().aembed(texts)
+
+    async def upsert(self, rows: list[dict[str, Any]]) -> int:
+        """
+        写入 / 更新一批商品（字段见 index_row），返回实际重新嵌入的条数。
+        content_hash 未变的商品只刷新 metadata。只能在可写的进程里调用（can_write），其它进程用 schedule_upsert。
+        """
+        if not rows:
+            return 0
+        async with self._write_lock:
+            col = await asyncio.to_thread(self._get_collection)
+            ids = [r["sku"] for r in rows]
+            existing = await asyncio.to_thread(col.get, ids=ids, include=["metadatas"])
+            old_hashes = {
+                sku: (meta or {}).get("content_hash")
+                for sku, meta in zip(existing["ids"], existing["metadatas"])
+            }
+
+            docs, metas, changed = {}, {}, []
+            for r in rows:
+                doc = product_document(r["name"], r["description"])
+                docs[r["sku"]] = doc
+                metas[r["sku"]] = {
+                    "content_hash": content_hash(doc),
+                    "price_cents": r["price_cents"],
+                    "category_id": r["category_id"] if r["category_id"] is not None else -1,
+                }
+                if old_hashes.get(r["sku"]) != metas[r["sku"]]["content_hash"]:
+                    changed.append(r["sku"])
+
+            if changed:
+                vectors = await self._embed([docs[s] for s in changed])
+                await asyncio.to_thread(
+                    col.upsert,
+                    ids=changed,
+                    embeddings=vectors,
+                    documents=[docs[s] for s in changed],
+                    metadatas=[metas[s] for s in changed],
+                )
+            changed_set = set(changed)
+            unchanged = [s for s in ids if s not in changed_set]
+            if unchanged:
+                await asyncio.to_thread(
+                    col.update, ids=unchanged, metadatas=[metas[s] for s in unchanged]
+                )
+            return len(changed)
+
+    async def remove(self, skus: Iterable[str]) -> None:
+        skus = list(skus)
+        if not skus:
+            return
+        async with self._write_lock:
+            col = await asyncio.to_thread(self._get_collection)
+            await asyncio.to_thread(col.delete, ids=skus)
+
+    async def query(
+        self, text: str, top_k: int = 10, max_price_cents: int | None = None
+    ) -> list[tuple[str, float]]:
+        """语义检索，返回按相似度降序的 [(sku, score)]，score = 1 - 余弦距离"""
+        try:
+            col = await asyncio.to_thread(self._get_collection)
+            vector = (await self._embed([text]))[0]
+            where = {"price_cents": {"$lte": max_price_cents}} if max_price_cents is not None else None
+            result = await asyncio.to_thread(
+                col.query,
+                query_embeddings=[vector],
+                n_results=top_k,
+                where=where,
+                include=["distances"],
+            )
+        except Exception as e:
+            raise SemanticIndexError(f"语义检索不可用：{e}") from e
+        return [
+            (sku, 1.0 - distance)
+            for sku, distance in zip(result["ids"][0], result["distances"][0])
+        ]
+
+    async def reconcile(self, db: AsyncSession, batch_size: int = 256) -> dict[str, int]:
+        """
+        全量对账：按 sku 分批扫描商品表写入索引（未变化的不会重新嵌入），
+        并删除索引中已不存在于数据库的商品。只能在可写的进程里调用，其它进程用 schedule_reconcile。
+        """
+        seen: set[str] = set()
+        embedded = 0
+        last_sku = ""
+        while True:
+            result = await db.execute(
+                select(
+                    Product.sku, Product.name, Product.description,
+                    Product.price_cents, Product.category_id,
+                )
+                .where(Product.sku > last_sku)
+                .order_by(Product.sku)
+                .limit(batch_size)
+            )
+            rows = [dict(r) for r in result.mappings()]
+            if not rows:
+                break
+            embedded += await self.upsert(rows)
+            seen.update(r["sku"] for r in rows)
+            last_sku = rows[-1]["sku"]
+
+        col = await asyncio.to_thread(self._get_collection)
+        indexed = await asyncio.to_thread(col.get, include=[])
+        stale = [sku for sku in indexed["ids"] if sku not in seen]
+        await self.remove(stale)
+        return {"scanned": len(seen), "embedded": embedded, "removed": len(stale)}
+
+
+product_index = ProductVectorIndex(settings.VECTOR_INDEX_DIR, settings.VECTOR_INDEX_URL)
+
+# —— 后台增量同步：持有任务引用，避免被 GC；失败只记日志，由 reconcile 兜底 ——
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coro, what: str) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+
+    def _done(t: asyncio.Task) -> None:
+        _background_tasks.discard(t)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning(f"[product_index] {what} 失败：{t.exception()}")
+
+    task.add_done_callback(_done)
+
+
+async def _enqueue(job: dict[str, Any], what: str) -> None:
+    try:
+        await get_redis().lpush(QUEUE_KEY, json.dumps(job, ensure_ascii=False))
+    except REDIS_ERRORS as e:
+        logger.warning(f"[product_index] {what} 未能交给写入进程（由对账兜底）：{e}")
+
+
+def schedule_upsert(rows: list[dict[str, Any]]) -> None:
+    what = f"同步 {[r['sku'] for r in rows][:5]}"
+    if product_index.can_write:
+        _spawn(product_index.upsert(rows), what)
+    else:
+        _spawn(_enqueue({"op": "upsert", "rows": rows}, what), what)
+
+
+def schedule_remove(skus: list[str]) -> None:
+    what = f"删除 {skus[:5]}"
+    if product_index.can_write:
+        _spawn(product_index.remove(skus), what)
+    else:
+        _spawn(_enqueue({"op": "remove", "skus": skus}, what), what)
+
+
+async def schedule_reconcile() -> None:
+    """请写入进程做一次全量对账（本进程不可写时用）"""
+    await get_redis().lpush(QUEUE_KEY, json.dumps({"op": "reconcile"}))
+
+
+async def _apply_jobs(session_factory, jobs: list[dict[str, Any]]) -> None:
+    """按顺序执行一批任务；相邻的 upsert 合并成一次写入，同一 sku 以后到的为准"""
+    pending: dict[str, dict[str, Any]] = {}
+
+    async def flush() -> None:
+        if pending:
+            await product_index.upsert(list(pending.values()))
+            pending.clear()
+
+    for job in jobs:
+        if job["op"] == "upsert":
+            pending.update({r["sku"]: r for r in job["rows"]})
+            continue
+        await flush()
+        if job["op"] == "remove":
+            await product_index.remove(job["skus"])
+        elif job["op"] == "reconcile":
+            async with session_factory() as db:
+                stats = await product_index.reconcile(db)
+            logger.info(f"[product_index] 对账完成：{stats}")
+    await flush()
+
+
+async def run_index_writer(session_factory) -> None:
+    """
+    常驻任务（本地库模式）：抢写锁，抢到后消费 product_index:queue。
+    没抢到的进程每 WRITER_RETRY 秒重试，写入进程退出后由其它进程接管。配置了 Chroma 服务时直接返回。
+    """
+    if product_index.shared:
+        return
+    while not product_index.try_own_writes():
+        await asyncio.sleep(WRITER_RETRY)
+    logger.info("[product_index] 本进程负责写入本地语义索引")
+    while True:
+        try:
+            raw = await get_redis().rpop(QUEUE_KEY, _QUEUE_BATCH)
+        except asyncio.CancelledError:
+            raise
+        except REDIS_ERRORS as e:
+            logger.warning(f"[product_index] 读取写入队列失败，稍后重试：{e}")
+            await asyncio.sleep(WRITER_RETRY)
+            continue
+        if not raw:
+            await asyncio.sleep(_QUEUE_POLL)
+            continue
+        try:
+            await _apply_jobs(session_factory, [json.loads(item) for item in raw])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[product_index] 写入语义索引失败（由对账兜底）：{e}")
@@ -0,0 +1,320 @@
+# mcpshop/services/suggest.py
+"""
+商品名前缀联想（搜索框边输边提示），全部在进程内存里完成，不查数据库。
+
+- 每个商品生成若干联想 key：规范化后的商品名、从每个词首开始的后缀（输入「跑鞋」
+  能命中「Nike 防水跑鞋」），装了 pypinyin 时再加对应的全拼和首字母（「paoxie」「px」）；
+- 所有 "key\\0sku" 存在一个有序数组里，前缀查询就是两次二分；
+- 短前缀（≤ SHORT_PREFIX 个字符）命中的商品很多，预先算好按热度排序的 top-k，
+  查询直接取；更长的前缀只扫描二分出的区间（上限 MAX_SCAN 条）再按热度取 top-k，
+  结果放进一个小 LRU，索引有任何变动时整体清空；
+- 热度 = 累计销量（读销售统计表 sales_sku_daily，不扫订单明细），
+  定期全量刷新（SUGGEST_REFRESH_INTERVAL），顺便兜底漏掉的增量；
+- 商品增 / 改 / 删后由 crud.product 调用 publish_upsert / publish_remove：
+  本 worker 立即生效，并通过 Redis pub/sub 通知其它 worker；
+  一次超过 BULK_REBUILD 个商品（批量导入）时不逐条插入有序数组（每条 O(n)），
+  改为唤醒后台任务全量重建，连续的几批合并成一次。
+"""
+import asyncio
+import json
+import re
+import uuid
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from functools import lru_cache
+from heapq import nlargest
+from typing import Any, Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from mcpshop.core.config import settings
+from mcpshop.core.logger import logger
+from mcpshop.core.redis import REDIS_ERRORS, get_redis
+from mcpshop.core.search import token_starts
+from mcpshop.models.product import Product
+from mcpshop.models.sales import SalesSkuDaily
+
+try:  # 可选依赖：拼音联想
+    from pypinyin import lazy_pinyin
+except ImportError:  # pragma: no cover - 未安装时只支持原文前缀
+    lazy_pinyin = None
+
+SHORT_PREFIX = 2
+MAX_SCAN = 2000
+MAX_STARTS = 4                  # 每个商品最多从几个词首建 key（控制内存）
+BULK_REBUILD = 100              # 一次变更超过这么多商品时改为全量重建
+REBUILD_DEBOUNCE = 1.0          # 被唤醒后等这么久再重建，合并连续的批量变更
+RESULT_CACHE_SIZE = 4096
+CHANNEL = "suggest:update"
+_SEP = "\0"
+_END = "\U0010ffff"
+_SPACE_RE = re.compile(r"\s+")
+_CJK_RE = re.compile("[\u3400-\u9fff\uf900-\ufaff]")
+_ORIGIN = uuid.uuid4().hex      # 本 worker 的标识：收到自己发出的广播时跳过
+
+
+def normalize(text: str) -> str:
+    """全角转半角、小写、压缩空白"""
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text).lower()).strip()
+
+
+@lru_cache(maxsize=None)
+def _char_pinyin(ch: str) -> tuple[str, str]:
+    """单字的 (全拼, 首字母)；非汉字原样保留，空白丢弃。逐字查表并缓存，比整句转换快一个数量级"""
+    if ch.isspace():
+        return "", ""
+    if not _CJK_RE.match(ch):
+        return ch, ch
+    syllable = lazy_pinyin(ch, errors="ignore")
+    syllable = syllable[0] if syllable else ""
+    return syllable, syllable[:1]
+
+
+def suggest_keys(name: str) -> list[str]:
+    """
+    商品名的联想 key：原文及从各词首开始的后缀；装了 pypinyin 时再加上
+    对应的全拼和首字母（多音字按单字默认读音）。
+    """
+    norm = normalize(name)
+    if not norm:
+        return []
+    starts = ([0] + [i for i in token_starts(norm) if i > 0])[:MAX_STARTS]
+    keys = [norm[i:] for i in starts]
+    if lazy_pinyin is not None:
+        syllables = [_char_pinyin(ch) for ch in norm]
+        cjk_starts = [i for i in starts if i == 0 or _CJK_RE.match(norm[i])]
+        keys += ["".join(full for full, _ in syllables[i:]) for i in cjk_starts]
+        keys += ["".join(first for _, first in syllables[i:]) for i in cjk_starts]
+    return [k for k in dict.fromkeys(keys) if k]
+
+
+class SuggestIndex:
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self._sorted: list[str] = []                              # "key\0sku"，有序
+        self._entries: dict[str, tuple[str, tuple, list[str]]] = {}   # sku → (name, score, keys)
+        self._top: dict[str, list[str]] = {}                      # 短前缀 → 按热度排序的 sku
+        self._rebuilding = False
+        self._pending: list[tuple[str, Any]] = []                 # 重建期间到达的增量，重建后重放
+        self._results: OrderedDict[tuple[str, int], list[str]] = OrderedDict()   # 长前缀查询结果
+        self._wake = asyncio.Event()                              # 批量变更后唤醒 run_refresher 提前重建
+
+    # ------------------------------------------------------------ #
+    # 查询
+    # ------------------------------------------------------------ #
+    def query(self, prefix: str, limit: int = 10) -> list[dict[str, str]]:
+        p = normalize(prefix)
+        if not p:
+            return []
+        if len(p) <= SHORT_PREFIX:
+            skus = self._top.get(p, [])[:limit]
+        else:
+            skus = self._results.get((p, limit))
+            if skus is None:
+                candidates = self._scan(p, MAX_SCAN)
+                skus = nlargest(limit, candidates, key=lambda s: self._entries[s][1])
+                self._results[(p, limit)] = skus
+                if len(self._results) > RESULT_CACHE_SIZE:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end((p, limit))
+        return [{"sku": sku, "name": self._entries[sku][0]} for sku in skus]
+
+    def _scan(self, prefix: str, cap: int | None = None) -> set[str]:
+        lo = bisect_left(self._sorted, prefix)
+        hi = bisect_left(self._sorted, prefix + _END, lo)
+        if cap is not None:
+            hi = min(hi, lo + cap)
+        return {item.rsplit(_SEP, 1)[1] for item in self._sorted[lo:hi]}
+
+    # ------------------------------------------------------------ #
+    # 增量更新（均在事件循环线程上执行）
+    # ------------------------------------------------------------ #
+    def upsert(self, sku: str, name: str) -> None:
+        if self._rebuilding:
+            self._pending.append(("upsert", (sku, name)))
+        old = self._entries.get(sku)
+        if old is not None and old[0] == name:
+            return
+        sold = old[1][0] if old is not None else 0
+        self._remove_entry(sku)
+        self._add_entry(sku, name, (sold, -len(name)))
+
+    def remove(self, sku: str) -> None:
+        if self._rebuilding:
+            self._pending.append(("remove", sku))
+        self._remove_entry(sku)
+
+    def _add_entry(self, sku: str, name: str, score: tuple) -> None:
+        self._results.clear()
+        keys = suggest_keys(name)
+        self._entries[sku] = (name, score, keys)
+        for key in keys:
+            insort(self._sorted, f"{key}{_SEP}{sku}")
+        for p in self._short_prefixes(keys):
+            top = self._top.setdefault(p, [])
+            if len(top) >= self.top_k and self._entries[top[-1]][1] >= score:
+                continue
+            top.append(sku)
+            top.sort(key=lambda s: self._entries[s][1], reverse=True)
+            del top[self.top_k:]
+
+    def _remove_entry(self, sku: str) -> None:
+        entry = self._entries.get(sku)
+        if entry is None:
+            return
+        self._results.clear()
+        _, _, keys = entry
+        for key in keys:
+            item = f"{key}{_SEP}{sku}"
+            i = bisect_left(self._sorted, item)
+            if i < len(self._sorted) and self._sorted[i] == item:
+                del self._sorted[i]
+        del self._entries[sku]
+        for p in self._short_prefixes(keys):
+            if sku in self._top.get(p, ()):
+                # 被删的商品在 top-k 里：重新扫描该前缀补位。短前缀的区间可能很大，
+                # 只扫前 MAX_SCAN 条，补上的未必是真正的 top-k，下次全量重建时校正
+                self._top[p] = nlargest(
+                    self.top_k, self._scan(p, MAX_SCAN), key=lambda s: self._entries[s][1]
+                )
+
+    @staticmethod
+    def _short_prefixes(keys: Iterable[str]) -> set[str]:
+        return {k[:n] for k in keys for n in range(1, min(SHORT_PREFIX, len(k)) + 1)}
+
+    # ------------------------------------------------------------ #
+    # 全量重建
+    # ------------------------------------------------------------ #
+    async def rebuild(self, db: AsyncSession) -> int:
+        """按最新销量全量重建；名称未变的商品复用已生成的 key。返回商品数"""
+        # 查询前就开始记录增量：查询期间提交的改名 / 删除也要在新索引上重放
+        self._rebuilding, self._pending = True, []
+        try:
+            sales = (
+                select(SalesSkuDaily.sku, func.sum(SalesSkuDaily.units).label("units"))
+                .group_by(SalesSkuDaily.sku)
+                .subquery()
+            )
+            result = await db.execute(
+                select(Product.sku, Product.name, func.coalesce(sales.c.units, 0))
+                .outerjoin(sales, sales.c.sku == Product.sku)
+            )
+            rows = result.all()
+            built = await asyncio.to_thread(self._build, rows, dict(self._entries))
+        except BaseException:
+            self._pending = []              # 增量已作用在当前索引上
+            raise
+        finally:
+            self._rebuilding = False
+        self._sorted, self._entries, self._top = built
+        self._results.clear()
+        for op, arg in self._pending:
+            self.upsert(*arg) if op == "upsert" else self.remove(arg)
+        self._pending = []
+        return len(self._entries)
+
+    def _build(self, rows, previous: dict) -> tuple[list, dict, dict]:
+        entries: dict[str, tuple[str, tuple, list[str]]] = {}
+        for sku, name, sold in rows:
+            old = previous.get(sku)
+            keys = old[2] if old is not None and old[0] == name else suggest_keys(name)
+            entries[sku] = (name, (int(sold), -len(name)), keys)
+        ordered = sorted(
+            (f"{key}{_SEP}{sku}" for sku, (_, _, keys) in entries.items() for key in keys)
+        )
+        top: dict[str, list[str]] = {}
+        for sku in sorted(entries, key=lambda s: entries[s][1], reverse=True):
+            for p in self._short_prefixes(entries[sku][2]):
+                bucket = top.setdefault(p, [])
+                if len(bucket) < self.top_k:
+                    bucket.append(sku)
+        return ordered, entries, top
+
+    def schedule_rebuild(self) -> None:
+        """批量变更后调用：唤醒 run_refresher 尽快全量重建（多次调用合并成一次）"""
+        self._wake.set()
+
+    async def run_refresher(self, session_factory) -> None:
+        """常驻任务：定期全量重建（刷新热度），批量变更时提前重建，并订阅其它 worker 的增量"""
+        listener = asyncio.create_task(self._listen())
+        try:
+            while True:
+                self._wake.clear()
+                try:
+                    async with session_factory() as db:
+                        count = await self.rebuild(db)
+                    logger.info(f"[suggest] 联想索引已重建：{count} 个商品")
+                except Exception as e:
+                    logger.warning(f"[suggest] 联想索引重建失败：{e}")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), settings.SUGGEST_REFRESH_INTERVAL)
+                    await asyncio.sleep(REBUILD_DEBOUNCE)
+                except TimeoutError:
+                    pass
+        finally:
+            listener.cancel()
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        self._apply(json.loads(message["data"]))
+                    except Exception as e:
+                        # 一条坏消息不能拖垮订阅；漏掉的变更由定期重建补齐
+                        logger.warning(f"[suggest] 忽略无法处理的增量消息 {message['data']!r:.200}：{e!r}")
+            except asyncio.CancelledError:
+                raise
+            except REDIS_ERRORS as e:
+                logger.warning(f"[suggest] 增量订阅断开，稍后重连（期间的变更由定期重建补齐）：{e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.aclose()
+
+    def _apply(self, msg: dict) -> None:
+        if msg.get("origin") == _ORIGIN:
+            return                          # 发布时本 worker 已经生效
+        if len(msg.get("upsert", ())) + len(msg.get("remove", ())) > BULK_REBUILD:
+            self.schedule_rebuild()
+            return
+        for sku, name in msg.get("upsert", []):
+            self.upsert(sku, name)
+        for sku in msg.get("remove", []):
+            self.remove(sku)
+
+
+suggest_index = SuggestIndex()
+
+
+async def _publish(msg: dict) -> None:
+    msg["origin"] = _ORIGIN
+    try:
+        await get_redis().publish(CHANNEL, json.dumps(msg, ensure_ascii=False))
+    except REDIS_ERRORS as e:
+        logger.warning(f"[suggest] 增量广播失败，其它 worker 将在下次重建时同步：{e}")
+
+
+async def publish_upsert(items: list[tuple[str, str]]) -> None:
+    """商品新增 / 改名后调用（数据已提交）：items 为 [(sku, name)]"""
+    if len(items) > BULK_REBUILD:
+        suggest_index.schedule_rebuild()
+    else:
+        for sku, name in items:
+            suggest_index.upsert(sku, name)
+    await _publish({"upsert": items})
+
+
+async def publish_remove(skus: list[str]) -> None:
+    if len(skus) > BULK_REBUILD:
+        suggest_index.schedule_rebuild()
+    else:
+        for sku in skus:
+            suggest_index.remove(sku)
+    await _publish({"remove": skus})
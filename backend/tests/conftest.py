@@ -0,0 +1,84 @@
+# backend/tests/conftest.py
+"""
+测试公共设置：临时 SQLite（aiosqlite）库 + fakeredis，不依赖外部 PostgreSQL / Redis。
+环境变量必须在导入 mcpshop 之前设置；依赖见仓库根目录 requirements-dev.txt。
+
+每个测试用 run(coro) 执行异步代码：每次在新的事件循环里跑，结束后释放连接池，
+Redis 客户端换成连同一个 FakeServer 的新实例（数据保留，连接不跨事件循环复用）。
+TestClient 在自己的事件循环里运行应用，进入前调用 fake_redis() 换好客户端即可。
+"""
+import asyncio
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="mcpshop-test-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_TMP, 'test.db')}"
+os.environ["VECTOR_INDEX_DIR"] = os.path.join(_TMP, "chroma")    # 语义索引不落到仓库目录
+os.environ["EMBEDDING_CACHE_DIR"] = ""
+os.environ["DATABASE_REPLICA_URLS"] = "[]"
+os.environ["REDIS_URL"] = "redis://127.0.0.1:1/0"      # 不会真正连接：测试里换成 fakeredis
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+os.environ.setdefault("MCP_API_URL", "http://127.0.0.1:8001/mcp")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import fakeredis
+import pytest
+from sqlalchemy import BigInteger
+from sqlalchemy.ext.compiler import compiles
+
+import mcpshop.core.redis as redis_module
+import mcpshop.models  # noqa: F401  注册全部模型
+from mcpshop.crud.product import product_cache
+from mcpshop.crud.user import user_cache
+from mcpshop.db.base import Base
+from mcpshop.db.session import engine
+from mcpshop.services.cart_store import cart_store
+from mcpshop.services.inventory import hot_inventory
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_as_integer(type_, compiler, **kw):
+    # SQLite 只有 INTEGER PRIMARY KEY 会自增
+    return "INTEGER"
+
+
+@pytest.fixture(autouse=True)
+def fake_redis():
+    """每个测试一个空的 FakeServer；返回的函数换上连它的新客户端"""
+    server = fakeredis.FakeServer()
+
+    def connect() -> fakeredis.FakeAsyncRedis:
+        redis_module._client = fakeredis.FakeAsyncRedis(server=server)
+        for store in (cart_store, hot_inventory):
+            store._scripts.clear()          # Lua 脚本绑定在注册时的客户端上
+        return redis_module._client
+
+    connect()
+    for cache in (product_cache, user_cache):
+        cache._local.clear()
+        cache._redis_retry_at = 0.0
+    yield connect
+    redis_module._client = None
+
+
+@pytest.fixture
+def run(fake_redis):
+    def _run(coro):
+        async def main():
+            fake_redis()
+            try:
+                return await coro
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+    return _run
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+    asyncio.run(reset())
@@ -0,0 +1,103 @@
+# backend/tests/test_cart_flush.py
+"""
+购物车写回：已删除商品 / 用户的行不能卡住其他用户的写回；
+Redis 降级期间直接写进 cart_items 的修改，恢复后不能被 Redis 里的旧购物车覆盖。
+"""
+from sqlalchemy import delete, select
+
+from mcpshop.core.redis import get_redis
+from mcpshop.crud.product import delete_product, get_product_by_sku
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.cart_item import CartItem
+from mcpshop.models.product import Product
+from mcpshop.models.user import User
+from mcpshop.services.cart_store import DIRTY_KEY, cart_store
+
+
+async def _seed() -> None:
+    async with AsyncSessionLocal() as db:
+        for name in ("alice", "bob"):
+            db.add(User(username=name, email=f"{name}@example.com", password_hash="!", is_admin=False))
+        for sku in ("A", "B"):
+            db.add(Product(sku=sku, name=f"商品{sku}", price_cents=100, stock=10))
+        await db.commit()
+
+
+async def _db_cart() -> dict[tuple[int, str], int]:
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(select(CartItem.user_id, CartItem.sku, CartItem.quantity))
+        return {(r.user_id, r.sku): r.quantity for r in rows}
+
+
+async def _orphans() -> dict:
+    await _seed()
+    async with AsyncSessionLocal() as db:
+        await cart_store.incr(db, 1, "A", 1, 10)
+        await cart_store.incr(db, 1, "B", 2, 10)
+        await cart_store.incr(db, 2, "B", 1, 10)
+    async with AsyncSessionLocal() as db:
+        # 另一个进程删掉了商品 B（没来得及清理 Redis 购物车）
+        await db.execute(delete(Product).where(Product.sku == "B"))
+        await db.commit()
+    flushed = await cart_store.flush(AsyncSessionLocal)
+    async with AsyncSessionLocal() as db:
+        alice = await cart_store.get_lines(db, 1)
+    return {
+        "flushed": flushed,
+        "db": await _db_cart(),
+        "alice": [line["sku"] for line in alice],
+        "dirty": await get_redis().scard(DIRTY_KEY),
+    }
+
+
+def test_flush_drops_lines_of_deleted_products(run):
+    result = run(_orphans())
+    assert result["flushed"] == 2
+    assert result["db"] == {(1, "A"): 1}
+    assert result["alice"] == ["A"]
+    assert result["dirty"] == 0
+
+
+async def _delete_product() -> dict:
+    await _seed()
+    async with AsyncSessionLocal() as db:
+        await cart_store.incr(db, 1, "B", 2, 10)
+    await cart_store.flush(AsyncSessionLocal)
+    async with AsyncSessionLocal() as db:
+        await delete_product(db, await get_product_by_sku(db, "B"))
+    async with AsyncSessionLocal() as db:
+        lines = await cart_store.get_lines(db, 1)
+    return {"lines": lines, "db": await _db_cart()}
+
+
+def test_delete_product_removes_it_from_carts(run):
+    result = run(_delete_product())
+    assert result["lines"] == []
+    assert result["db"] == {}
+
+
+async def _outage() -> dict:
+    await _seed()
+    async with AsyncSessionLocal() as db:
+        await cart_store.incr(db, 1, "A", 1, 10)
+    await cart_store.flush(AsyncSessionLocal)
+
+    server = get_redis().connection_pool.connection_kwargs["server"]
+    server.connected = False
+    async with AsyncSessionLocal() as db:
+        during = await cart_store.incr(db, 1, "A", 2, 10)
+    server.connected = True
+    # Redis 恢复：旧购物车（数量 1）仍在 Redis 里
+    async with AsyncSessionLocal() as db:
+        lines = await cart_store.get_lines(db, 1)
+        after = await cart_store.incr(db, 1, "A", 1, 10)
+    await cart_store.flush(AsyncSessionLocal)
+    return {"during": during, "lines": lines, "after": after, "db": await _db_cart()}
+
+
+def test_writes_during_redis_outage_survive_recovery(run):
+    result = run(_outage())
+    assert result["during"] == 3
+    assert [(l["sku"], l["quantity"]) for l in result["lines"]] == [("A", 3)]
+    assert result["after"] == 4
+    assert result["db"] == {(1, "A"): 4}
@@ -0,0 +1,58 @@
+# backend/tests/test_category_facets.py
+"""分类聚合：并发修改时增量按锁住的最新行计算；存在但没有商品的分类返回全 0"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from mcpshop.api import categories
+from mcpshop.crud.product import get_product_by_sku, update_product
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.category import Category
+from mcpshop.models.category_facet import CategoryFacet
+from mcpshop.models.product import Product
+
+
+async def _stale_update() -> dict:
+    async with AsyncSessionLocal() as db:
+        db.add(Category(category_id=1, name="书籍"))
+        db.add(Product(sku="A", name="A", category_id=1, price_cents=100, stock=10))
+        await db.commit()
+    async with AsyncSessionLocal() as slow, AsyncSessionLocal() as fast:
+        stale = await get_product_by_sku(slow, "A")          # 读到 stock=10 后暂停
+        await update_product(fast, await get_product_by_sku(fast, "A"), {"stock": 0})
+        await update_product(slow, stale, {"price_cents": 6000})      # 换到下一个价格桶
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(select(CategoryFacet).where(CategoryFacet.category_id == 1))
+        return {r.bucket: (r.product_count, r.in_stock_count) for r in rows.scalars()}
+
+
+def test_update_uses_locked_row_for_facet_deltas(run):
+    # 旧桶减掉的、新桶加上的都是无货（stock=0），不是过时实例里的 stock=10
+    assert run(_stale_update()) == {0: (0, 0), 1: (1, 0)}
+
+
+async def _seed_empty_category() -> None:
+    async with AsyncSessionLocal() as db:
+        db.add(Category(category_id=1, name="书籍"))
+        await db.commit()
+
+
+@pytest.fixture
+def client(fake_redis):
+    app = FastAPI()
+    app.include_router(categories.router)
+    with TestClient(app) as c:
+        fake_redis()
+        yield c
+
+
+def test_empty_category_has_zero_counts(run, client):
+    run(_seed_empty_category())
+    resp = client.get("/api/categories/1/facets")
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "category_id": 1, "name": "书籍", "product_count": 0, "in_stock_count": 0, "price_histogram": [],
+    }
+    assert client.get("/api/categories/0/facets").json()["product_count"] == 0
+    assert client.get("/api/categories/2/facets").status_code == 404
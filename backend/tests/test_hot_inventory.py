@@ -0,0 +1,118 @@
+# backend/tests/test_hot_inventory.py
+"""热点库存：预扣不超卖；过期预扣归还库存；写回失败放回 pending，崩溃留下的 inflight 下一轮重放"""
+import pytest
+from sqlalchemy import select
+
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.product import Product
+from mcpshop.services import inventory as inventory_module
+from mcpshop.services.inventory import _DRAIN_LUA, INFLIGHT_KEY, PENDING_KEY, hot_inventory
+
+
+async def _seed(stock: int) -> None:
+    async with AsyncSessionLocal() as db:
+        db.add(Product(sku="HOT", name="hot", price_cents=100, stock=stock))
+        db.add(Product(sku="COLD", name="cold", price_cents=100, stock=stock))
+        await db.commit()
+        await hot_inventory.enable(db, "HOT")
+
+
+async def _db_stock() -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Product.stock).where(Product.sku == "HOT"))).scalar()
+
+
+async def _hot() -> dict:
+    return {k: v for k, v in (await hot_inventory.status())[0].items() if k != "sku"}
+
+
+async def _buy(qty: int) -> None:
+    resv = await hot_inventory.reserve({"HOT": qty, "COLD": 1})
+    await hot_inventory.confirm(resv)
+
+
+async def _drain() -> int:
+    async with AsyncSessionLocal() as db:
+        return await hot_inventory._drain_once(db)
+
+
+async def _oversell() -> dict:
+    await _seed(3)
+    first = await hot_inventory.reserve({"HOT": 2, "COLD": 5})
+    with pytest.raises(ValueError):
+        await hot_inventory.reserve({"HOT": 2, "COLD": 1})      # 只剩 1 件：整单拒绝，什么都不扣
+    last = await hot_inventory.reserve({"HOT": 1})
+    with pytest.raises(ValueError):
+        await hot_inventory.reserve({"HOT": 1})
+    cold = await hot_inventory.reserve({"COLD": 1})             # 非热点商品不经过 Redis
+    return {"first": first.items, "last": last.items, "cold": cold, "hot": await _hot()}
+
+
+def test_reserve_rejects_oversell(run):
+    result = run(_oversell())
+    assert result["first"] == {"HOT": 2}
+    assert result["last"] == {"HOT": 1}
+    assert result["cold"] is None
+    assert result["hot"] == {"available": 0, "reserved": 3, "pending": 0}
+
+
+async def _expire(monkeypatch) -> dict:
+    await _seed(5)
+    monkeypatch.setattr(hot_inventory, "reservation_ttl", -1)    # 预扣一生成就已过期
+    stale = await hot_inventory.reserve({"HOT": 4})
+    held = await _hot()
+    released = await hot_inventory.release_expired()
+    with pytest.raises(ValueError):
+        await hot_inventory.confirm(stale)                       # 库存已归还，不能再确认
+    return {"held": held, "released": released, "hot": await _hot(), "db": await _db_stock()}
+
+
+def test_expired_reservation_is_released(run, monkeypatch):
+    result = run(_expire(monkeypatch))
+    assert result["held"] == {"available": 1, "reserved": 4, "pending": 0}
+    assert result["released"] == 1
+    assert result["hot"] == {"available": 5, "reserved": 0, "pending": 0}
+    assert result["db"] == 5
+
+
+async def _drain_failure(monkeypatch) -> dict:
+    await _seed(10)
+    await _buy(2)
+
+    async def broken(*args):
+        raise RuntimeError("db exploded")
+
+    monkeypatch.setattr(inventory_module, "decrement_stock", broken)
+    with pytest.raises(RuntimeError):
+        await _drain()
+    monkeypatch.undo()
+    failed = {"hot": await _hot(), "db": await _db_stock()}
+
+    await _drain()
+    return {"failed": failed, "hot": await _hot(), "db": await _db_stock()}
+
+
+def test_failed_drain_goes_back_to_pending(run, monkeypatch):
+    result = run(_drain_failure(monkeypatch))
+    assert result["failed"] == {"hot": {"available": 8, "reserved": 0, "pending": 2}, "db": 10}
+    assert result["hot"] == {"available": 8, "reserved": 0, "pending": 0}
+    assert result["db"] == 8
+
+
+async def _replay() -> dict:
+    await _seed(10)
+    await _buy(2)
+    # 写回进程把 pending 改名为 inflight 后崩溃：数据库没扣，inflight 留在 Redis
+    await hot_inventory._script("drain", _DRAIN_LUA)(keys=[PENDING_KEY, INFLIGHT_KEY])
+    await _buy(3)
+    await _drain()                          # 先重放上一轮的 inflight
+    replayed = await _db_stock()
+    await _drain()
+    return {"replayed": replayed, "hot": await _hot(), "db": await _db_stock()}
+
+
+def test_inflight_left_by_crash_is_replayed(run):
+    result = run(_replay())
+    assert result["replayed"] == 8
+    assert result["db"] == 5
+    assert result["hot"] == {"available": 5, "reserved": 0, "pending": 0}
@@ -0,0 +1,84 @@
+# backend/tests/test_order_ws.py
+"""WebSocket /api/orders/{order_id}/ws：查询参数 / 子协议传 token，推送到终态后关闭"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from starlette.websockets import WebSocketDisconnect
+
+from mcpshop.api import orders
+from mcpshop.core.security import create_access_token
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.order import Order, OrderStatus
+from mcpshop.models.user import User
+from mcpshop.services.order_pipeline import publish_status
+
+
+async def _seed(status: OrderStatus) -> int:
+    async with AsyncSessionLocal() as db:
+        # is_admin 显式给值：server_default "false" 在 SQLite 里是非空字符串
+        alice = User(username="alice", email="alice@example.com", password_hash="!", is_admin=False)
+        bob = User(username="bob", email="bob@example.com", password_hash="!", is_admin=False)
+        db.add_all([alice, bob])
+        await db.flush()
+        order = Order(user_id=alice.user_id, total_cents=100, status=status)
+        db.add(order)
+        await db.commit()
+        return order.order_id
+
+
+async def _mark_paid(order_id: int) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(Order).where(Order.order_id == order_id).values(status=OrderStatus.PAID))
+        await db.commit()
+    await publish_status(order_id, OrderStatus.PAID)
+
+
+@pytest.fixture
+def client(fake_redis):
+    app = FastAPI()
+    app.include_router(orders.router)
+    fake_redis()
+    with TestClient(app) as c:
+        yield c
+
+
+def test_terminal_status_then_close(run, client):
+    order_id = run(_seed(OrderStatus.PAID))
+    token = create_access_token("alice")
+    with client.websocket_connect(f"/api/orders/{order_id}/ws?token={token}") as ws:
+        assert ws.receive_json() == {"order_id": order_id, "status": "PAID", "reason": None}
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1000
+
+
+def test_pending_until_published(run, client):
+    order_id = run(_seed(OrderStatus.PENDING))
+    token = create_access_token("alice")
+    with client.websocket_connect(f"/api/orders/{order_id}/ws", subprotocols=["bearer", token]) as ws:
+        assert ws.accepted_subprotocol == "bearer"
+        assert ws.receive_json()["status"] == "PENDING"
+        client.portal.call(_mark_paid, order_id)
+        assert ws.receive_json()["status"] == "PAID"
+
+
+@pytest.mark.parametrize("query, code", [
+    ("", 4401),
+    ("?token=not-a-jwt", 4401),
+])
+def test_rejects_missing_or_invalid_token(run, client, query, code):
+    order_id = run(_seed(OrderStatus.PAID))
+    with client.websocket_connect(f"/api/orders/{order_id}/ws{query}") as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == code
+
+
+def test_rejects_other_users_order(run, client):
+    order_id = run(_seed(OrderStatus.PAID))
+    token = create_access_token("bob")
+    with client.websocket_connect(f"/api/orders/{order_id}/ws?token={token}") as ws:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 4404
@@ -0,0 +1,69 @@
+# backend/tests/test_outbox_dead_letter.py
+"""order.placed 重试用尽进入死信：同一事务取消订单，提交后退回热点库存并广播状态"""
+import json
+
+from sqlalchemy import select
+
+import mcpshop.services.order_pipeline as order_pipeline
+from mcpshop.crud.order import submit_order
+from mcpshop.crud.product import create_product
+from mcpshop.db.session import AsyncSessionLocal, replica_router
+from mcpshop.models.order import Order, OrderStatus
+from mcpshop.models.outbox import OutboxEvent
+from mcpshop.models.user import User
+from mcpshop.schemas.product import ProductCreate
+from mcpshop.core.redis import get_redis
+from mcpshop.services.inventory import hot_inventory
+from mcpshop.services.outbox import OutboxWorkerPool, claim
+
+
+async def _place_order() -> int:
+    async with AsyncSessionLocal() as db:
+        db.add(User(user_id=1, username="alice", email="alice@example.com", password_hash="!", is_admin=False))
+        await db.commit()
+        await create_product(db, ProductCreate(sku="HOT", name="hot", price_cents=100, stock=10))
+        await create_product(db, ProductCreate(sku="COLD", name="cold", price_cents=50, stock=10))
+        await hot_inventory.enable(db, "HOT")
+        order = await submit_order(db, 1, [{"sku": "HOT", "quantity": 3}, {"sku": "COLD", "quantity": 1}])
+        return order.order_id
+
+
+async def _process_until_dead(order_id: int, monkeypatch) -> dict:
+    async def broken(*args):
+        raise RuntimeError("db exploded")
+
+    monkeypatch.setattr(order_pipeline, "allocate_order", broken)
+    monkeypatch.setattr(replica_router, "replicas", [object()])     # 配置了副本：worker 的写入要标记读己之写
+    pubsub = get_redis().pubsub()
+    await pubsub.subscribe(order_pipeline.status_channel(order_id))
+    pool = OutboxWorkerPool(workers=1, batch=10, poll_interval=0.1, lease=30, max_attempts=1)
+    async with AsyncSessionLocal() as db:
+        events = await claim(db, 10, 30)
+    assert [e.topic for e in events] == ["order.placed"]
+    assert await pool.process(AsyncSessionLocal, events[0]) is False
+
+    async with AsyncSessionLocal() as db:
+        status = (await db.execute(select(Order.status).where(Order.order_id == order_id))).scalar()
+        event_status = (await db.execute(select(OutboxEvent.status))).scalar()
+    message = None
+    for _ in range(5):                      # 第一次读到的是订阅确认（返回 None）
+        message = message or await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.2)
+    await pubsub.aclose()
+    return {
+        "order": status,
+        "event": event_status,
+        "published": json.loads(message["data"]) if message else None,
+        "hot": await hot_inventory.status(),
+        "sticky": await replica_router.is_sticky("alice"),
+    }
+
+
+def test_dead_order_placed_cancels_and_restocks(run, monkeypatch):
+    order_id = run(_place_order())
+    result = run(_process_until_dead(order_id, monkeypatch))
+    assert result["order"] == OrderStatus.CANCELLED
+    assert result["event"] == "dead"
+    assert result["published"]["status"] == "CANCELLED"
+    # 受理时在 Redis 预扣的 3 件退回：可售恢复 10，待写回为 0
+    assert result["sticky"] is True
+    assert result["hot"] == [{"sku": "HOT", "available": 10, "reserved": 0, "pending": 0}]
@@ -0,0 +1,60 @@
+# backend/tests/test_product_index_writer.py
+"""本地语义索引只由抢到写锁的进程写：其它进程把任务推到 Redis 队列，写入进程按顺序批量执行"""
+import asyncio
+import json
+
+from mcpshop.core.redis import get_redis
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.services import product_index as index_module
+from mcpshop.services.product_index import (
+    QUEUE_KEY, ProductVectorIndex, run_index_writer, schedule_remove, schedule_upsert,
+)
+
+
+def _row(sku: str, name: str) -> dict:
+    return {"sku": sku, "name": name, "description": None, "price_cents": 100, "category_id": None}
+
+
+class _Recorder(ProductVectorIndex):
+    """不连 Chroma：只记录写入调用"""
+    def __init__(self, persist_dir: str):
+        super().__init__(persist_dir)
+        self.calls: list[tuple] = []
+
+    async def upsert(self, rows):
+        self.calls.append(("upsert", sorted((r["sku"], r["name"]) for r in rows)))
+        return len(rows)
+
+    async def remove(self, skus):
+        self.calls.append(("remove", list(skus)))
+
+
+async def _flow(tmp_path, monkeypatch) -> dict:
+    worker = _Recorder(str(tmp_path))           # 另一个 worker：没抢到写锁
+    owner = _Recorder(str(tmp_path))
+    assert owner.try_own_writes()
+    assert not worker.try_own_writes()
+
+    monkeypatch.setattr(index_module, "product_index", worker)
+    schedule_upsert([_row("A", "旧名")])
+    schedule_upsert([_row("A", "新名"), _row("B", "b")])
+    schedule_remove(["C"])
+    await asyncio.gather(*index_module._background_tasks)
+    queued = [json.loads(j)["op"] for j in reversed(await get_redis().lrange(QUEUE_KEY, 0, -1))]
+
+    monkeypatch.setattr(index_module, "product_index", owner)
+    writer = asyncio.create_task(run_index_writer(AsyncSessionLocal))
+    for _ in range(50):
+        if not await get_redis().llen(QUEUE_KEY):
+            break
+        await asyncio.sleep(0.05)
+    writer.cancel()
+    return {"queued": queued, "worker": worker.calls, "owner": owner.calls}
+
+
+def test_non_owner_queues_writes_for_owner(run, tmp_path, monkeypatch):
+    result = run(_flow(tmp_path, monkeypatch))
+    assert result["queued"] == ["upsert", "upsert", "remove"]
+    assert result["worker"] == []
+    # 相邻的 upsert 合并，同一 sku 以后到的为准；remove 在其后
+    assert result["owner"] == [("upsert", [("A", "新名"), ("B", "b")]), ("remove", ["C"])]
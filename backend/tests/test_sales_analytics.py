@@ -0,0 +1,87 @@
+# backend/tests/test_sales_analytics.py
+"""
+销售统计：成交后由 order.paid 在独立事务里累加，重复投递不重复计；
+全量重算把旧版下单留下的 PENDING 订单（没有 order.placed 事件）迁为 PAID 并计入。
+"""
+from sqlalchemy import select
+
+from mcpshop.crud.analytics import rebuild_sales_analytics
+from mcpshop.crud.order import submit_order
+from mcpshop.crud.product import create_product
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.order import Order, OrderStatus
+from mcpshop.models.order_item import OrderItem
+from mcpshop.models.sales import CustomerValue, SalesDaily, SalesSkuDaily
+from mcpshop.models.user import User
+from mcpshop.schemas.product import ProductCreate
+from mcpshop.services import order_pipeline  # noqa: F401  注册 order.placed / order.paid
+from mcpshop.services.outbox import OutboxWorkerPool, claim
+
+
+async def _seed() -> None:
+    async with AsyncSessionLocal() as db:
+        db.add(User(user_id=1, username="alice", email="alice@example.com", password_hash="!", is_admin=False))
+        await db.commit()
+        await create_product(db, ProductCreate(sku="A", name="a", price_cents=100, stock=10))
+        await create_product(db, ProductCreate(sku="B", name="b", price_cents=50, stock=10))
+
+
+async def _sales() -> dict:
+    async with AsyncSessionLocal() as db:
+        daily = (await db.execute(select(SalesDaily.orders, SalesDaily.revenue_cents))).all()
+        skus = (await db.execute(select(SalesSkuDaily.sku, SalesSkuDaily.units).order_by(SalesSkuDaily.sku))).all()
+        customer = (await db.execute(select(CustomerValue.orders))).scalar()
+    return {"daily": [tuple(r) for r in daily], "skus": [tuple(r) for r in skus], "customer": customer}
+
+
+async def _pipeline() -> dict:
+    await _seed()
+    async with AsyncSessionLocal() as db:
+        await submit_order(db, 1, [{"sku": "B", "quantity": 1}, {"sku": "A", "quantity": 2}])
+    pool = OutboxWorkerPool(workers=1, batch=10, poll_interval=0.1, lease=30, max_attempts=3)
+    async with AsyncSessionLocal() as db:
+        placed = await claim(db, 10, 30)
+    assert await pool.process(AsyncSessionLocal, placed[0])
+    after_placed = await _sales()                   # 扣库存的事务不碰统计表
+    async with AsyncSessionLocal() as db:
+        paid = await claim(db, 10, 30)
+    assert [e.topic for e in paid] == ["order.paid"]
+    assert await pool.process(AsyncSessionLocal, paid[0])
+    assert await pool.process(AsyncSessionLocal, paid[0])      # 重复投递：事件已 done，跳过
+    return {"after_placed": after_placed, "after_paid": await _sales()}
+
+
+def test_sale_recorded_by_order_paid_once(run):
+    result = run(_pipeline())
+    assert result["after_placed"] == {"daily": [], "skus": [], "customer": None}
+    assert result["after_paid"] == {"daily": [(1, 250)], "skus": [("A", 2), ("B", 1)], "customer": 1}
+
+
+async def _legacy() -> dict:
+    await _seed()
+    async with AsyncSessionLocal() as db:
+        # 旧版 create_order：扣了库存、写了明细，但状态停在默认的 PENDING，也没有事件
+        legacy = Order(user_id=1, total_cents=200)
+        db.add(legacy)
+        await db.flush()
+        db.add(OrderItem(order_id=legacy.order_id, sku="A", quantity=2, unit_price=100))
+        await db.commit()
+        # 新流程刚受理、还没处理的订单
+        pending = await submit_order(db, 1, [{"sku": "B", "quantity": 1}])
+    async with AsyncSessionLocal() as db:
+        counts = await rebuild_sales_analytics(db)
+        statuses = dict((await db.execute(select(Order.order_id, Order.status))).all())
+    return {
+        "counts": counts,
+        "legacy": statuses[legacy.order_id],
+        "pending": statuses[pending.order_id],
+        "sales": await _sales(),
+    }
+
+
+def test_rebuild_promotes_legacy_pending_orders(run):
+    result = run(_legacy())
+    assert result["counts"]["legacy_orders"] == 1
+    assert result["legacy"] == OrderStatus.PAID
+    assert result["pending"] == OrderStatus.PENDING
+    assert result["sales"] == {"daily": [(1, 200)], "skus": [("A", 2)], "customer": 1}
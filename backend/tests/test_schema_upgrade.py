@@ -0,0 +1,31 @@
+# backend/tests/test_schema_upgrade.py
+"""旧库启动：create_all 跳过已存在的 products，create_schema 补上后加的 search_text 列并回填"""
+from sqlalchemy import inspect, text
+
+from mcpshop.core.config import settings
+from mcpshop.crud.product import rebuild_search_text
+from mcpshop.db.partitions import create_schema
+from mcpshop.db.session import AsyncSessionLocal, engine
+
+
+async def _upgrade() -> dict:
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE products DROP COLUMN search_text"))     # 回到加列之前的表结构
+        await conn.execute(text(
+            "INSERT INTO products (sku, name, price_cents, stock) VALUES ('A', '跑鞋', 100, 1)"
+        ))
+    async with engine.begin() as conn:
+        await create_schema(conn, settings.ORDER_PARTITION_PREMAKE)
+        await create_schema(conn, settings.ORDER_PARTITION_PREMAKE)      # 再次启动：什么都不做
+        columns = await conn.run_sync(lambda c: [col["name"] for col in inspect(c).get_columns("products")])
+    async with AsyncSessionLocal() as db:
+        filled = await rebuild_search_text(db)
+        search_text = (await db.execute(text("SELECT search_text FROM products"))).scalar()
+    return {"columns": columns, "filled": filled, "search_text": search_text}
+
+
+def test_create_schema_adds_search_text_to_existing_products(run):
+    result = run(_upgrade())
+    assert "search_text" in result["columns"]
+    assert result["filled"] == 1
+    assert "跑鞋" in result["search_text"]
@@ -0,0 +1,58 @@
+# backend/tests/test_suggest_rebuild.py
+"""联想索引全量重建：热度取自 sales_sku_daily；查询期间到达的增量在新索引上重放"""
+import asyncio
+from datetime import date
+
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.product import Product
+from mcpshop.models.sales import SalesSkuDaily
+from mcpshop.services.suggest import SuggestIndex
+
+
+class _SlowSession:
+    """查询返回前暂停，模拟重建读库期间别的请求改了商品名"""
+    def __init__(self, db, loaded: asyncio.Event, release: asyncio.Event):
+        self._db, self._loaded, self._release = db, loaded, release
+
+    async def execute(self, *args, **kwargs):
+        result = await self._db.execute(*args, **kwargs)
+        self._loaded.set()
+        await self._release.wait()
+        return result
+
+
+async def _rebuild() -> dict:
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            Product(sku="A", name="跑鞋 A", price_cents=100, stock=1),
+            Product(sku="B", name="跑鞋 B", price_cents=100, stock=1),
+            Product(sku="C", name="旧名", price_cents=100, stock=1),
+        ])
+        db.add_all([
+            SalesSkuDaily(day=date(2026, 1, 1), sku="B", orders=1, units=3, revenue_cents=300),
+            SalesSkuDaily(day=date(2026, 1, 2), sku="B", orders=1, units=2, revenue_cents=200),
+            SalesSkuDaily(day=date(2026, 1, 2), sku="A", orders=1, units=1, revenue_cents=100),
+        ])
+        await db.commit()
+    index = SuggestIndex()
+    loaded, release = asyncio.Event(), asyncio.Event()
+    async with AsyncSessionLocal() as db:
+        task = asyncio.create_task(index.rebuild(_SlowSession(db, loaded, release)))
+        await loaded.wait()
+        index.upsert("C", "新名")           # 读库之后、换上新索引之前提交的改名
+        release.set()
+        count = await task
+    return {
+        "count": count,
+        "run": [s["sku"] for s in index.query("跑鞋")],
+        "renamed": [s["sku"] for s in index.query("新名")],
+        "old": index.query("旧名"),
+    }
+
+
+def test_rebuild_uses_sales_and_replays_concurrent_updates(run):
+    result = run(_rebuild())
+    assert result["count"] == 3
+    assert result["run"] == ["B", "A"]          # B 累计 5 件，A 1 件
+    assert result["renamed"] == ["C"]
+    assert result["old"] == []
@@ -0,0 +1,92 @@
+# backend/tests/test_user_cache_race.py
+"""
+撤销管理员 / 删除用户时，另一个 worker 正在回源：回源读到的旧记录不能写回缓存。
+另一个 worker 用同 namespace 的第二个 TwoTierCache 模拟（进程内层独立，共享 Redis）。
+"""
+import asyncio
+
+from sqlalchemy import select
+
+from mcpshop.core.cache import TwoTierCache
+from mcpshop.crud.user import (
+    _SNAPSHOT_COLUMNS, delete_user, get_user_by_username, get_user_cached, set_user_admin, user_cache,
+)
+from mcpshop.core.redis import get_redis
+from mcpshop.db.session import AsyncSessionLocal
+from mcpshop.models.user import User
+
+
+def _other_worker() -> TwoTierCache:
+    return TwoTierCache(
+        user_cache.namespace, ttl=user_cache.ttl, local_ttl=user_cache.local_ttl, maxsize=user_cache.maxsize,
+    )
+
+
+async def _seed_admin() -> None:
+    async with AsyncSessionLocal() as db:
+        db.add(User(username="alice", email="alice@example.com", password_hash="!", is_admin=True))
+        await db.commit()
+
+
+async def _race(change) -> tuple[TwoTierCache, dict | None]:
+    """另一个 worker 回源读到旧记录后暂停；此时本 worker 执行 change 并提交、失效；然后放行回源"""
+    other = _other_worker()
+    loaded, release = asyncio.Event(), asyncio.Event()
+
+    async def slow_load():
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(select(*_SNAPSHOT_COLUMNS).where(User.username == "alice"))).mappings().first()
+        loaded.set()
+        await release.wait()
+        return dict(row) if row else None
+
+    pending = asyncio.create_task(other.get_or_load("alice", slow_load))
+    await loaded.wait()
+    async with AsyncSessionLocal() as db:
+        await change(db, await get_user_by_username(db, "alice"))
+    release.set()
+    stale = await pending
+    return other, stale
+
+
+async def _demote() -> dict:
+    await _seed_admin()
+    other, stale = await _race(lambda db, user: set_user_admin(db, user, False))
+    async with AsyncSessionLocal() as db:
+        fresh = await get_user_cached(db, "alice")
+        reloaded = await other.get_or_load("alice", lambda: asyncio.sleep(0, {"is_admin": False}))
+    return {
+        "stale": stale["is_admin"],
+        "stale_fills": other.stats.stale_fills,
+        "fresh": fresh.is_admin,
+        "other_reloaded": reloaded["is_admin"],
+    }
+
+
+async def _delete() -> dict:
+    await _seed_admin()
+    other, stale = await _race(delete_user)
+    async with AsyncSessionLocal() as db:
+        fresh = await get_user_cached(db, "alice")
+    return {
+        "stale": stale is not None,
+        "stale_fills": other.stats.stale_fills,
+        "fresh": fresh,
+        "redis": await get_redis().get(user_cache._redis_key("alice")),
+    }
+
+
+def test_demote_while_load_in_flight(run):
+    result = run(_demote())
+    assert result["stale"] is True                  # 回源那一刻读到的是旧记录，只返回给当次调用
+    assert result["stale_fills"] == 1               # 没有写回缓存
+    assert result["fresh"] is False                 # 之后的鉴权拿到的是撤销后的记录
+    assert result["other_reloaded"] is False        # 另一个 worker 的进程内层也没有留下旧值
+
+
+def test_delete_while_load_in_flight(run):
+    result = run(_delete())
+    assert result["stale"] is True
+    assert result["stale_fills"] == 1
+    assert result["fresh"] is None
+    assert result["redis"] == b"null"               # 只有负缓存，被删用户不会「复活」